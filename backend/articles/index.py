@@ -1,230 +1,844 @@
+import base64
+import gzip
+import io
 import json
 import os
+import re
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
+from datetime import datetime
+from types import MappingProxyType
+from typing import Dict, Any, Callable, Hashable, Iterator, List, Mapping, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
 import psycopg2
-from typing import Dict, Any
+import psycopg2.extras
+import psycopg2.pool
+
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', '4'))
+DB_POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', '30'))
+ARTICLES_PAGE_SIZE = int(os.environ.get('ARTICLES_PAGE_SIZE', '50'))
+ARTICLES_PAGE_MAX = 200
+SEARCH_OFFSET_MAX = 10000
+SEARCH_HEADLINE_OPTIONS = 'MaxFragments=2, MaxWords=30, MinWords=10, StartSel=<mark>, StopSel=</mark>'
+ARTICLES_CACHE_TTL = float(os.environ.get('ARTICLES_CACHE_TTL', '5'))
+ARTICLES_CACHE_SIZE = int(os.environ.get('ARTICLES_CACHE_SIZE', '256'))
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '5'))
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '0') == '1'
+REQUEST_LOG = os.environ.get('REQUEST_LOG', '0') == '1'
+READ_LSN_WAIT = float(os.environ.get('READ_LSN_WAIT', '0.1'))
+READ_LSN_POLL = 0.01
+READ_CONNECT_TIMEOUT = int(os.environ.get('READ_CONNECT_TIMEOUT', '2'))
+REPLICA_RETRY_AFTER = float(os.environ.get('REPLICA_RETRY_AFTER', '30'))
+LSN_PATTERN = re.compile(r'^[0-9A-F]{1,8}/[0-9A-F]{1,8}$', re.IGNORECASE)
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', '1000'))
+IMPORT_BATCH_MAX = 10000
+IMPORT_ERRORS_MAX = 100
+DELETE_BATCH_MAX = 1000
+CONTENT_KEY_PATTERN = re.compile(r'files/[0-9a-f]{2}/[0-9a-f]{64}\.\w+$')
+IMAGE_KEY_PATTERN = re.compile(r'images/[0-9a-f]{2}/[0-9a-f]{64}\.[a-z0-9]+')
+ARTICLE_COLUMNS = ('title', 'excerpt', 'content', 'author', 'category', 'file_url', 'file_name', 'file_type')
+CONTENT_COLUMN = ARTICLE_COLUMNS.index('content')
+ALLOWED_METHODS = ('GET', 'POST', 'DELETE', 'OPTIONS')
+WRITE_METHODS = ('POST', 'DELETE')
+
+# Шаблоны заголовков собираются один раз на экземпляр; ответы получают свою копию
+JSON_HEADERS = MappingProxyType({
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*'
+})
+PREFLIGHT_HEADERS = MappingProxyType({
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': ', '.join(ALLOWED_METHODS),
+    'Access-Control-Allow-Headers': 'Content-Type, If-None-Match, X-Min-LSN',
+    'Access-Control-Max-Age': '86400'
+})
+NOT_MODIFIED_HEADERS = MappingProxyType({
+    'Cache-Control': 'no-cache',
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Expose-Headers': 'ETag'
+})
+CACHEABLE_HEADERS = MappingProxyType({
+    **JSON_HEADERS,
+    'Cache-Control': 'no-cache',
+    'Access-Control-Expose-Headers': 'ETag, X-Cache'
+})
+
+class TTLCache:
+    """Ограниченный LRU-кеш с TTL, живущий в тёплом экземпляре функции"""
+    
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._entries: 'OrderedDict[Hashable, Tuple[float, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.max_entries <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> None:
+        with self._lock:
+            stale = [key for key in self._entries if predicate(key)]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }
+
+response_cache = TTLCache(ARTICLES_CACHE_SIZE, ARTICLES_CACHE_TTL)
+
+class RequestTimer:
+    """
+    Разбивка времени запроса по фазам: отрезок от предыдущей отметки lap() записывается
+    под именем фазы. Выключенный таймер ничего не замеряет, ошибки запоминаются всегда.
+    """
+    
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self.route = ''
+        self.fields: Dict[str, Any] = {}
+        self.phases: Dict[str, float] = {}
+        self.error: Optional[str] = None
+        self._started = self._last = time.perf_counter() if enabled else 0.0
+    
+    def lap(self, phase: str) -> None:
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + (now - self._last) * 1000
+        self._last = now
+    
+    def fail(self, error: Exception) -> None:
+        """Вызывается из except: в ответ уходит только текст ошибки, трассировка попадает в лог"""
+        self.error = f'{type(error).__name__}: {error}'
+        self.fields['traceback'] = traceback.format_exc()
+    
+    def finish(self, context: Any, response: Dict[str, Any]) -> Dict[str, Any]:
+        """Добавляет Server-Timing и пишет в stdout одну JSON-строку о запросе"""
+        if not self.enabled and self.error is None:
+            return response
+        self.lap('respond')
+        total = (self._last - self._started) * 1000
+        if SERVER_TIMING:
+            timing = ', '.join(f'{name};dur={ms:.1f}' for name, ms in self.phases.items())
+            response = {**response, 'headers': {
+                **response['headers'],
+                'Server-Timing': f'{timing}, total;dur={total:.1f}' if timing else f'total;dur={total:.1f}',
+                'Timing-Allow-Origin': '*'
+            }}
+        if REQUEST_LOG or self.error is not None:
+            body = response.get('body') or ''
+            print(json.dumps({
+                'request_id': getattr(context, 'request_id', None),
+                'route': self.route,
+                'status': response['statusCode'],
+                'bytes_out': len(body) if response.get('isBase64Encoded') else len(body.encode('utf-8')),
+                **({'duration_ms': round(total, 2), 'phases': {name: round(ms, 2) for name, ms in self.phases.items()}} if self.enabled else {}),
+                **({'error': self.error} if self.error is not None else {}),
+                **self.fields
+            }, ensure_ascii=False), flush=True)
+        return response
+
+_pools: Dict[str, psycopg2.pool.ThreadedConnectionPool] = {}
+_last_used: Dict[int, float] = {}
+_replica_down_until = 0.0
+
+def get_pool(role: str = 'primary') -> psycopg2.pool.ThreadedConnectionPool:
+    """Пул соединений на роль, переживающий тёплые вызовы функции; без DATABASE_READ_URL реплика — это primary"""
+    dsn = os.environ.get('DATABASE_READ_URL') if role == 'replica' else None
+    if not dsn:
+        role, dsn = 'primary', os.environ.get('DATABASE_URL')
+    pool = _pools.get(role)
+    if pool is None or pool.closed:
+        # Недоступная реплика не должна держать GET дольше READ_CONNECT_TIMEOUT
+        options = {'connect_timeout': READ_CONNECT_TIMEOUT} if role == 'replica' else {}
+        pool = _pools[role] = psycopg2.pool.ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, dsn, **options)
+    return pool
+
+def is_connection_healthy(conn: Any) -> bool:
+    """Проверяет соединение перед повторным использованием; пингует только долго простаивавшие"""
+    if conn.closed:
+        return False
+    idle = time.monotonic() - _last_used.get(id(conn), 0.0)
+    if idle < DB_POOL_PING_AFTER:
+        return True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+@contextmanager
+def db_connection(role: str = 'primary') -> Iterator[Any]:
+    """Выдаёт соединение из пула и возвращает его обратно на любом пути выхода"""
+    pool = get_pool(role)
+    conn = pool.getconn()
+    if not is_connection_healthy(conn):
+        _last_used.pop(id(conn), None)
+        pool.putconn(conn, close=True)
+        conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        discard = bool(conn.closed)
+        if not discard:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        if discard:
+            _last_used.pop(id(conn), None)
+        else:
+            _last_used[id(conn)] = time.monotonic()
+        pool.putconn(conn, close=discard)
+
+def replica_caught_up(conn: Any, min_lsn: str) -> bool:
+    """Ждёт до READ_LSN_WAIT, пока реплика проиграет WAL до min_lsn; у не-реплики pg_last_wal_replay_lsn() — NULL"""
+    deadline = time.monotonic() + READ_LSN_WAIT
+    with conn.cursor() as cursor:
+        while True:
+            cursor.execute('SELECT pg_last_wal_replay_lsn() >= %s::pg_lsn', (min_lsn,))
+            if cursor.fetchone()[0]:
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(READ_LSN_POLL)
+
+def mark_replica_down(error: Exception, timer: RequestTimer) -> None:
+    """Реплика не отвечает: следующие REPLICA_RETRY_AFTER секунд чтения идут сразу на primary"""
+    global _replica_down_until
+    _replica_down_until = time.monotonic() + REPLICA_RETRY_AFTER
+    timer.fields['replica_error'] = f'{type(error).__name__}: {error}'
+
+@contextmanager
+def read_connection(min_lsn: Optional[str], timer: RequestTimer) -> Iterator[Any]:
+    """Соединение для GET: реплика из DATABASE_READ_URL, а клиенту с токеном X-Min-LSN — только
+    догнавшая его запись реплика, иначе primary. Недоступная реплика тоже означает primary."""
+    if os.environ.get('DATABASE_READ_URL') and time.monotonic() >= _replica_down_until:
+        with ExitStack() as stack:
+            # Ошибки соединения ловим только до yield: исключения из тела запроса не глотаются
+            try:
+                conn = stack.enter_context(db_connection('replica'))
+                usable = min_lsn is None or replica_caught_up(conn, min_lsn)
+            except (psycopg2.OperationalError, psycopg2.pool.PoolError) as e:
+                mark_replica_down(e, timer)
+                usable = False
+            if usable:
+                timer.fields['db'] = 'replica'
+                yield conn
+                return
+    timer.fields['db'] = 'primary'
+    with db_connection() as conn:
+        yield conn
+
+def attach_write_lsn(response: Dict[str, Any], timer: RequestTimer) -> Dict[str, Any]:
+    """Добавляет к успешной записи токен X-Write-LSN: позиция WAL на primary после фиксации.
+    Клиент присылает его обратно в X-Min-LSN, чтобы следующий GET увидел эту запись."""
+    if not os.environ.get('DATABASE_READ_URL') or response['statusCode'] >= 300:
+        return response
+    try:
+        with db_connection() as conn, conn.cursor() as cursor:
+            cursor.execute('SELECT pg_current_wal_lsn()::text')
+            lsn = cursor.fetchone()[0]
+    except psycopg2.Error:
+        return response
+    response['headers']['X-Write-LSN'] = lsn
+    response['headers']['Access-Control-Expose-Headers'] = 'X-Write-LSN'
+    timer.lap('lsn')
+    return response
+
+def parse_limit(value: Optional[str]) -> int:
+    """Размер страницы из query-параметра, ограниченный ARTICLES_PAGE_MAX"""
+    if value is None or value == '':
+        return ARTICLES_PAGE_SIZE
+    limit = int(value)
+    if limit < 1:
+        raise ValueError('limit must be positive')
+    return min(limit, ARTICLES_PAGE_MAX)
+
+def parse_offset(value: Optional[str]) -> int:
+    """Смещение страницы поисковой выдачи"""
+    offset = int(value or 0)
+    if offset < 0 or offset > SEARCH_OFFSET_MAX:
+        raise ValueError('offset out of range')
+    return offset
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """Непрозрачный курсор страницы по ключу (created_at, id)"""
+    raw = json.dumps([created_at.isoformat(), row_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(value: str) -> Tuple[datetime, int]:
+    """Разбирает курсор из encode_cursor; ValueError для повреждённого значения"""
+    raw = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4))
+    created_at, row_id = json.loads(raw)
+    return datetime.fromisoformat(created_at), int(row_id)
+
+def get_header(event: Dict[str, Any], name: str) -> Optional[str]:
+    """Регистронезависимое чтение заголовка запроса"""
+    lowered = name.lower()
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == lowered:
+            return value
+    return None
+
+def dumps(payload: Any) -> str:
+    """Тело JSON-ответа: orjson, если установлен, иначе стандартный json; кириллица в обоих случаях не экранируется"""
+    if orjson is not None:
+        return orjson.dumps(payload).decode('utf-8')
+    return json.dumps(payload, ensure_ascii=False)
+
+def json_response(status: int, payload: Any, headers: Mapping[str, str] = JSON_HEADERS) -> Dict[str, Any]:
+    return {
+        'statusCode': status,
+        'headers': dict(headers),
+        'body': dumps(payload),
+        'isBase64Encoded': False
+    }
+
+def rows_to_dicts(cursor: Any, rows: List[Tuple[Any, ...]], width: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Строки выборки в словари по именам столбцов из cursor.description; width отбрасывает служебные столбцы в конце"""
+    names = [column.name for column in cursor.description][:width]
+    return [dict(zip(names, row)) for row in rows]
+
+def get_table_etag(cursor: Any, table: str) -> str:
+    """Слабый ETag по счётчику изменений таблицы, который ведёт триггер в table_versions"""
+    cursor.execute('SELECT version FROM table_versions WHERE table_name = %s', (table,))
+    row = cursor.fetchone()
+    return f'W/"{table}-{row[0] if row else 0}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Слабое сравнение If-None-Match с текущим ETag"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in candidates or any(tag.removeprefix('W/') == etag.removeprefix('W/') for tag in candidates)
+
+def article_cache_key(params: Dict[str, Any]) -> Tuple[str, ...]:
+    """Ключ кеша: карточка статьи по id или страница списка по категории"""
+    if params.get('id'):
+        return ('article', str(params['id']))
+    category = params.get('category') or 'all'
+    search_query = (params.get('q') or '').strip()
+    if search_query:
+        return ('search', category, search_query, str(params.get('limit') or ''), str(params.get('offset') or ''))
+    return ('list', category, params.get('cursor') or '', str(params.get('limit') or ''))
+
+def invalidate_articles(category: Optional[str], article_id: Optional[int] = None) -> None:
+    """Сбрасывает страницы затронутой категории, общий список, поисковую выдачу и карточку статьи"""
+    def affected(key: Hashable) -> bool:
+        if key[0] == 'search':
+            return True
+        if key[0] == 'list':
+            return key[1] in ('all', category)
+        return article_id is not None and key[1] == str(article_id)
+    response_cache.invalidate(affected)
+
+def not_modified_response(etag: str) -> Dict[str, Any]:
+    return {
+        'statusCode': 304,
+        'headers': {**NOT_MODIFIED_HEADERS, 'ETag': etag},
+        'body': '',
+        'isBase64Encoded': False
+    }
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Выбирает br или gzip из Accept-Encoding; кодировки с q=0 запрещены клиентом"""
+    accepted: Dict[str, float] = {}
+    for item in (accept_encoding or '').split(','):
+        name, _, params = item.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in ('br', 'gzip'):
+        if encoding == 'br' and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get('*', 0.0)) > 0:
+            return encoding
+    return None
+
+def compress_body(body: str, encoding: str) -> str:
+    data = body.encode('utf-8')
+    if encoding == 'br':
+        compressed = brotli.compress(data, quality=BROTLI_QUALITY, mode=brotli.MODE_TEXT)
+    else:
+        compressed = gzip.compress(data, compresslevel=GZIP_LEVEL)
+    return base64.b64encode(compressed).decode('ascii')
+
+def encode_response(event: Dict[str, Any], response: Dict[str, Any], variants: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """
+    Сжимает JSON-ответ от COMPRESS_MIN_BYTES, если клиент принимает br или gzip; тело
+    уходит в base64 с Content-Encoding. variants хранит уже сжатые варианты закешированного
+    ответа, чтобы попадания в кеш не сжимали одно и то же заново.
+    """
+    body = response['body']
+    if response.get('isBase64Encoded') or len(body) < COMPRESS_MIN_BYTES:
+        return response
+    headers = {**response['headers'], 'Vary': 'Accept-Encoding'}
+    encoding = negotiate_encoding(get_header(event, 'Accept-Encoding'))
+    if not encoding:
+        return {**response, 'headers': headers}
+    encoded = variants.get(encoding) if variants is not None else None
+    if encoded is None:
+        encoded = compress_body(body, encoding)
+        if variants is not None:
+            variants[encoding] = encoded
+    headers['Content-Encoding'] = encoding
+    return {**response, 'headers': headers, 'body': encoded, 'isBase64Encoded': True}
+
+def cacheable_response(event: Dict[str, Any], etag: str, body: str, cache_status: str,
+                       variants: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """Ответ на GET: 304 при совпадении If-None-Match, иначе 200 с ETag и статусом кеша"""
+    if etag_matches(get_header(event, 'If-None-Match'), etag):
+        return not_modified_response(etag)
+    return encode_response(event, {
+        'statusCode': 200,
+        'headers': {**CACHEABLE_HEADERS, 'ETag': etag, 'X-Cache': cache_status},
+        'body': body,
+        'isBase64Encoded': False
+    }, variants)
+
+def article_values(data: Any) -> Tuple[Any, ...]:
+    """Поля новой статьи в порядке ARTICLE_COLUMNS с умолчаниями одиночного POST"""
+    if not isinstance(data, dict) or not data.get('title'):
+        raise ValueError('Название статьи обязательно')
+    values = (
+        data.get('title', ''),
+        data.get('excerpt', ''),
+        data.get('content', ''),
+        data.get('author', 'Аноним'),
+        data.get('category', 'Общее'),
+        data.get('file_url'),
+        data.get('file_name'),
+        data.get('file_type')
+    )
+    # Вложенные объекты и массивы psycopg2 не адаптирует: ProgrammingError сорвал бы весь импорт
+    for column, value in zip(ARTICLE_COLUMNS, values):
+        if value is not None and not isinstance(value, (str, int, float)):
+            raise ValueError(f'Поле {column} должно быть строкой')
+    return values
+
+def import_ndjson(conn: Any, cursor: Any, lines: Iterator[str], table: str, columns: Tuple[str, ...],
+                  to_values: Callable[[Any], Tuple[Any, ...]], batch_size: int,
+                  on_insert: Optional[Callable[[List[Tuple[Any, ...]]], None]] = None) -> Dict[str, Any]:
+    """Загружает NDJSON пачками через execute_values, фиксируя каждую пачку.
+    Если база отвергла пачку, она повторяется построчно, чтобы указать ошибочные строки.
+    on_insert получает вставленные значения внутри той же точки сохранения."""
+    started = time.perf_counter()
+    column_list = ', '.join(columns)
+    imported = 0
+    failed = 0
+    errors: List[Dict[str, Any]] = []
+    batch: List[Tuple[int, Tuple[Any, ...]]] = []
+    
+    def reject(line_number: int, message: str) -> None:
+        nonlocal failed
+        failed += 1
+        if len(errors) < IMPORT_ERRORS_MAX:
+            errors.append({'line': line_number, 'error': message})
+    
+    def flush() -> None:
+        nonlocal imported
+        if not batch:
+            return
+        cursor.execute('SAVEPOINT import_batch')
+        try:
+            psycopg2.extras.execute_values(
+                cursor, f'INSERT INTO {table} ({column_list}) VALUES %s', [values for _, values in batch], page_size=len(batch)
+            )
+            if on_insert:
+                on_insert([values for _, values in batch])
+            cursor.execute('RELEASE SAVEPOINT import_batch')
+            imported += len(batch)
+        except (psycopg2.DataError, psycopg2.IntegrityError):
+            cursor.execute('ROLLBACK TO SAVEPOINT import_batch')
+            placeholders = ', '.join(['%s'] * len(columns))
+            for line_number, values in batch:
+                cursor.execute('SAVEPOINT import_row')
+                try:
+                    cursor.execute(f'INSERT INTO {table} ({column_list}) VALUES ({placeholders})', values)
+                    if on_insert:
+                        on_insert([values])
+                    cursor.execute('RELEASE SAVEPOINT import_row')
+                    imported += 1
+                except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+                    cursor.execute('ROLLBACK TO SAVEPOINT import_row')
+                    reject(line_number, e.pgerror.strip() if e.pgerror else str(e))
+        conn.commit()
+        batch.clear()
+    
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            batch.append((line_number, to_values(json.loads(line))))
+        except json.JSONDecodeError:
+            reject(line_number, 'Некорректный JSON')
+        except ValueError as e:
+            reject(line_number, str(e))
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+    
+    elapsed = time.perf_counter() - started
+    return {
+        'imported': imported,
+        'failed': failed,
+        'errors': errors,
+        'elapsed_ms': round(elapsed * 1000, 1),
+        'rows_per_sec': round(imported / elapsed, 1) if elapsed > 0 else None
+    }
+
+def parse_ids(value: str) -> List[int]:
+    """Список id через запятую для пакетного удаления, без повторов"""
+    ids = list(dict.fromkeys(int(part) for part in value.split(',') if part.strip()))
+    if not ids or len(ids) > DELETE_BATCH_MAX:
+        raise ValueError('ids out of range')
+    return ids
+
+def image_keys(contents: List[Optional[str]]) -> List[str]:
+    """Изображения, встроенные в текст статей при разборе DOCX; по одной ссылке на статью"""
+    return [key for content in contents if content for key in set(IMAGE_KEY_PATTERN.findall(content))]
+
+def retain_images(cursor: Any, contents: List[Optional[str]]) -> None:
+    """Новые статьи берут ссылки на встроенные изображения. upload-file регистрирует их
+    в stored_objects без ссылок; неизвестные индексу ключи (чужие адреса) пропускаются"""
+    keys = image_keys(contents)
+    if not keys:
+        return
+    cursor.execute('DELETE FROM object_deletions WHERE key = ANY(%s)', (keys,))
+    cursor.execute('''
+        UPDATE stored_objects SET refcount = stored_objects.refcount + added.refs
+        FROM (SELECT key, COUNT(*) AS refs FROM unnest(%s::text[]) AS key GROUP BY key) AS added
+        WHERE stored_objects.key = added.key
+    ''', (keys,))
+
+def release_stored_objects(cursor: Any, file_urls: List[Optional[str]], contents: List[Optional[str]]) -> int:
+    """Снимает ссылки удалённых строк в stored_objects: на исходный файл и встроенные изображения.
+    Объекты, на которые больше никто не ссылается, попадают в очередь object_deletions: её пачками
+    разбирает sweeper.py функции upload-to-s3, здесь клиента S3 нет. Возвращает число поставленных в очередь"""
+    keys = [match.group(0) for match in (CONTENT_KEY_PATTERN.search(url) for url in file_urls if url) if match]
+    keys += image_keys(contents)
+    if not keys:
+        return 0
+    cursor.execute('''
+        UPDATE stored_objects SET refcount = stored_objects.refcount - released.refs
+        FROM (SELECT key, COUNT(*) AS refs FROM unnest(%s::text[]) AS key GROUP BY key) AS released
+        WHERE stored_objects.key = released.key
+        RETURNING stored_objects.key, stored_objects.refcount
+    ''', (keys,))
+    orphaned = [key for key, refcount in cursor.fetchall() if refcount <= 0]
+    if orphaned:
+        cursor.execute('DELETE FROM stored_objects WHERE key = ANY(%s)', (orphaned,))
+        cursor.execute('INSERT INTO object_deletions (key) SELECT unnest(%s::text[]) ON CONFLICT DO NOTHING', (orphaned,))
+    return len(orphaned)
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: API для работы со статьями по ассоциативной методике
-    Args: event с httpMethod (GET/POST/OPTIONS), body для POST, queryStringParameters для фильтрации
-    Returns: HTTP response со списком статей или новой статьёй
+    Args: event с httpMethod (GET/POST/OPTIONS), body для POST, queryStringParameters для фильтрации и поиска (q);
+          POST ?import=ndjson принимает по статье в строке (batch — размер пачки)
+    Returns: HTTP response со списком статей или новой статьёй; большие ответы сжимаются по Accept-Encoding;
+             SERVER_TIMING=1 добавляет заголовок Server-Timing, REQUEST_LOG=1 пишет строку лога на запрос;
+             с DATABASE_READ_URL GET читает с реплики, а запись отдаёт X-Write-LSN для X-Min-LSN следующего GET
     '''
+    timer = RequestTimer(SERVER_TIMING or REQUEST_LOG)
+    response = route_request(event, timer)
+    if event.get('httpMethod') in WRITE_METHODS:
+        response = attach_write_lsn(response, timer)
+    return timer.finish(context, response)
+
+def route_request(event: Dict[str, Any], timer: RequestTimer) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
+    timer.route = method
     
     if method == 'OPTIONS':
         return {
             'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Access-Control-Max-Age': '86400'
-            },
+            'headers': dict(PREFLIGHT_HEADERS),
             'body': '',
             'isBase64Encoded': False
         }
+    if method not in ALLOWED_METHODS:
+        return json_response(405, {'error': 'Метод не поддерживается'})
+    min_lsn = get_header(event, 'X-Min-LSN')
+    if min_lsn is not None and not LSN_PATTERN.match(min_lsn):
+        return json_response(400, {'error': 'Некорректный X-Min-LSN'})
     
-    db_url = os.environ.get('DATABASE_URL')
+    if method == 'GET':
+        params = event.get('queryStringParameters') or {}
+        if params.get('stats') == 'cache':
+            return json_response(200, {'cache': response_cache.stats()})
+        cache_key = article_cache_key(params)
+        timer.route = f'GET {cache_key[0]}'
+        # Кеш экземпляра мог наполниться с отстающей реплики, поэтому клиент с токеном записи его минует
+        cached = response_cache.get(cache_key) if min_lsn is None else None
+        timer.lap('cache')
+        timer.fields['cache'] = 'HIT' if cached else 'MISS'
+        if cached:
+            return cacheable_response(event, cached[0], cached[1], 'HIT', cached[2])
     
     try:
-        conn = psycopg2.connect(db_url)
-        cursor = conn.cursor()
-        
-        if method == 'GET':
-            params = event.get('queryStringParameters') or {}
-            category = params.get('category')
-            
-            article_id = params.get('id')
-            
-            if article_id:
-                cursor.execute('''
-                    SELECT id, title, excerpt, content, author, category,
+        with (read_connection(min_lsn, timer) if method == 'GET' else db_connection()) as conn, conn.cursor() as cursor:
+            timer.lap('connect')
+            if method == 'GET':
+                etag = get_table_etag(cursor, 'articles')
+                timer.lap('etag')
+                if etag_matches(get_header(event, 'If-None-Match'), etag):
+                    return not_modified_response(etag)
+                
+                category = params.get('category')
+                
+                article_id = params.get('id')
+                
+                if article_id:
+                    cursor.execute('''
+                        SELECT id, title, excerpt, content, author, category,
+                               TO_CHAR(created_at, 'DD Month YYYY') as date,
+                               file_url, file_name, file_type
+                        FROM articles 
+                        WHERE id = %s
+                    ''', (article_id,))
+                    timer.lap('query')
+                    found = rows_to_dicts(cursor, cursor.fetchall())
+                    timer.lap('fetch')
+                    timer.fields['rows'] = len(found)
+                    if found:
+                        body = dumps({'article': found[0]})
+                        timer.lap('serialize')
+                        variants: Dict[str, str] = {}
+                        response_cache.put(cache_key, (etag, body, variants))
+                        return cacheable_response(event, etag, body, 'MISS', variants)
+                
+                try:
+                    limit = parse_limit(params.get('limit'))
+                    page_cursor = params.get('cursor')
+                    after = decode_cursor(page_cursor) if page_cursor else None
+                    offset = parse_offset(params.get('offset'))
+                except (ValueError, TypeError):
+                    return json_response(400, {'error': 'Некорректные параметры пагинации'})
+                
+                search_query = (params.get('q') or '').strip()
+                if search_query:
+                    category_filter = 'AND category = %s' if category and category != 'all' else ''
+                    search_args: List[Any] = [SEARCH_HEADLINE_OPTIONS, search_query]
+                    if category_filter:
+                        search_args.append(category)
+                    cursor.execute(f'''
+                        SELECT id, title, excerpt, author, category, date,
+                               ts_headline('russian',
+                                           left(regexp_replace(coalesce(excerpt, '') || ' ' || coalesce(content, ''), '<[^>]*>', ' ', 'g'), 200000),
+                                           query, %s) AS snippet,
+                               round(rank::numeric, 4)::float8 AS rank
+                        FROM (
+                            SELECT id, title, excerpt, content, author, category,
+                                   TO_CHAR(created_at, 'DD Month YYYY') as date,
+                                   ts_rank(search_vector, query) AS rank,
+                                   query
+                            FROM articles, websearch_to_tsquery('russian', %s) AS query
+                            WHERE search_vector @@ query {category_filter}
+                            ORDER BY rank DESC, id DESC
+                            LIMIT %s OFFSET %s
+                        ) AS hits
+                        ORDER BY hits.rank DESC, hits.id DESC
+                    ''', (*search_args, limit + 1, offset))
+                    timer.lap('query')
+                    
+                    rows = cursor.fetchall()
+                    timer.lap('fetch')
+                    next_offset = offset + limit if len(rows) > limit else None
+                    articles = rows_to_dicts(cursor, rows[:limit])
+                    timer.lap('map')
+                    timer.fields['rows'] = len(articles)
+                    
+                    body = dumps({'articles': articles, 'next_offset': next_offset})
+                    timer.lap('serialize')
+                    variants: Dict[str, str] = {}
+                    response_cache.put(article_cache_key({**params, 'id': None}), (etag, body, variants))
+                    return cacheable_response(event, etag, body, 'MISS', variants)
+                
+                conditions: List[str] = []
+                query_args: List[Any] = []
+                if category and category != 'all':
+                    conditions.append('category = %s')
+                    query_args.append(category)
+                if after:
+                    conditions.append('(created_at, id) < (%s, %s)')
+                    query_args.extend(after)
+                where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+                
+                cursor.execute(f'''
+                    SELECT id, title, excerpt, author, category,
                            TO_CHAR(created_at, 'DD Month YYYY') as date,
-                           file_url, file_name, file_type
+                           created_at
                     FROM articles 
-                    WHERE id = %s
-                ''', (article_id,))
-                row = cursor.fetchone()
-                if row:
-                    article = {
-                        'id': row[0],
-                        'title': row[1],
-                        'excerpt': row[2],
-                        'content': row[3],
-                        'author': row[4],
-                        'category': row[5],
-                        'date': row[6],
-                        'file_url': row[7],
-                        'file_name': row[8],
-                        'file_type': row[9]
-                    }
-                    cursor.close()
-                    conn.close()
-                    return {
-                        'statusCode': 200,
-                        'headers': {
-                            'Content-Type': 'application/json',
-                            'Access-Control-Allow-Origin': '*'
-                        },
-                        'body': json.dumps({'article': article}, ensure_ascii=False),
-                        'isBase64Encoded': False
-                    }
+                    {where}
+                    ORDER BY created_at DESC, id DESC
+                    LIMIT %s
+                ''', (*query_args, limit + 1))
+                timer.lap('query')
+                
+                rows = cursor.fetchall()
+                timer.lap('fetch')
+                next_cursor = None
+                if len(rows) > limit:
+                    rows = rows[:limit]
+                    next_cursor = encode_cursor(rows[-1][6], rows[-1][0])
+                
+                # created_at нужен только для курсора и в ответ не попадает
+                articles = rows_to_dicts(cursor, rows, width=-1)
+                timer.lap('map')
+                timer.fields['rows'] = len(articles)
+                
+                body = dumps({'articles': articles, 'next_cursor': next_cursor})
+                timer.lap('serialize')
+                variants: Dict[str, str] = {}
+                response_cache.put(article_cache_key({**params, 'id': None}), (etag, body, variants))
+                return cacheable_response(event, etag, body, 'MISS', variants)
             
-            if category and category != 'all':
+            elif method == 'POST':
+                params = event.get('queryStringParameters') or {}
+                if params.get('import') == 'ndjson':
+                    timer.route = 'POST import'
+                    body = event.get('body') or ''
+                    if event.get('isBase64Encoded'):
+                        body = base64.b64decode(body).decode('utf-8')
+                    timer.lap('decode')
+                    try:
+                        batch_size = min(int(params.get('batch') or IMPORT_BATCH_SIZE), IMPORT_BATCH_MAX)
+                        if batch_size < 1:
+                            raise ValueError('batch out of range')
+                    except ValueError:
+                        return json_response(400, {'error': 'Некорректный размер пачки'})
+                    
+                    report = import_ndjson(conn, cursor, io.StringIO(body), 'articles', ARTICLE_COLUMNS, article_values, batch_size,
+                                           lambda rows: retain_images(cursor, [row[CONTENT_COLUMN] for row in rows]))
+                    timer.lap('import')
+                    timer.fields['rows'] = report['imported']
+                    if report['imported']:
+                        response_cache.invalidate(lambda key: key[0] in ('list', 'search'))
+                    
+                    return json_response(200, report)
+                
+                body_data = json.loads(event.get('body', '{}'))
+                try:
+                    values = article_values(body_data)
+                except ValueError as e:
+                    return json_response(400, {'error': str(e)})
+                
                 cursor.execute('''
-                    SELECT id, title, excerpt, author, category,
-                           TO_CHAR(created_at, 'DD Month YYYY') as date
-                    FROM articles 
-                    WHERE category = %s
-                    ORDER BY created_at DESC
-                ''', (category,))
-            else:
-                cursor.execute('''
-                    SELECT id, title, excerpt, author, category,
-                           TO_CHAR(created_at, 'DD Month YYYY') as date
-                    FROM articles 
-                    ORDER BY created_at DESC
-                ''')
+                    INSERT INTO articles (title, excerpt, content, author, category, file_url, file_name, file_type) 
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s) 
+                    RETURNING id, title, excerpt, author, category, TO_CHAR(created_at, 'DD Month YYYY') as date
+                ''', values)
+                new_article = rows_to_dicts(cursor, cursor.fetchall())[0]
+                retain_images(cursor, [values[CONTENT_COLUMN]])
+                
+                conn.commit()
+                timer.lap('query')
+                invalidate_articles(new_article['category'])
+                
+                return json_response(201, {'article': new_article})
             
-            rows = cursor.fetchall()
-            articles = [
-                {
-                    'id': row[0],
-                    'title': row[1],
-                    'excerpt': row[2],
-                    'author': row[3],
-                    'category': row[4],
-                    'date': row[5]
-                }
-                for row in rows
-            ]
-            
-            cursor.close()
-            conn.close()
-            
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'articles': articles}, ensure_ascii=False),
-                'isBase64Encoded': False
-            }
-        
-        elif method == 'POST':
-            body_data = json.loads(event.get('body', '{}'))
-            title = body_data.get('title', '')
-            excerpt = body_data.get('excerpt', '')
-            content = body_data.get('content', '')
-            author = body_data.get('author', 'Аноним')
-            category = body_data.get('category', 'Общее')
-            file_url = body_data.get('file_url')
-            file_name = body_data.get('file_name')
-            file_type = body_data.get('file_type')
-            
-            if not title:
-                return {
-                    'statusCode': 400,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({'error': 'Название статьи обязательно'}, ensure_ascii=False),
-                    'isBase64Encoded': False
-                }
-            
-            cursor.execute('''
-                INSERT INTO articles (title, excerpt, content, author, category, file_url, file_name, file_type) 
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s) 
-                RETURNING id, title, excerpt, author, category, TO_CHAR(created_at, 'DD Month YYYY') as date
-            ''', (title, excerpt, content, author, category, file_url, file_name, file_type))
-            
-            conn.commit()
-            row = cursor.fetchone()
-            
-            new_article = {
-                'id': row[0],
-                'title': row[1],
-                'excerpt': row[2],
-                'author': row[3],
-                'category': row[4],
-                'date': row[5]
-            }
-            
-            cursor.close()
-            conn.close()
-            
-            return {
-                'statusCode': 201,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'article': new_article}, ensure_ascii=False),
-                'isBase64Encoded': False
-            }
-        
-        elif method == 'DELETE':
-            params = event.get('queryStringParameters') or {}
-            article_id = params.get('id')
-            
-            if not article_id:
-                return {
-                    'statusCode': 400,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({'error': 'ID статьи обязателен'}, ensure_ascii=False),
-                    'isBase64Encoded': False
-                }
-            
-            cursor.execute('DELETE FROM articles WHERE id = %s RETURNING id', (article_id,))
-            deleted = cursor.fetchone()
-            conn.commit()
-            cursor.close()
-            conn.close()
-            
-            if deleted:
-                return {
-                    'statusCode': 200,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({'success': True, 'id': deleted[0]}, ensure_ascii=False),
-                    'isBase64Encoded': False
-                }
-            else:
-                return {
-                    'statusCode': 404,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({'error': 'Статья не найдена'}, ensure_ascii=False),
-                    'isBase64Encoded': False
-                }
-        
-        else:
-            return {
-                'statusCode': 405,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'error': 'Метод не поддерживается'}, ensure_ascii=False),
-                'isBase64Encoded': False
-            }
+            elif method == 'DELETE':
+                params = event.get('queryStringParameters') or {}
+                try:
+                    ids = parse_ids(params.get('ids') or params.get('id') or '')
+                except ValueError:
+                    return json_response(400, {'error': 'ID статьи обязателен'})
+                
+                # Пачка удаляется одним запросом; файлы удалённых строк освобождаются в той же транзакции
+                cursor.execute('DELETE FROM articles WHERE id = ANY(%s) RETURNING id, category, file_url, content', (ids,))
+                deleted = cursor.fetchall()
+                queued = release_stored_objects(cursor, [row[2] for row in deleted], [row[3] for row in deleted])
+                conn.commit()
+                timer.lap('query')
+                timer.fields['rows'] = len(deleted)
+                for row in deleted:
+                    invalidate_articles(row[1], row[0])
+                
+                if 'ids' in params:
+                    deleted_ids = [row[0] for row in deleted]
+                    found = set(deleted_ids)
+                    return json_response(200, {
+                        'success': True,
+                        'ids': deleted_ids,
+                        'missing': [item for item in ids if item not in found],
+                        'objects_queued': queued
+                    })
+                
+                if deleted:
+                    return json_response(200, {'success': True, 'id': deleted[0][0]})
+                else:
+                    return json_response(404, {'error': 'Статья не найдена'})
     
+    except psycopg2.OperationalError as e:
+        if timer.fields.get('db') != 'replica':
+            timer.fail(e)
+            return json_response(500, {'error': str(e)})
+        # Реплика отвалилась посреди чтения: повторяем запрос, read_connection отдаст primary
+        mark_replica_down(e, timer)
+        return route_request(event, timer)
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': str(e)}, ensure_ascii=False),
-            'isBase64Encoded': False
-        }
\ No newline at end of file
+        timer.fail(e)
+        return json_response(500, {'error': str(e)})
\ No newline at end of file
@@ -0,0 +1,27 @@
+"""
+Выгрузка таблицы в локальный файл или stdout без HTTP-функции и её таймаута:
+    python dump.py articles --format csv --out articles.csv
+"""
+import argparse
+import json
+import sys
+
+from index import EXPORT_FORMATS, EXPORT_TABLES, export_table
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Потоковая выгрузка таблицы')
+    parser.add_argument('table', choices=sorted(EXPORT_TABLES))
+    parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='ndjson')
+    parser.add_argument('--out', default='-', help='файл для записи, "-" — stdout')
+    args = parser.parse_args()
+    
+    out = sys.stdout.buffer if args.out == '-' else open(args.out, 'wb')
+    try:
+        stats = export_table(args.table, args.format, out.write)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+    print(json.dumps(stats), file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+import csv
+import hmac
+import io
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from types import MappingProxyType
+from typing import Dict, Any, Callable, Iterator, List, Mapping, Optional, Tuple
+
+import boto3
+try:
+    import orjson
+except ImportError:
+    orjson = None
+import psycopg2
+import psycopg2.pool
+from botocore.config import Config
+
+S3_ENDPOINT = os.environ.get('S3_ENDPOINT_URL', 'https://storage.yandexcloud.net')
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', '4'))
+DB_POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', '30'))
+EXPORT_ITERSIZE = int(os.environ.get('EXPORT_ITERSIZE', '2000'))
+EXPORT_CHUNK_SIZE = 8 * 1024 * 1024
+EXPORT_URL_EXPIRES = 3600
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+# Выгрузка отдаёт таблицы целиком, поэтому только по токену; без EXPORT_TOKEN она закрыта
+EXPORT_TOKEN = os.environ.get('EXPORT_TOKEN', '')
+ALLOWED_METHODS = ('GET', 'OPTIONS')
+
+# Шаблоны заголовков собираются один раз на экземпляр; ответы получают свою копию
+JSON_HEADERS = MappingProxyType({
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*'
+})
+PREFLIGHT_HEADERS = MappingProxyType({
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': ', '.join(ALLOWED_METHODS),
+    'Access-Control-Allow-Headers': 'Content-Type, Authorization',
+    'Access-Control-Max-Age': '86400'
+})
+
+# Столбцы выгрузки по таблицам; порядок по id делает выгрузку воспроизводимой
+EXPORT_TABLES: Dict[str, Tuple[str, ...]] = {
+    'articles': ('id', 'title', 'excerpt', 'content', 'author', 'category', 'file_url', 'file_name', 'file_type', 'created_at'),
+    'materials': ('id', 'title', 'description', 'author', 'file_type', 'file_url', 'category', 'downloads', 'created_at'),
+    'messages': ('id', 'author', 'text', 'created_at'),
+}
+
+_pool: Optional[psycopg2.pool.ThreadedConnectionPool] = None
+_last_used: Dict[int, float] = {}
+
+def get_pool() -> psycopg2.pool.ThreadedConnectionPool:
+    """Пул соединений, переживающий тёплые вызовы функции"""
+    global _pool
+    if _pool is None or _pool.closed:
+        _pool = psycopg2.pool.ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, os.environ.get('DATABASE_URL'))
+    return _pool
+
+def is_connection_healthy(conn: Any) -> bool:
+    """Проверяет соединение перед повторным использованием; пингует только долго простаивавшие"""
+    if conn.closed:
+        return False
+    idle = time.monotonic() - _last_used.get(id(conn), 0.0)
+    if idle < DB_POOL_PING_AFTER:
+        return True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+@contextmanager
+def db_connection() -> Iterator[Any]:
+    """Выдаёт соединение из пула и возвращает его обратно на любом пути выхода"""
+    pool = get_pool()
+    conn = pool.getconn()
+    if not is_connection_healthy(conn):
+        _last_used.pop(id(conn), None)
+        pool.putconn(conn, close=True)
+        conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        discard = bool(conn.closed)
+        if not discard:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        if discard:
+            _last_used.pop(id(conn), None)
+        else:
+            _last_used[id(conn)] = time.monotonic()
+        pool.putconn(conn, close=discard)
+
+_s3_client: Optional[Any] = None
+_s3_client_lock = threading.Lock()
+
+def get_s3_client() -> Any:
+    """Клиент S3 создаётся один раз на экземпляр"""
+    global _s3_client
+    if _s3_client is None:
+        with _s3_client_lock:
+            if _s3_client is None:
+                _s3_client = boto3.client(
+                    's3',
+                    endpoint_url=S3_ENDPOINT,
+                    aws_access_key_id=os.environ.get('AWS_ACCESS_KEY_ID'),
+                    aws_secret_access_key=os.environ.get('AWS_SECRET_ACCESS_KEY'),
+                    region_name=os.environ.get('AWS_REGION', 'ru-central1'),
+                    config=Config(signature_version='s3v4')
+                )
+    return _s3_client
+
+def get_header(event: Dict[str, Any], name: str) -> Optional[str]:
+    """Регистронезависимое чтение заголовка запроса"""
+    lowered = name.lower()
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == lowered:
+            return value
+    return None
+
+def dumps(payload: Any) -> str:
+    """Тело JSON-ответа: orjson, если установлен, иначе стандартный json; кириллица в обоих случаях не экранируется"""
+    if orjson is not None:
+        return orjson.dumps(payload).decode('utf-8')
+    return json.dumps(payload, ensure_ascii=False)
+
+def json_response(status: int, payload: Any, headers: Mapping[str, str] = JSON_HEADERS) -> Dict[str, Any]:
+    return {
+        'statusCode': status,
+        'headers': dict(headers),
+        'body': dumps(payload),
+        'isBase64Encoded': False
+    }
+
+def is_authorized(event: Dict[str, Any]) -> bool:
+    """Проверяет заголовок Authorization: Bearer <EXPORT_TOKEN>"""
+    scheme, _, token = (get_header(event, 'Authorization') or '').partition(' ')
+    return bool(EXPORT_TOKEN) and scheme.lower() == 'bearer' and hmac.compare_digest(token.strip(), EXPORT_TOKEN)
+
+def format_value(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def iter_export_chunks(rows: Iterator[Tuple[Any, ...]], columns: Tuple[str, ...], export_format: str,
+                       chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[bytes]:
+    """Кодирует строки в NDJSON или CSV и отдаёт кусками не меньше chunk_size (последний — остаток)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if export_format == 'csv' else None
+    if writer:
+        writer.writerow(columns)
+    for row in rows:
+        if writer:
+            writer.writerow([format_value(value) for value in row])
+        else:
+            buffer.write(dumps(dict(zip(columns, (format_value(value) for value in row)))))
+            buffer.write('\n')
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+def export_table(table: str, export_format: str, write: Callable[[bytes], None]) -> Dict[str, int]:
+    """
+    Выгружает таблицу через именованный (серверный) курсор: строки приходят пачками
+    по EXPORT_ITERSIZE, и в памяти одновременно не больше одной пачки и одного куска вывода.
+    """
+    columns = EXPORT_TABLES[table]
+    stats = {'rows': 0, 'bytes': 0}
+    
+    def counted(cursor: Any) -> Iterator[Tuple[Any, ...]]:
+        for row in cursor:
+            stats['rows'] += 1
+            yield row
+    
+    with db_connection() as conn:
+        with conn.cursor(name=f'export_{table}') as cursor:
+            cursor.itersize = EXPORT_ITERSIZE
+            cursor.execute(f'SELECT {", ".join(columns)} FROM {table} ORDER BY id')
+            for chunk in iter_export_chunks(counted(cursor), columns, export_format):
+                write(chunk)
+                stats['bytes'] += len(chunk)
+    return stats
+
+def export_to_storage(s3_client: Any, bucket_name: str, table: str, export_format: str) -> Dict[str, Any]:
+    """Передаёт куски выгрузки частями multipart-загрузки, не собирая файл целиком"""
+    key = f'exports/{table}-{datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")}.{export_format}'
+    upload_id = s3_client.create_multipart_upload(
+        Bucket=bucket_name, Key=key, ContentType=f'{EXPORT_FORMATS[export_format]}; charset=utf-8'
+    )['UploadId']
+    parts: List[Dict[str, Any]] = []
+    
+    def upload_part(chunk: bytes) -> None:
+        response = s3_client.upload_part(
+            Bucket=bucket_name, Key=key, UploadId=upload_id, PartNumber=len(parts) + 1, Body=chunk
+        )
+        parts.append({'PartNumber': len(parts) + 1, 'ETag': response['ETag']})
+    
+    try:
+        stats = export_table(table, export_format, upload_part)
+        if not parts:
+            upload_part(b'')
+        s3_client.complete_multipart_upload(
+            Bucket=bucket_name, Key=key, UploadId=upload_id, MultipartUpload={'Parts': parts}
+        )
+    except Exception:
+        s3_client.abort_multipart_upload(Bucket=bucket_name, Key=key, UploadId=upload_id)
+        raise
+    url = s3_client.generate_presigned_url(
+        'get_object', Params={'Bucket': bucket_name, 'Key': key}, ExpiresIn=EXPORT_URL_EXPIRES
+    )
+    return {'key': key, 'url': url, **stats}
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    '''
+    Business: Выгрузка статей, материалов и истории чата для отчётов и резервных копий
+    Args: event с httpMethod GET, заголовком Authorization: Bearer <EXPORT_TOKEN> и queryStringParameters
+          table (articles/materials/messages) и format (ndjson/csv); файл собирается в хранилище по частям,
+          а sweeper.py функции upload-to-s3 удаляет старые выгрузки exports/
+    Returns: HTTP response со ссылкой на файл выгрузки, числом строк и байт
+    '''
+    method: str = event.get('httpMethod', 'GET')
+    
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': dict(PREFLIGHT_HEADERS),
+            'body': '',
+            'isBase64Encoded': False
+        }
+    
+    if method not in ALLOWED_METHODS:
+        return json_response(405, {'error': 'Метод не поддерживается'})
+    
+    params = event.get('queryStringParameters') or {}
+    table = params.get('table', '')
+    export_format = params.get('format', 'ndjson')
+    if table not in EXPORT_TABLES or export_format not in EXPORT_FORMATS:
+        return json_response(400, {'error': 'Укажите table (articles, materials, messages) и format (ndjson, csv)'})
+    
+    if not is_authorized(event):
+        return json_response(401, {'error': 'Нужен токен выгрузки'}, {**JSON_HEADERS, 'WWW-Authenticate': 'Bearer'})
+    
+    try:
+        bucket_name = os.environ.get('S3_BUCKET_NAME', 'pedagogical-forum-files')
+        result = export_to_storage(get_s3_client(), bucket_name, table, export_format)
+        return json_response(200, {'table': table, 'format': export_format, **result})
+    
+    except Exception as e:
+        return json_response(500, {'error': f'Ошибка выгрузки: {str(e)}'})
@@ -1,178 +1,622 @@
+import base64
+import io
 import json
 import os
+import re
+import time
+import traceback
+from contextlib import ExitStack, contextmanager
+from types import MappingProxyType
+from typing import Dict, Any, Callable, Iterator, List, Mapping, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 import psycopg2
-from typing import Dict, Any
+import psycopg2.extras
+import psycopg2.pool
+
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', '4'))
+DB_POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', '30'))
+SEARCH_PAGE_SIZE = 50
+SEARCH_PAGE_MAX = 200
+SEARCH_OFFSET_MAX = 10000
+SEARCH_HEADLINE_OPTIONS = 'MaxFragments=2, MaxWords=30, MinWords=10, StartSel=<mark>, StopSel=</mark>'
+# Попутная свёртка при скачивании не чаще раза в интервал; по расписанию с тем же шагом — rollup.py
+DOWNLOADS_ROLLUP_INTERVAL = float(os.environ.get('DOWNLOADS_ROLLUP_INTERVAL', '60'))
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', '1000'))
+IMPORT_BATCH_MAX = 10000
+IMPORT_ERRORS_MAX = 100
+DELETE_BATCH_MAX = 1000
+CONTENT_KEY_PATTERN = re.compile(r'files/[0-9a-f]{2}/[0-9a-f]{64}\.\w+$')
+MATERIAL_COLUMNS = ('title', 'description', 'author', 'file_type', 'category')
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '0') == '1'
+REQUEST_LOG = os.environ.get('REQUEST_LOG', '0') == '1'
+READ_LSN_WAIT = float(os.environ.get('READ_LSN_WAIT', '0.1'))
+READ_LSN_POLL = 0.01
+READ_CONNECT_TIMEOUT = int(os.environ.get('READ_CONNECT_TIMEOUT', '2'))
+REPLICA_RETRY_AFTER = float(os.environ.get('REPLICA_RETRY_AFTER', '30'))
+LSN_PATTERN = re.compile(r'^[0-9A-F]{1,8}/[0-9A-F]{1,8}$', re.IGNORECASE)
+ALLOWED_METHODS = ('GET', 'POST', 'DELETE', 'OPTIONS')
+WRITE_METHODS = ('POST', 'DELETE')
+
+# Шаблоны заголовков собираются один раз на экземпляр; ответы получают свою копию
+JSON_HEADERS = MappingProxyType({
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*'
+})
+PREFLIGHT_HEADERS = MappingProxyType({
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': ', '.join(ALLOWED_METHODS),
+    'Access-Control-Allow-Headers': 'Content-Type, If-None-Match, X-Min-LSN',
+    'Access-Control-Max-Age': '86400'
+})
+NOT_MODIFIED_HEADERS = MappingProxyType({
+    'Cache-Control': 'no-cache',
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Expose-Headers': 'ETag'
+})
+VERSIONED_HEADERS = MappingProxyType({
+    **JSON_HEADERS,
+    'Cache-Control': 'no-cache',
+    'Access-Control-Expose-Headers': 'ETag'
+})
+
+class RequestTimer:
+    """
+    Разбивка времени запроса по фазам: отрезок от предыдущей отметки lap() записывается
+    под именем фазы. Выключенный таймер ничего не замеряет, ошибки запоминаются всегда.
+    """
+    
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self.route = ''
+        self.fields: Dict[str, Any] = {}
+        self.phases: Dict[str, float] = {}
+        self.error: Optional[str] = None
+        self._started = self._last = time.perf_counter() if enabled else 0.0
+    
+    def lap(self, phase: str) -> None:
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + (now - self._last) * 1000
+        self._last = now
+    
+    def fail(self, error: Exception) -> None:
+        """Вызывается из except: в ответ уходит только текст ошибки, трассировка попадает в лог"""
+        self.error = f'{type(error).__name__}: {error}'
+        self.fields['traceback'] = traceback.format_exc()
+    
+    def finish(self, context: Any, response: Dict[str, Any]) -> Dict[str, Any]:
+        """Добавляет Server-Timing и пишет в stdout одну JSON-строку о запросе"""
+        if not self.enabled and self.error is None:
+            return response
+        self.lap('respond')
+        total = (self._last - self._started) * 1000
+        if SERVER_TIMING:
+            timing = ', '.join(f'{name};dur={ms:.1f}' for name, ms in self.phases.items())
+            response = {**response, 'headers': {
+                **response['headers'],
+                'Server-Timing': f'{timing}, total;dur={total:.1f}' if timing else f'total;dur={total:.1f}',
+                'Timing-Allow-Origin': '*'
+            }}
+        if REQUEST_LOG or self.error is not None:
+            body = response.get('body') or ''
+            print(json.dumps({
+                'request_id': getattr(context, 'request_id', None),
+                'route': self.route,
+                'status': response['statusCode'],
+                'bytes_out': len(body) if response.get('isBase64Encoded') else len(body.encode('utf-8')),
+                **({'duration_ms': round(total, 2), 'phases': {name: round(ms, 2) for name, ms in self.phases.items()}} if self.enabled else {}),
+                **({'error': self.error} if self.error is not None else {}),
+                **self.fields
+            }, ensure_ascii=False), flush=True)
+        return response
+
+_pools: Dict[str, psycopg2.pool.ThreadedConnectionPool] = {}
+_last_used: Dict[int, float] = {}
+_replica_down_until = 0.0
+
+def get_pool(role: str = 'primary') -> psycopg2.pool.ThreadedConnectionPool:
+    """Пул соединений на роль, переживающий тёплые вызовы функции; без DATABASE_READ_URL реплика — это primary"""
+    dsn = os.environ.get('DATABASE_READ_URL') if role == 'replica' else None
+    if not dsn:
+        role, dsn = 'primary', os.environ.get('DATABASE_URL')
+    pool = _pools.get(role)
+    if pool is None or pool.closed:
+        # Недоступная реплика не должна держать GET дольше READ_CONNECT_TIMEOUT
+        options = {'connect_timeout': READ_CONNECT_TIMEOUT} if role == 'replica' else {}
+        pool = _pools[role] = psycopg2.pool.ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, dsn, **options)
+    return pool
+
+def is_connection_healthy(conn: Any) -> bool:
+    """Проверяет соединение перед повторным использованием; пингует только долго простаивавшие"""
+    if conn.closed:
+        return False
+    idle = time.monotonic() - _last_used.get(id(conn), 0.0)
+    if idle < DB_POOL_PING_AFTER:
+        return True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+@contextmanager
+def db_connection(role: str = 'primary') -> Iterator[Any]:
+    """Выдаёт соединение из пула и возвращает его обратно на любом пути выхода"""
+    pool = get_pool(role)
+    conn = pool.getconn()
+    if not is_connection_healthy(conn):
+        _last_used.pop(id(conn), None)
+        pool.putconn(conn, close=True)
+        conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        discard = bool(conn.closed)
+        if not discard:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        if discard:
+            _last_used.pop(id(conn), None)
+        else:
+            _last_used[id(conn)] = time.monotonic()
+        pool.putconn(conn, close=discard)
+
+def replica_caught_up(conn: Any, min_lsn: str) -> bool:
+    """Ждёт до READ_LSN_WAIT, пока реплика проиграет WAL до min_lsn; у не-реплики pg_last_wal_replay_lsn() — NULL"""
+    deadline = time.monotonic() + READ_LSN_WAIT
+    with conn.cursor() as cursor:
+        while True:
+            cursor.execute('SELECT pg_last_wal_replay_lsn() >= %s::pg_lsn', (min_lsn,))
+            if cursor.fetchone()[0]:
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(READ_LSN_POLL)
+
+def mark_replica_down(error: Exception, timer: RequestTimer) -> None:
+    """Реплика не отвечает: следующие REPLICA_RETRY_AFTER секунд чтения идут сразу на primary"""
+    global _replica_down_until
+    _replica_down_until = time.monotonic() + REPLICA_RETRY_AFTER
+    timer.fields['replica_error'] = f'{type(error).__name__}: {error}'
+
+@contextmanager
+def read_connection(min_lsn: Optional[str], timer: RequestTimer) -> Iterator[Any]:
+    """Соединение для GET: реплика из DATABASE_READ_URL, а клиенту с токеном X-Min-LSN — только
+    догнавшая его запись реплика, иначе primary. Недоступная реплика тоже означает primary."""
+    if os.environ.get('DATABASE_READ_URL') and time.monotonic() >= _replica_down_until:
+        with ExitStack() as stack:
+            # Ошибки соединения ловим только до yield: исключения из тела запроса не глотаются
+            try:
+                conn = stack.enter_context(db_connection('replica'))
+                usable = min_lsn is None or replica_caught_up(conn, min_lsn)
+            except (psycopg2.OperationalError, psycopg2.pool.PoolError) as e:
+                mark_replica_down(e, timer)
+                usable = False
+            if usable:
+                timer.fields['db'] = 'replica'
+                yield conn
+                return
+    timer.fields['db'] = 'primary'
+    with db_connection() as conn:
+        yield conn
+
+def attach_write_lsn(response: Dict[str, Any], timer: RequestTimer) -> Dict[str, Any]:
+    """Добавляет к успешной записи токен X-Write-LSN: позиция WAL на primary после фиксации.
+    Клиент присылает его обратно в X-Min-LSN, чтобы следующий GET увидел эту запись."""
+    if not os.environ.get('DATABASE_READ_URL') or response['statusCode'] >= 300:
+        return response
+    try:
+        with db_connection() as conn, conn.cursor() as cursor:
+            cursor.execute('SELECT pg_current_wal_lsn()::text')
+            lsn = cursor.fetchone()[0]
+    except psycopg2.Error:
+        return response
+    response['headers']['X-Write-LSN'] = lsn
+    response['headers']['Access-Control-Expose-Headers'] = 'X-Write-LSN'
+    timer.lap('lsn')
+    return response
+
+def get_header(event: Dict[str, Any], name: str) -> Optional[str]:
+    """Регистронезависимое чтение заголовка запроса"""
+    lowered = name.lower()
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == lowered:
+            return value
+    return None
+
+def dumps(payload: Any) -> str:
+    """Тело JSON-ответа: orjson, если установлен, иначе стандартный json; кириллица в обоих случаях не экранируется"""
+    if orjson is not None:
+        return orjson.dumps(payload).decode('utf-8')
+    return json.dumps(payload, ensure_ascii=False)
+
+def json_response(status: int, payload: Any, headers: Mapping[str, str] = JSON_HEADERS) -> Dict[str, Any]:
+    return {
+        'statusCode': status,
+        'headers': dict(headers),
+        'body': dumps(payload),
+        'isBase64Encoded': False
+    }
+
+def rows_to_dicts(cursor: Any, rows: List[Tuple[Any, ...]], width: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Строки выборки в словари по именам столбцов из cursor.description; width отбрасывает служебные столбцы в конце"""
+    names = [column.name for column in cursor.description][:width]
+    return [dict(zip(names, row)) for row in rows]
+
+def get_table_etag(cursor: Any, table: str) -> str:
+    """Слабый ETag по счётчику изменений таблицы, который ведёт триггер в table_versions"""
+    cursor.execute('SELECT version FROM table_versions WHERE table_name = %s', (table,))
+    row = cursor.fetchone()
+    return f'W/"{table}-{row[0] if row else 0}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Слабое сравнение If-None-Match с текущим ETag"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in candidates or any(tag.removeprefix('W/') == etag.removeprefix('W/') for tag in candidates)
+
+def record_download(cursor: Any, material_id: int) -> Optional[Tuple[Optional[str]]]:
+    """Дописывает скачивание в material_downloads вместо UPDATE строки материала;
+    возвращает (file_url,) или None, если материала нет"""
+    cursor.execute('''
+        WITH material AS (
+            SELECT id, file_url FROM materials WHERE id = %s
+        ), hit AS (
+            INSERT INTO material_downloads (material_id) SELECT id FROM material
+        )
+        SELECT file_url FROM material
+    ''', (material_id,))
+    return cursor.fetchone()
+
+def rollup_downloads(cursor: Any) -> int:
+    """Переносит накопленные скачивания в materials.downloads одним UPDATE на материал.
+    Advisory-блокировка не даёт экземплярам сворачивать одновременно; возвращает число перенесённых"""
+    cursor.execute("SELECT pg_try_advisory_xact_lock(hashtext('material_downloads_rollup'))")
+    if not cursor.fetchone()[0]:
+        return 0
+    cursor.execute('''
+        WITH hits AS (
+            DELETE FROM material_downloads RETURNING material_id
+        ), totals AS (
+            SELECT material_id, COUNT(*) AS hits FROM hits GROUP BY material_id
+        ), updated AS (
+            UPDATE materials SET downloads = COALESCE(downloads, 0) + totals.hits
+            FROM totals WHERE materials.id = totals.material_id
+            RETURNING totals.hits
+        )
+        SELECT COALESCE(SUM(hits), 0) FROM updated
+    ''')
+    return int(cursor.fetchone()[0])
+
+_last_rollup = 0.0
+
+def maybe_rollup_downloads(conn: Any) -> None:
+    """Сворачивает счётчики не чаще DOWNLOADS_ROLLUP_INTERVAL на экземпляр; сбой не мешает скачиванию"""
+    global _last_rollup
+    now = time.monotonic()
+    if now - _last_rollup < DOWNLOADS_ROLLUP_INTERVAL:
+        return
+    _last_rollup = now
+    try:
+        with conn.cursor() as cursor:
+            rollup_downloads(cursor)
+        conn.commit()
+    except psycopg2.Error:
+        conn.rollback()
+
+def material_values(data: Any) -> Tuple[Any, ...]:
+    """Поля нового материала в порядке MATERIAL_COLUMNS с умолчаниями одиночного POST"""
+    if not isinstance(data, dict) or not data.get('title'):
+        raise ValueError('Название материала обязательно')
+    values = (
+        data.get('title', ''),
+        data.get('description', ''),
+        data.get('author', 'Аноним'),
+        data.get('file_type', 'PDF'),
+        data.get('category', 'Общее')
+    )
+    # Вложенные объекты и массивы psycopg2 не адаптирует: ProgrammingError сорвал бы весь импорт
+    for column, value in zip(MATERIAL_COLUMNS, values):
+        if value is not None and not isinstance(value, (str, int, float)):
+            raise ValueError(f'Поле {column} должно быть строкой')
+    return values
+
+def import_ndjson(conn: Any, cursor: Any, lines: Iterator[str], table: str, columns: Tuple[str, ...],
+                  to_values: Callable[[Any], Tuple[Any, ...]], batch_size: int) -> Dict[str, Any]:
+    """Загружает NDJSON пачками через execute_values, фиксируя каждую пачку.
+    Если база отвергла пачку, она повторяется построчно, чтобы указать ошибочные строки."""
+    started = time.perf_counter()
+    column_list = ', '.join(columns)
+    imported = 0
+    failed = 0
+    errors: List[Dict[str, Any]] = []
+    batch: List[Tuple[int, Tuple[Any, ...]]] = []
+    
+    def reject(line_number: int, message: str) -> None:
+        nonlocal failed
+        failed += 1
+        if len(errors) < IMPORT_ERRORS_MAX:
+            errors.append({'line': line_number, 'error': message})
+    
+    def flush() -> None:
+        nonlocal imported
+        if not batch:
+            return
+        cursor.execute('SAVEPOINT import_batch')
+        try:
+            psycopg2.extras.execute_values(
+                cursor, f'INSERT INTO {table} ({column_list}) VALUES %s', [values for _, values in batch], page_size=len(batch)
+            )
+            cursor.execute('RELEASE SAVEPOINT import_batch')
+            imported += len(batch)
+        except (psycopg2.DataError, psycopg2.IntegrityError):
+            cursor.execute('ROLLBACK TO SAVEPOINT import_batch')
+            placeholders = ', '.join(['%s'] * len(columns))
+            for line_number, values in batch:
+                cursor.execute('SAVEPOINT import_row')
+                try:
+                    cursor.execute(f'INSERT INTO {table} ({column_list}) VALUES ({placeholders})', values)
+                    cursor.execute('RELEASE SAVEPOINT import_row')
+                    imported += 1
+                except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+                    cursor.execute('ROLLBACK TO SAVEPOINT import_row')
+                    reject(line_number, e.pgerror.strip() if e.pgerror else str(e))
+        conn.commit()
+        batch.clear()
+    
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            batch.append((line_number, to_values(json.loads(line))))
+        except json.JSONDecodeError:
+            reject(line_number, 'Некорректный JSON')
+        except ValueError as e:
+            reject(line_number, str(e))
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+    
+    elapsed = time.perf_counter() - started
+    return {
+        'imported': imported,
+        'failed': failed,
+        'errors': errors,
+        'elapsed_ms': round(elapsed * 1000, 1),
+        'rows_per_sec': round(imported / elapsed, 1) if elapsed > 0 else None
+    }
+
+def parse_ids(value: str) -> List[int]:
+    """Список id через запятую для пакетного удаления, без повторов"""
+    ids = list(dict.fromkeys(int(part) for part in value.split(',') if part.strip()))
+    if not ids or len(ids) > DELETE_BATCH_MAX:
+        raise ValueError('ids out of range')
+    return ids
+
+def release_stored_objects(cursor: Any, file_urls: List[Optional[str]]) -> int:
+    """Снимает ссылки удалённых строк в stored_objects. Объекты, на которые больше никто
+    не ссылается, попадают в очередь object_deletions: её пачками разбирает sweeper.py
+    функции upload-to-s3, здесь клиента S3 нет. Возвращает число поставленных в очередь"""
+    keys = [match.group(0) for match in (CONTENT_KEY_PATTERN.search(url) for url in file_urls if url) if match]
+    if not keys:
+        return 0
+    cursor.execute('''
+        UPDATE stored_objects SET refcount = stored_objects.refcount - released.refs
+        FROM (SELECT key, COUNT(*) AS refs FROM unnest(%s::text[]) AS key GROUP BY key) AS released
+        WHERE stored_objects.key = released.key
+        RETURNING stored_objects.key, stored_objects.refcount
+    ''', (keys,))
+    orphaned = [key for key, refcount in cursor.fetchall() if refcount <= 0]
+    if orphaned:
+        cursor.execute('DELETE FROM stored_objects WHERE key = ANY(%s)', (orphaned,))
+        cursor.execute('INSERT INTO object_deletions (key) SELECT unnest(%s::text[]) ON CONFLICT DO NOTHING', (orphaned,))
+    return len(orphaned)
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: API для управления методической копилкой материалов
-    Args: event с httpMethod (GET/POST/OPTIONS), body для POST запросов
-    Returns: HTTP response с материалами или статусом операции
+    Args: event с httpMethod (GET/POST/OPTIONS), body для POST запросов, queryStringParameters q для поиска;
+          POST ?import=ndjson принимает по материалу в строке (batch — размер пачки);
+          POST с action=download и id учитывает скачивание (в downloads попадает при периодической свёртке)
+    Returns: HTTP response с материалами или статусом операции;
+             SERVER_TIMING=1 добавляет заголовок Server-Timing, REQUEST_LOG=1 пишет строку лога на запрос;
+             с DATABASE_READ_URL GET читает с реплики, а запись отдаёт X-Write-LSN для X-Min-LSN следующего GET
     '''
+    timer = RequestTimer(SERVER_TIMING or REQUEST_LOG)
+    response = route_request(event, timer)
+    if event.get('httpMethod') in WRITE_METHODS:
+        response = attach_write_lsn(response, timer)
+    return timer.finish(context, response)
+
+def route_request(event: Dict[str, Any], timer: RequestTimer) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
+    timer.route = method
     
     if method == 'OPTIONS':
         return {
             'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Access-Control-Max-Age': '86400'
-            },
+            'headers': dict(PREFLIGHT_HEADERS),
             'body': '',
             'isBase64Encoded': False
         }
-    
-    db_url = os.environ.get('DATABASE_URL')
+    if method not in ALLOWED_METHODS:
+        return json_response(405, {'error': 'Метод не поддерживается'})
+    min_lsn = get_header(event, 'X-Min-LSN')
+    if min_lsn is not None and not LSN_PATTERN.match(min_lsn):
+        return json_response(400, {'error': 'Некорректный X-Min-LSN'})
     
     try:
-        conn = psycopg2.connect(db_url)
-        cursor = conn.cursor()
-        
-        if method == 'GET':
-            cursor.execute('''
-                SELECT id, title, description, author, file_type, downloads
-                FROM materials 
-                ORDER BY created_at DESC
-            ''')
+        with (read_connection(min_lsn, timer) if method == 'GET' else db_connection()) as conn, conn.cursor() as cursor:
+            timer.lap('connect')
+            if method == 'GET':
+                etag = get_table_etag(cursor, 'materials')
+                timer.lap('etag')
+                if etag_matches(get_header(event, 'If-None-Match'), etag):
+                    return {
+                        'statusCode': 304,
+                        'headers': {**NOT_MODIFIED_HEADERS, 'ETag': etag},
+                        'body': '',
+                        'isBase64Encoded': False
+                    }
+                
+                params = event.get('queryStringParameters') or {}
+                search_query = (params.get('q') or '').strip()
+                
+                if search_query:
+                    timer.route = 'GET search'
+                    try:
+                        limit = min(int(params.get('limit') or SEARCH_PAGE_SIZE), SEARCH_PAGE_MAX)
+                        offset = int(params.get('offset') or 0)
+                        if limit < 1 or offset < 0 or offset > SEARCH_OFFSET_MAX:
+                            raise ValueError('pagination out of range')
+                    except ValueError:
+                        return json_response(400, {'error': 'Некорректные параметры пагинации'})
+                    
+                    cursor.execute('''
+                        SELECT id, title, description, author, file_type AS type, downloads,
+                               ts_headline('russian', coalesce(description, ''), query, %s) AS snippet,
+                               round(rank::numeric, 4)::float8 AS rank
+                        FROM (
+                            SELECT id, title, description, author, file_type, downloads,
+                                   ts_rank(search_vector, query) AS rank,
+                                   query
+                            FROM materials, websearch_to_tsquery('russian', %s) AS query
+                            WHERE search_vector @@ query
+                            ORDER BY rank DESC, id DESC
+                            LIMIT %s OFFSET %s
+                        ) AS hits
+                        ORDER BY hits.rank DESC, hits.id DESC
+                    ''', (SEARCH_HEADLINE_OPTIONS, search_query, limit + 1, offset))
+                    timer.lap('query')
+                    
+                    rows = cursor.fetchall()
+                    timer.lap('fetch')
+                    next_offset = offset + limit if len(rows) > limit else None
+                    materials = rows_to_dicts(cursor, rows[:limit])
+                    timer.lap('map')
+                    timer.fields['rows'] = len(materials)
+                    
+                    return json_response(200, {'materials': materials, 'next_offset': next_offset}, {**VERSIONED_HEADERS, 'ETag': etag})
+                
+                cursor.execute('''
+                    SELECT id, title, description, author, file_type AS type, downloads
+                    FROM materials 
+                    ORDER BY created_at DESC
+                ''')
+                timer.lap('query')
+                
+                rows = cursor.fetchall()
+                timer.lap('fetch')
+                materials = rows_to_dicts(cursor, rows)
+                timer.lap('map')
+                timer.fields['rows'] = len(materials)
+                
+                return json_response(200, {'materials': materials}, {**VERSIONED_HEADERS, 'ETag': etag})
             
-            rows = cursor.fetchall()
-            materials = [
-                {
-                    'id': row[0],
-                    'title': row[1],
-                    'description': row[2],
-                    'author': row[3],
-                    'type': row[4],
-                    'downloads': row[5]
-                }
-                for row in rows
-            ]
+            elif method == 'POST':
+                params = event.get('queryStringParameters') or {}
+                if params.get('import') == 'ndjson':
+                    timer.route = 'POST import'
+                    body = event.get('body') or ''
+                    if event.get('isBase64Encoded'):
+                        body = base64.b64decode(body).decode('utf-8')
+                    timer.lap('decode')
+                    try:
+                        batch_size = min(int(params.get('batch') or IMPORT_BATCH_SIZE), IMPORT_BATCH_MAX)
+                        if batch_size < 1:
+                            raise ValueError('batch out of range')
+                    except ValueError:
+                        return json_response(400, {'error': 'Некорректный размер пачки'})
+                    
+                    report = import_ndjson(conn, cursor, io.StringIO(body), 'materials', MATERIAL_COLUMNS, material_values, batch_size)
+                    timer.lap('import')
+                    timer.fields['rows'] = report['imported']
+                    return json_response(200, report)
+                
+                body_data = json.loads(event.get('body', '{}'))
+                
+                if body_data.get('action') == 'download':
+                    timer.route = 'POST download'
+                    try:
+                        material_id = int(body_data.get('id'))
+                    except (TypeError, ValueError):
+                        return json_response(400, {'error': 'ID материала обязателен'})
+                    
+                    material = record_download(cursor, material_id)
+                    conn.commit()
+                    timer.lap('query')
+                    if not material:
+                        return json_response(404, {'error': 'Материал не найден'})
+                    maybe_rollup_downloads(conn)
+                    timer.lap('rollup')
+                    
+                    return json_response(200, {'success': True, 'id': material_id, 'file_url': material[0]})
+                
+                try:
+                    values = material_values(body_data)
+                except ValueError as e:
+                    return json_response(400, {'error': str(e)})
+                
+                cursor.execute('''
+                    INSERT INTO materials (title, description, author, file_type, category, downloads) 
+                    VALUES (%s, %s, %s, %s, %s, 0) 
+                    RETURNING id, title, description, author, file_type AS type, downloads
+                ''', values)
+                
+                conn.commit()
+                timer.lap('query')
+                new_material = rows_to_dicts(cursor, cursor.fetchall())[0]
+                
+                return json_response(201, {'material': new_material})
             
-            cursor.close()
-            conn.close()
-            
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'materials': materials}, ensure_ascii=False),
-                'isBase64Encoded': False
-            }
-        
-        elif method == 'POST':
-            body_data = json.loads(event.get('body', '{}'))
-            title = body_data.get('title', '')
-            description = body_data.get('description', '')
-            author = body_data.get('author', 'Аноним')
-            category = body_data.get('category', 'Общее')
-            file_type = body_data.get('file_type', 'PDF')
-            
-            if not title:
-                return {
-                    'statusCode': 400,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({'error': 'Название материала обязательно'}, ensure_ascii=False),
-                    'isBase64Encoded': False
-                }
-            
-            cursor.execute('''
-                INSERT INTO materials (title, description, author, file_type, category, downloads) 
-                VALUES (%s, %s, %s, %s, %s, 0) 
-                RETURNING id, title, description, author, file_type, downloads
-            ''', (title, description, author, file_type, category))
-            
-            conn.commit()
-            row = cursor.fetchone()
-            
-            new_material = {
-                'id': row[0],
-                'title': row[1],
-                'description': row[2],
-                'author': row[3],
-                'type': row[4],
-                'downloads': row[5]
-            }
-            
-            cursor.close()
-            conn.close()
-            
-            return {
-                'statusCode': 201,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'material': new_material}, ensure_ascii=False),
-                'isBase64Encoded': False
-            }
-        
-        elif method == 'DELETE':
-            params = event.get('queryStringParameters') or {}
-            material_id = params.get('id')
-            
-            if not material_id:
-                return {
-                    'statusCode': 400,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({'error': 'ID материала обязателен'}, ensure_ascii=False),
-                    'isBase64Encoded': False
-                }
-            
-            cursor.execute('DELETE FROM materials WHERE id = %s RETURNING id', (material_id,))
-            deleted = cursor.fetchone()
-            conn.commit()
-            cursor.close()
-            conn.close()
-            
-            if deleted:
-                return {
-                    'statusCode': 200,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({'success': True, 'id': deleted[0]}, ensure_ascii=False),
-                    'isBase64Encoded': False
-                }
-            else:
-                return {
-                    'statusCode': 404,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({'error': 'Материал не найден'}, ensure_ascii=False),
-                    'isBase64Encoded': False
-                }
-        
-        else:
-            return {
-                'statusCode': 405,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'error': 'Метод не поддерживается'}, ensure_ascii=False),
-                'isBase64Encoded': False
-            }
+            elif method == 'DELETE':
+                params = event.get('queryStringParameters') or {}
+                try:
+                    ids = parse_ids(params.get('ids') or params.get('id') or '')
+                except ValueError:
+                    return json_response(400, {'error': 'ID материала обязателен'})
+                
+                # Пачка удаляется одним запросом; файлы удалённых строк освобождаются в той же транзакции
+                cursor.execute('DELETE FROM materials WHERE id = ANY(%s) RETURNING id, file_url', (ids,))
+                deleted = cursor.fetchall()
+                queued = release_stored_objects(cursor, [row[1] for row in deleted])
+                conn.commit()
+                timer.lap('query')
+                timer.fields['rows'] = len(deleted)
+                
+                if 'ids' in params:
+                    deleted_ids = [row[0] for row in deleted]
+                    found = set(deleted_ids)
+                    return json_response(200, {
+                        'success': True,
+                        'ids': deleted_ids,
+                        'missing': [item for item in ids if item not in found],
+                        'objects_queued': queued
+                    })
+                
+                if deleted:
+                    return json_response(200, {'success': True, 'id': deleted[0][0]})
+                else:
+                    return json_response(404, {'error': 'Материал не найден'})
     
+    except psycopg2.OperationalError as e:
+        if timer.fields.get('db') != 'replica':
+            timer.fail(e)
+            return json_response(500, {'error': str(e)})
+        # Реплика отвалилась посреди чтения: повторяем запрос, read_connection отдаст primary
+        mark_replica_down(e, timer)
+        return route_request(event, timer)
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': str(e)}, ensure_ascii=False),
-            'isBase64Encoded': False
-        }
\ No newline at end of file
+        timer.fail(e)
+        return json_response(500, {'error': str(e)})
\ No newline at end of file
@@ -0,0 +1,21 @@
+"""
+Свёртка счётчиков скачиваний, запускается по расписанию отдельно от HTTP-функции:
+    python rollup.py
+Переносит накопленные в material_downloads скачивания в materials.downloads. Функция
+сама сворачивает их лишь попутно, при следующем скачивании, поэтому без расписания
+хиты тихого материала могут неделями не попадать в счётчик. Запускайте раз в
+DOWNLOADS_ROLLUP_INTERVAL секунд; параллельные запуски разводит advisory-блокировка.
+"""
+import json
+
+from index import db_connection, rollup_downloads
+
+def main() -> None:
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            rolled_up = rollup_downloads(cursor)
+        conn.commit()
+    print(json.dumps({'rolled_up': rolled_up}, ensure_ascii=False))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,300 @@
+"""
+SSE-шлюз чата, запускается отдельно от HTTP-функции:
+    python gateway.py [--host 0.0.0.0] [--port 8080]
+Держит одно соединение с LISTEN на канал, в который POST функции messages шлёт NOTIFY,
+и раздаёт новые сообщения всем открытым вкладкам через Server-Sent Events вместо
+опроса базы каждой из них. GET /events — поток (Last-Event-ID или ?last_event_id=
+досылает пропущенное), GET /health — счётчики шлюза.
+
+Медленный подписчик не тормозит остальных: у каждого своя ограниченная очередь, и тот,
+у кого она переполнилась или запись не ушла за SSE_WRITE_TIMEOUT, отключается. Браузер
+переподключится сам и по Last-Event-ID получит пропущенное из кольцевого буфера или базы.
+На тысячи подписчиков поднимите ulimit -n.
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+import psycopg2
+import psycopg2.extensions
+
+from index import (DB_POOL_MAX, MESSAGES_CHANNEL, MESSAGES_RECENT_MONTHS, MESSAGES_SYNC_MAX, MESSAGES_SYNC_OVERLAP,
+                   db_connection, dumps, fetch_messages_after)
+
+SSE_QUEUE_SIZE = int(os.environ.get('SSE_QUEUE_SIZE', '256'))
+SSE_REPLAY_SIZE = int(os.environ.get('SSE_REPLAY_SIZE', '1000'))
+SSE_HEARTBEAT = float(os.environ.get('SSE_HEARTBEAT', '15'))
+SSE_WRITE_TIMEOUT = float(os.environ.get('SSE_WRITE_TIMEOUT', '10'))
+SSE_RETRY_MS = 3000
+REQUEST_HEAD_MAX = 8192
+REQUEST_HEAD_TIMEOUT = 10.0
+LISTEN_RECONNECT_MAX = 30.0
+
+Event = Tuple[int, bytes]
+
+STREAM_HEAD = (
+    'HTTP/1.1 200 OK\r\n'
+    'Content-Type: text/event-stream; charset=utf-8\r\n'
+    'Cache-Control: no-cache\r\n'
+    'Connection: keep-alive\r\n'
+    'X-Accel-Buffering: no\r\n'
+    'Access-Control-Allow-Origin: *\r\n'
+    '\r\n'
+    f'retry: {SSE_RETRY_MS}\n\n'
+).encode('ascii')
+
+def encode_event(message: Dict[str, Any]) -> Event:
+    """Кадр SSE кодируется один раз и дальше раздаётся всем подписчикам как есть"""
+    return message['id'], f'id: {message["id"]}\ndata: {dumps(message)}\n\n'.encode('utf-8')
+
+def plain_response(status: str, body: str, content_type: str = 'application/json') -> bytes:
+    data = body.encode('utf-8')
+    return (
+        f'HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(data)}\r\n'
+        'Access-Control-Allow-Origin: *\r\nConnection: close\r\n\r\n'
+    ).encode('ascii') + data
+
+def load_messages_after(since_id: int, limit: int = MESSAGES_SYNC_MAX, overlap: int = 0) -> List[Dict[str, Any]]:
+    """Блокирующая выборка из базы, вызывается в пуле потоков"""
+    with db_connection() as conn, conn.cursor() as cursor:
+        rows = fetch_messages_after(cursor, since_id, MESSAGES_RECENT_MONTHS, limit, overlap)
+    return [{'id': row[0], 'author': row[1], 'text': row[2], 'time': row[3]} for row in rows]
+
+class Subscriber:
+    __slots__ = ('queue', 'replayed', 'task')
+
+    def __init__(self):
+        self.queue: 'asyncio.Queue[Event]' = asyncio.Queue(maxsize=SSE_QUEUE_SIZE)
+        # id, уже отправленные докачкой: живой поток их пропускает
+        self.replayed: Set[int] = set()
+        self.task: Optional[asyncio.Task] = None
+
+class Gateway:
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self.subscribers: Set[Subscriber] = set()
+        self.replay: Deque[Event] = deque(maxlen=SSE_REPLAY_SIZE)
+        self.published: Set[int] = set()
+        # Выборки из базы идут в потоках, но делят пул index.py на DB_POOL_MAX соединений
+        self.db_slots = asyncio.Semaphore(DB_POOL_MAX)
+        self.incoming: 'asyncio.Queue[str]' = asyncio.Queue()
+        self.last_id = 0
+        self.stats = {'events': 0, 'connected': 0, 'dropped_slow': 0, 'listen_reconnects': 0, 'db_errors': 0}
+        self.started = time.time()
+
+    def publish(self, message: Dict[str, Any]) -> None:
+        # NOTIFY приходит в порядке фиксации, а не id: меньший id может прийти после большего,
+        # поэтому повтор узнаётся по множеству разосланных id, а не по максимальному
+        if message['id'] in self.published:
+            return
+        event = encode_event(message)
+        if len(self.replay) == self.replay.maxlen:
+            self.published.discard(self.replay[0][0])
+        self.replay.append(event)
+        self.published.add(message['id'])
+        self.last_id = max(self.last_id, message['id'])
+        self.stats['events'] += 1
+        for subscriber in list(self.subscribers):
+            try:
+                subscriber.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self.drop(subscriber)
+
+    def drop(self, subscriber: Subscriber) -> None:
+        """Отключает отставшего подписчика; он переподключится с Last-Event-ID"""
+        if subscriber in self.subscribers:
+            self.subscribers.discard(subscriber)
+            self.stats['dropped_slow'] += 1
+            if subscriber.task is not None:
+                subscriber.task.cancel()
+
+    async def load_after(self, since_id: int, limit: int = MESSAGES_SYNC_MAX, overlap: int = 0) -> List[Dict[str, Any]]:
+        """Выборка из базы не больше чем в DB_POOL_MAX потоков сразу, иначе пул бросает PoolError"""
+        async with self.db_slots:
+            return await asyncio.get_running_loop().run_in_executor(None, load_messages_after, since_id, limit, overlap)
+
+    async def pump(self) -> None:
+        """Разбирает уведомления строго по порядку; усечённые (только id) дочитывает из базы"""
+        while True:
+            payload = await self.incoming.get()
+            try:
+                message = json.loads(payload)
+            except ValueError:
+                continue
+            if 'text' in message:
+                self.publish(message)
+                continue
+            try:
+                rows = await self.load_after(message['id'] - 1, 1)
+            except psycopg2.Error as e:
+                self.stats['db_errors'] += 1
+                print(f'gateway: не дочитано сообщение {message["id"]}: {e}', file=sys.stderr, flush=True)
+                continue
+            for row in rows:
+                self.publish(row)
+
+    async def listen(self) -> None:
+        """Одно соединение с LISTEN; после обрыва переподключается и досылает пропущенное из базы"""
+        loop = asyncio.get_running_loop()
+        delay = 1.0
+        while True:
+            try:
+                conn = psycopg2.connect(self.dsn)
+            except psycopg2.OperationalError as e:
+                print(f'gateway: нет соединения с базой: {e}', file=sys.stderr, flush=True)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, LISTEN_RECONNECT_MAX)
+                continue
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cursor:
+                cursor.execute(f'LISTEN {MESSAGES_CHANNEL}')
+            delay = 1.0
+            if self.last_id:
+                # Окно перекрытия ловит меньшие id, закоммиченные во время обрыва; повторы отсеет publish
+                try:
+                    for message in await self.load_after(self.last_id, overlap=MESSAGES_SYNC_OVERLAP):
+                        self.incoming.put_nowait(dumps(message))
+                except psycopg2.Error as e:
+                    self.stats['db_errors'] += 1
+                    print(f'gateway: пропущенное после переподключения не дочитано: {e}', file=sys.stderr, flush=True)
+            lost = loop.create_future()
+
+            def on_readable() -> None:
+                try:
+                    conn.poll()
+                except psycopg2.Error as e:
+                    if not lost.done():
+                        lost.set_result(e)
+                    return
+                while conn.notifies:
+                    self.incoming.put_nowait(conn.notifies.pop(0).payload)
+
+            # fileno() у уже оборванного соединения бросает исключение, поэтому дескриптор запоминается
+            fd = conn.fileno()
+            loop.add_reader(fd, on_readable)
+            try:
+                error = await lost
+                print(f'gateway: LISTEN прервано: {error}', file=sys.stderr, flush=True)
+            finally:
+                loop.remove_reader(fd)
+                conn.close()
+            self.stats['listen_reconnects'] += 1
+
+    async def replay_after(self, last_id: int) -> List[Event]:
+        """
+        Пропущенное подписчиком после last_id вместе с окном перекрытия MESSAGES_SYNC_OVERLAP ниже него:
+        id не идут подряд, и меньший мог прийти позже. Из кольцевого буфера, если он начинается не позже
+        окна, иначе из базы. Повторы отбрасывает клиент. Если база недоступна или пул занят, отдаёт что
+        есть в буфере, и поток продолжается вживую.
+        """
+        floor = last_id - MESSAGES_SYNC_OVERLAP
+        buffered = [event for event in self.replay if event[0] > floor]
+        if self.published and min(self.published) <= floor:
+            return buffered
+        try:
+            missed = await self.load_after(last_id, overlap=MESSAGES_SYNC_OVERLAP)
+        except psycopg2.Error as e:
+            self.stats['db_errors'] += 1
+            print(f'gateway: докачка после {last_id} из базы не удалась: {e}', file=sys.stderr, flush=True)
+            return buffered
+        events = [encode_event(message) for message in missed]
+        loaded = {event_id for event_id, _ in events}
+        return events + [event for event in buffered if event[0] not in loaded]
+
+    async def stream(self, writer: asyncio.StreamWriter, last_id: Optional[int]) -> None:
+        subscriber = Subscriber()
+        subscriber.task = asyncio.current_task()
+        # Подписка раньше докачки: то, что придёт во время выборки, ляжет в очередь
+        # и отсеется как уже отправленное, так что между историей и живым потоком нет дыры
+        self.subscribers.add(subscriber)
+        self.stats['connected'] += 1
+        try:
+            writer.write(STREAM_HEAD)
+            if last_id is not None:
+                backlog = await self.replay_after(last_id)
+                writer.write(b''.join(frame for _, frame in backlog))
+                subscriber.replayed = {event_id for event_id, _ in backlog}
+            await asyncio.wait_for(writer.drain(), SSE_WRITE_TIMEOUT)
+            while True:
+                try:
+                    events = [await asyncio.wait_for(subscriber.queue.get(), SSE_HEARTBEAT)]
+                except asyncio.TimeoutError:
+                    writer.write(b': ping\n\n')
+                    await asyncio.wait_for(writer.drain(), SSE_WRITE_TIMEOUT)
+                    continue
+                while not subscriber.queue.empty():
+                    events.append(subscriber.queue.get_nowait())
+                frames = [frame for event_id, frame in events if event_id not in subscriber.replayed]
+                if frames:
+                    writer.write(b''.join(frames))
+                    await asyncio.wait_for(writer.drain(), SSE_WRITE_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.drop(subscriber)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self.subscribers.discard(subscriber)
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), REQUEST_HEAD_TIMEOUT)
+            request_line, *header_lines = head.decode('latin-1').split('\r\n')
+            method, target, _ = request_line.split(' ', 2)
+            headers = {
+                name.strip().lower(): value.strip()
+                for name, _, value in (line.partition(':') for line in header_lines if line)
+            }
+            url = urlsplit(target)
+            params = dict(parse_qsl(url.query))
+            if method != 'GET':
+                writer.write(plain_response('405 Method Not Allowed', json.dumps({'error': 'Метод не поддерживается'}, ensure_ascii=False)))
+            elif url.path == '/health':
+                writer.write(plain_response('200 OK', json.dumps({
+                    **self.stats,
+                    'subscribers': len(self.subscribers),
+                    'last_id': self.last_id,
+                    'uptime': round(time.time() - self.started)
+                })))
+            elif url.path in ('/', '/events'):
+                last_event_id = headers.get('last-event-id') or params.get('last_event_id')
+                await self.stream(writer, int(last_event_id) if last_event_id and last_event_id.isdigit() else None)
+            else:
+                writer.write(plain_response('404 Not Found', json.dumps({'error': 'Не найдено'}, ensure_ascii=False)))
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ValueError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+async def serve(host: str, port: int) -> None:
+    gateway = Gateway(os.environ['DATABASE_URL'])
+    tasks = [asyncio.create_task(gateway.listen()), asyncio.create_task(gateway.pump())]
+    server = await asyncio.start_server(gateway.handle_client, host, port, limit=REQUEST_HEAD_MAX, backlog=1024)
+    stop = asyncio.get_running_loop().create_future()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        asyncio.get_running_loop().add_signal_handler(signum, lambda: stop.done() or stop.set_result(None))
+    print(f'gateway: слушаю {host}:{port}, канал {MESSAGES_CHANNEL}', file=sys.stderr, flush=True)
+    async with server:
+        await stop
+    for subscriber in list(gateway.subscribers):
+        if subscriber.task is not None:
+            subscriber.task.cancel()
+    for task in tasks:
+        task.cancel()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Раздача новых сообщений чата через SSE')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', '8080')))
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port))
+
+if __name__ == '__main__':
+    main()
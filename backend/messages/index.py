@@ -1,131 +1,472 @@
 import json
 import os
+import re
+import time
+import traceback
+from contextlib import ExitStack, contextmanager
+from types import MappingProxyType
+from typing import Dict, Any, Iterator, List, Mapping, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 import psycopg2
-from typing import Dict, Any
+import psycopg2.pool
+
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', '4'))
+DB_POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', '30'))
+MESSAGES_BOOTSTRAP_LIMIT = int(os.environ.get('MESSAGES_BOOTSTRAP_LIMIT', '100'))
+MESSAGES_SYNC_MAX = 500
+# id выдаются до коммита, поэтому строка с меньшим id может стать видна позже большей;
+# синхронизация заново читает столько id ниже водяного знака среди строк не старше
+# MESSAGES_SYNC_OVERLAP_SECONDS, клиент отбрасывает повторы
+MESSAGES_SYNC_OVERLAP = int(os.environ.get('MESSAGES_SYNC_OVERLAP', '50'))
+MESSAGES_SYNC_OVERLAP_SECONDS = int(os.environ.get('MESSAGES_SYNC_OVERLAP_SECONDS', '60'))
+MESSAGES_RECENT_MONTHS = int(os.environ.get('MESSAGES_RECENT_MONTHS', '1'))
+MESSAGES_HISTORY_MONTHS_MAX = 12
+MESSAGES_PARTITIONS_AHEAD = int(os.environ.get('MESSAGES_PARTITIONS_AHEAD', '2'))
+MESSAGES_RETENTION_MONTHS = int(os.environ.get('MESSAGES_RETENTION_MONTHS', '12'))
+PARTITION_NAME_PATTERN = re.compile(r'^messages_p[0-9]{6}$')
+MESSAGES_CHANNEL = 'messages_new'
+NOTIFY_PAYLOAD_MAX = 7900
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '0') == '1'
+REQUEST_LOG = os.environ.get('REQUEST_LOG', '0') == '1'
+READ_LSN_WAIT = float(os.environ.get('READ_LSN_WAIT', '0.1'))
+READ_LSN_POLL = 0.01
+READ_CONNECT_TIMEOUT = int(os.environ.get('READ_CONNECT_TIMEOUT', '2'))
+REPLICA_RETRY_AFTER = float(os.environ.get('REPLICA_RETRY_AFTER', '30'))
+LSN_PATTERN = re.compile(r'^[0-9A-F]{1,8}/[0-9A-F]{1,8}$', re.IGNORECASE)
+ALLOWED_METHODS = ('GET', 'POST', 'OPTIONS')
+WRITE_METHODS = ('POST',)
+
+# Шаблоны заголовков собираются один раз на экземпляр; ответы получают свою копию
+JSON_HEADERS = MappingProxyType({
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*'
+})
+PREFLIGHT_HEADERS = MappingProxyType({
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': ', '.join(ALLOWED_METHODS),
+    'Access-Control-Allow-Headers': 'Content-Type, If-None-Match, X-Min-LSN',
+    'Access-Control-Max-Age': '86400'
+})
+NOT_MODIFIED_HEADERS = MappingProxyType({
+    'Cache-Control': 'no-cache',
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Expose-Headers': 'ETag'
+})
+VERSIONED_HEADERS = MappingProxyType({
+    **JSON_HEADERS,
+    'Cache-Control': 'no-cache',
+    'Access-Control-Expose-Headers': 'ETag'
+})
+
+class RequestTimer:
+    """
+    Разбивка времени запроса по фазам: отрезок от предыдущей отметки lap() записывается
+    под именем фазы. Выключенный таймер ничего не замеряет, ошибки запоминаются всегда.
+    """
+    
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self.route = ''
+        self.fields: Dict[str, Any] = {}
+        self.phases: Dict[str, float] = {}
+        self.error: Optional[str] = None
+        self._started = self._last = time.perf_counter() if enabled else 0.0
+    
+    def lap(self, phase: str) -> None:
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + (now - self._last) * 1000
+        self._last = now
+    
+    def fail(self, error: Exception) -> None:
+        """Вызывается из except: в ответ уходит только текст ошибки, трассировка попадает в лог"""
+        self.error = f'{type(error).__name__}: {error}'
+        self.fields['traceback'] = traceback.format_exc()
+    
+    def finish(self, context: Any, response: Dict[str, Any]) -> Dict[str, Any]:
+        """Добавляет Server-Timing и пишет в stdout одну JSON-строку о запросе"""
+        if not self.enabled and self.error is None:
+            return response
+        self.lap('respond')
+        total = (self._last - self._started) * 1000
+        if SERVER_TIMING:
+            timing = ', '.join(f'{name};dur={ms:.1f}' for name, ms in self.phases.items())
+            response = {**response, 'headers': {
+                **response['headers'],
+                'Server-Timing': f'{timing}, total;dur={total:.1f}' if timing else f'total;dur={total:.1f}',
+                'Timing-Allow-Origin': '*'
+            }}
+        if REQUEST_LOG or self.error is not None:
+            body = response.get('body') or ''
+            print(json.dumps({
+                'request_id': getattr(context, 'request_id', None),
+                'route': self.route,
+                'status': response['statusCode'],
+                'bytes_out': len(body) if response.get('isBase64Encoded') else len(body.encode('utf-8')),
+                **({'duration_ms': round(total, 2), 'phases': {name: round(ms, 2) for name, ms in self.phases.items()}} if self.enabled else {}),
+                **({'error': self.error} if self.error is not None else {}),
+                **self.fields
+            }, ensure_ascii=False), flush=True)
+        return response
+
+_pools: Dict[str, psycopg2.pool.ThreadedConnectionPool] = {}
+_last_used: Dict[int, float] = {}
+_replica_down_until = 0.0
+
+def get_pool(role: str = 'primary') -> psycopg2.pool.ThreadedConnectionPool:
+    """Пул соединений на роль, переживающий тёплые вызовы функции; без DATABASE_READ_URL реплика — это primary"""
+    dsn = os.environ.get('DATABASE_READ_URL') if role == 'replica' else None
+    if not dsn:
+        role, dsn = 'primary', os.environ.get('DATABASE_URL')
+    pool = _pools.get(role)
+    if pool is None or pool.closed:
+        # Недоступная реплика не должна держать GET дольше READ_CONNECT_TIMEOUT
+        options = {'connect_timeout': READ_CONNECT_TIMEOUT} if role == 'replica' else {}
+        pool = _pools[role] = psycopg2.pool.ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, dsn, **options)
+    return pool
+
+def is_connection_healthy(conn: Any) -> bool:
+    """Проверяет соединение перед повторным использованием; пингует только долго простаивавшие"""
+    if conn.closed:
+        return False
+    idle = time.monotonic() - _last_used.get(id(conn), 0.0)
+    if idle < DB_POOL_PING_AFTER:
+        return True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+@contextmanager
+def db_connection(role: str = 'primary') -> Iterator[Any]:
+    """Выдаёт соединение из пула и возвращает его обратно на любом пути выхода"""
+    pool = get_pool(role)
+    conn = pool.getconn()
+    if not is_connection_healthy(conn):
+        _last_used.pop(id(conn), None)
+        pool.putconn(conn, close=True)
+        conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        discard = bool(conn.closed)
+        if not discard:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        if discard:
+            _last_used.pop(id(conn), None)
+        else:
+            _last_used[id(conn)] = time.monotonic()
+        pool.putconn(conn, close=discard)
+
+def replica_caught_up(conn: Any, min_lsn: str) -> bool:
+    """Ждёт до READ_LSN_WAIT, пока реплика проиграет WAL до min_lsn; у не-реплики pg_last_wal_replay_lsn() — NULL"""
+    deadline = time.monotonic() + READ_LSN_WAIT
+    with conn.cursor() as cursor:
+        while True:
+            cursor.execute('SELECT pg_last_wal_replay_lsn() >= %s::pg_lsn', (min_lsn,))
+            if cursor.fetchone()[0]:
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(READ_LSN_POLL)
+
+def mark_replica_down(error: Exception, timer: RequestTimer) -> None:
+    """Реплика не отвечает: следующие REPLICA_RETRY_AFTER секунд чтения идут сразу на primary"""
+    global _replica_down_until
+    _replica_down_until = time.monotonic() + REPLICA_RETRY_AFTER
+    timer.fields['replica_error'] = f'{type(error).__name__}: {error}'
+
+@contextmanager
+def read_connection(min_lsn: Optional[str], timer: RequestTimer) -> Iterator[Any]:
+    """Соединение для GET: реплика из DATABASE_READ_URL, а клиенту с токеном X-Min-LSN — только
+    догнавшая его запись реплика, иначе primary. Недоступная реплика тоже означает primary."""
+    if os.environ.get('DATABASE_READ_URL') and time.monotonic() >= _replica_down_until:
+        with ExitStack() as stack:
+            # Ошибки соединения ловим только до yield: исключения из тела запроса не глотаются
+            try:
+                conn = stack.enter_context(db_connection('replica'))
+                usable = min_lsn is None or replica_caught_up(conn, min_lsn)
+            except (psycopg2.OperationalError, psycopg2.pool.PoolError) as e:
+                mark_replica_down(e, timer)
+                usable = False
+            if usable:
+                timer.fields['db'] = 'replica'
+                yield conn
+                return
+    timer.fields['db'] = 'primary'
+    with db_connection() as conn:
+        yield conn
+
+def attach_write_lsn(response: Dict[str, Any], timer: RequestTimer) -> Dict[str, Any]:
+    """Добавляет к успешной записи токен X-Write-LSN: позиция WAL на primary после фиксации.
+    Клиент присылает его обратно в X-Min-LSN, чтобы следующий GET увидел эту запись."""
+    if not os.environ.get('DATABASE_READ_URL') or response['statusCode'] >= 300:
+        return response
+    try:
+        with db_connection() as conn, conn.cursor() as cursor:
+            cursor.execute('SELECT pg_current_wal_lsn()::text')
+            lsn = cursor.fetchone()[0]
+    except psycopg2.Error:
+        return response
+    response['headers']['X-Write-LSN'] = lsn
+    response['headers']['Access-Control-Expose-Headers'] = 'X-Write-LSN'
+    timer.lap('lsn')
+    return response
+
+def get_header(event: Dict[str, Any], name: str) -> Optional[str]:
+    """Регистронезависимое чтение заголовка запроса"""
+    lowered = name.lower()
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == lowered:
+            return value
+    return None
+
+def dumps(payload: Any) -> str:
+    """Тело JSON-ответа: orjson, если установлен, иначе стандартный json; кириллица в обоих случаях не экранируется"""
+    if orjson is not None:
+        return orjson.dumps(payload).decode('utf-8')
+    return json.dumps(payload, ensure_ascii=False)
+
+def json_response(status: int, payload: Any, headers: Mapping[str, str] = JSON_HEADERS) -> Dict[str, Any]:
+    return {
+        'statusCode': status,
+        'headers': dict(headers),
+        'body': dumps(payload),
+        'isBase64Encoded': False
+    }
+
+def rows_to_dicts(cursor: Any, rows: List[Tuple[Any, ...]], width: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Строки выборки в словари по именам столбцов из cursor.description; width отбрасывает служебные столбцы в конце"""
+    names = [column.name for column in cursor.description][:width]
+    return [dict(zip(names, row)) for row in rows]
+
+def get_messages_etag(cursor: Any, months: int) -> str:
+    """Слабый ETag по счётчику изменений таблицы, который ведёт триггер в table_versions, и началу
+    окна по created_at: с новым месяцем окно сдвигается и выдача меняется без единой записи"""
+    cursor.execute('''
+        SELECT (SELECT version FROM table_versions WHERE table_name = 'messages'),
+               to_char(date_trunc('month', LOCALTIMESTAMP) - make_interval(months => %s), 'YYYY-MM')
+    ''', (months,))
+    version, window_start = cursor.fetchone()
+    return f'W/"messages-{version or 0}-{window_start}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Слабое сравнение If-None-Match с текущим ETag"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in candidates or any(tag.removeprefix('W/') == etag.removeprefix('W/') for tag in candidates)
+
+def fetch_messages_after(cursor: Any, since_id: int, months: int, limit: int, overlap: int = 0) -> List[Tuple[Any, ...]]:
+    """
+    Сообщения с id больше since_id по возрастанию; общая выборка синхронизации и докачки в gateway.py.
+    С overlap добавляются недавние строки с id от since_id - overlap до since_id включительно.
+    """
+    cursor.execute('''
+        SELECT id, author, text, 
+               TO_CHAR(created_at, 'HH24:MI') as time
+        FROM messages 
+        WHERE id > %s - %s
+          AND (id > %s OR created_at >= LOCALTIMESTAMP - make_interval(secs => %s))
+          AND created_at >= date_trunc('month', LOCALTIMESTAMP) - make_interval(months => %s)
+        ORDER BY id ASC
+        LIMIT %s
+    ''', (since_id, overlap, since_id, MESSAGES_SYNC_OVERLAP_SECONDS, months, limit + overlap))
+    return cursor.fetchall()
+
+def ensure_message_partitions(cursor: Any, months_ahead: int) -> List[str]:
+    """Создаёт недостающие помесячные секции messages от текущего месяца на months_ahead вперёд,
+    а также для месяцев, чьи строки попали в секцию по умолчанию (импорт со старыми датами)"""
+    cursor.execute('''
+        SELECT 'messages_p' || to_char(month, 'YYYYMM')
+        FROM (
+            SELECT generate_series(date_trunc('month', LOCALTIMESTAMP),
+                                   date_trunc('month', LOCALTIMESTAMP) + make_interval(months => %s),
+                                   INTERVAL '1 month') AS month
+            UNION
+            SELECT DISTINCT date_trunc('month', created_at) FROM messages_default
+        ) AS months
+        WHERE ensure_messages_partition(month::date)
+        ORDER BY 1
+    ''', (months_ahead,))
+    return [row[0] for row in cursor.fetchall()]
+
+def expired_message_partitions(cursor: Any, retention_months: int) -> List[str]:
+    """Присоединённые секции, целиком старше текущего месяца и retention_months предыдущих"""
+    cursor.execute('''
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = 'messages'::regclass
+          AND child.relname ~ '^messages_p[0-9]{6}$'
+          AND to_date(substr(child.relname, 11), 'YYYYMM') + INTERVAL '1 month'
+              <= date_trunc('month', LOCALTIMESTAMP) - make_interval(months => %s)
+        ORDER BY child.relname
+    ''', (retention_months,))
+    return [row[0] for row in cursor.fetchall()]
+
+def detach_message_partition(cursor: Any, partition_name: str) -> None:
+    """Отсоединяет секцию: её строки пропадают из messages, но таблица остаётся до архивации"""
+    if not PARTITION_NAME_PATTERN.match(partition_name):
+        raise ValueError(f'not a messages partition: {partition_name}')
+    cursor.execute(f'ALTER TABLE messages DETACH PARTITION {partition_name}')
+    cursor.execute("UPDATE table_versions SET version = version + 1 WHERE table_name = 'messages'")
+
+def detached_message_partitions(cursor: Any) -> List[str]:
+    """Отсоединённые, но ещё не заархивированные секции, в том числе от прерванного прошлого запуска"""
+    cursor.execute('''
+        SELECT relname
+        FROM pg_class
+        WHERE relkind = 'r'
+          AND relnamespace = (SELECT relnamespace FROM pg_class WHERE oid = 'messages'::regclass)
+          AND relname ~ '^messages_p[0-9]{6}$'
+          AND NOT EXISTS (SELECT 1 FROM pg_inherits WHERE inhrelid = pg_class.oid)
+        ORDER BY relname
+    ''')
+    return [row[0] for row in cursor.fetchall()]
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: API для управления сообщениями чата педагогов
-    Args: event с httpMethod (GET/POST/OPTIONS), body для POST запросов
-    Returns: HTTP response с сообщениями или статусом операции
+    Args: event с httpMethod (GET/POST/OPTIONS), body для POST запросов, queryStringParameters since_id/limit для синхронизации
+          (ответ повторяет недавние сообщения из MESSAGES_SYNC_OVERLAP id до since_id, повторы отбрасывает клиент);
+          months — сколько прошлых месяцев захватить помимо текущего (по умолчанию MESSAGES_RECENT_MONTHS);
+          новое сообщение дополнительно рассылается через NOTIFY в канал MESSAGES_CHANNEL
+    Returns: HTTP response с сообщениями или статусом операции;
+             SERVER_TIMING=1 добавляет заголовок Server-Timing, REQUEST_LOG=1 пишет строку лога на запрос;
+             с DATABASE_READ_URL GET читает с реплики, а запись отдаёт X-Write-LSN для X-Min-LSN следующего GET
     '''
+    timer = RequestTimer(SERVER_TIMING or REQUEST_LOG)
+    response = route_request(event, timer)
+    if event.get('httpMethod') in WRITE_METHODS:
+        response = attach_write_lsn(response, timer)
+    return timer.finish(context, response)
+
+def route_request(event: Dict[str, Any], timer: RequestTimer) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
+    timer.route = method
     
     if method == 'OPTIONS':
         return {
             'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Access-Control-Max-Age': '86400'
-            },
+            'headers': dict(PREFLIGHT_HEADERS),
             'body': '',
             'isBase64Encoded': False
         }
-    
-    db_url = os.environ.get('DATABASE_URL')
+    if method not in ALLOWED_METHODS:
+        return json_response(405, {'error': 'Метод не поддерживается'})
+    min_lsn = get_header(event, 'X-Min-LSN')
+    if min_lsn is not None and not LSN_PATTERN.match(min_lsn):
+        return json_response(400, {'error': 'Некорректный X-Min-LSN'})
     
     try:
-        conn = psycopg2.connect(db_url)
-        cursor = conn.cursor()
-        
-        if method == 'GET':
-            cursor.execute('''
-                SELECT id, author, text, 
-                       TO_CHAR(created_at, 'HH24:MI') as time,
-                       created_at
-                FROM messages 
-                ORDER BY created_at ASC
-            ''')
-            
-            rows = cursor.fetchall()
-            messages = [
-                {
-                    'id': row[0],
-                    'author': row[1],
-                    'text': row[2],
-                    'time': row[3]
-                }
-                for row in rows
-            ]
+        with (read_connection(min_lsn, timer) if method == 'GET' else db_connection()) as conn, conn.cursor() as cursor:
+            timer.lap('connect')
+            if method == 'GET':
+                params = event.get('queryStringParameters') or {}
+                
+                try:
+                    since_id = int(params['since_id']) if params.get('since_id') else None
+                    limit = min(int(params.get('limit') or MESSAGES_BOOTSTRAP_LIMIT), MESSAGES_SYNC_MAX)
+                    months = int(params.get('months') or MESSAGES_RECENT_MONTHS)
+                    if limit < 1 or months < 0 or months > MESSAGES_HISTORY_MONTHS_MAX:
+                        raise ValueError('limit or months out of range')
+                except ValueError:
+                    return json_response(400, {'error': 'Некорректные параметры синхронизации'})
+                
+                etag = get_messages_etag(cursor, months)
+                timer.lap('etag')
+                if etag_matches(get_header(event, 'If-None-Match'), etag):
+                    return {
+                        'statusCode': 304,
+                        'headers': {**NOT_MODIFIED_HEADERS, 'ETag': etag},
+                        'body': '',
+                        'isBase64Encoded': False
+                    }
+                
+                timer.route = 'GET sync' if since_id is not None else 'GET bootstrap'
+                # Окно по created_at отсекает секции старше текущего месяца и months предыдущих,
+                # так что запрос не растёт вместе с историей чата
+                if since_id is not None:
+                    # Дельта после водяного знака клиента, по возрастанию id, вместе с окном
+                    # перекрытия ниже него: там могли появиться строки поздно закоммиченных вставок
+                    rows = fetch_messages_after(cursor, since_id, months, limit + 1, MESSAGES_SYNC_OVERLAP)
+                    timer.lap('query')
+                    overlap = sum(1 for row in rows if row[0] <= since_id)
+                else:
+                    # Первая загрузка: только последние limit сообщений
+                    cursor.execute('''
+                        SELECT id, author, text, 
+                               TO_CHAR(created_at, 'HH24:MI') as time
+                        FROM messages 
+                        WHERE created_at >= date_trunc('month', LOCALTIMESTAMP) - make_interval(months => %s)
+                        ORDER BY id DESC
+                        LIMIT %s
+                    ''', (months, limit + 1))
+                    timer.lap('query')
+                    rows = cursor.fetchall()
+                    rows.reverse()
+                
+                if since_id is not None:
+                    has_more = len(rows) - overlap > limit
+                    rows = rows[:overlap + limit]
+                else:
+                    has_more = len(rows) > limit
+                    rows = rows[1:] if has_more else rows
+                
+                timer.lap('fetch')
+                messages = rows_to_dicts(cursor, rows)
+                timer.lap('map')
+                timer.fields['rows'] = len(messages)
+                last_id = max(rows[-1][0], since_id or 0) if rows else since_id
+                
+                return json_response(200, {'messages': messages, 'last_id': last_id, 'has_more': has_more}, {**VERSIONED_HEADERS, 'ETag': etag})
             
-            cursor.close()
-            conn.close()
-            
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'messages': messages}, ensure_ascii=False),
-                'isBase64Encoded': False
-            }
-        
-        elif method == 'POST':
-            body_data = json.loads(event.get('body', '{}'))
-            author = body_data.get('author', 'Аноним')
-            text = body_data.get('text', '')
-            
-            if not text:
-                return {
-                    'statusCode': 400,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({'error': 'Текст сообщения обязателен'}, ensure_ascii=False),
-                    'isBase64Encoded': False
-                }
-            
-            cursor.execute('''
-                INSERT INTO messages (author, text) 
-                VALUES (%s, %s) 
-                RETURNING id, author, text, TO_CHAR(created_at, 'HH24:MI') as time
-            ''', (author, text))
-            
-            conn.commit()
-            row = cursor.fetchone()
-            
-            new_message = {
-                'id': row[0],
-                'author': row[1],
-                'text': row[2],
-                'time': row[3]
-            }
-            
-            cursor.close()
-            conn.close()
-            
-            return {
-                'statusCode': 201,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'message': new_message}, ensure_ascii=False),
-                'isBase64Encoded': False
-            }
-        
-        else:
-            return {
-                'statusCode': 405,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'error': 'Метод не поддерживается'}, ensure_ascii=False),
-                'isBase64Encoded': False
-            }
+            elif method == 'POST':
+                body_data = json.loads(event.get('body', '{}'))
+                author = body_data.get('author', 'Аноним')
+                text = body_data.get('text', '')
+                
+                if not text:
+                    return json_response(400, {'error': 'Текст сообщения обязателен'})
+                
+                cursor.execute('''
+                    INSERT INTO messages (author, text) 
+                    VALUES (%s, %s) 
+                    RETURNING id, author, text, TO_CHAR(created_at, 'HH24:MI') as time
+                ''', (author, text))
+                new_message = rows_to_dicts(cursor, cursor.fetchall())[0]
+                
+                # Уведомление уходит подписчикам gateway.py только при фиксации транзакции;
+                # слишком длинное сообщение (предел NOTIFY — 8000 байт) шлюз дочитает из базы по id
+                payload = dumps(new_message)
+                if len(payload.encode('utf-8')) > NOTIFY_PAYLOAD_MAX:
+                    payload = dumps({'id': new_message['id']})
+                cursor.execute('SELECT pg_notify(%s, %s)', (MESSAGES_CHANNEL, payload))
+                conn.commit()
+                timer.lap('query')
+                
+                return json_response(201, {'message': new_message})
     
+    except psycopg2.OperationalError as e:
+        if timer.fields.get('db') != 'replica':
+            timer.fail(e)
+            return json_response(500, {'error': str(e)})
+        # Реплика отвалилась посреди чтения: повторяем запрос, read_connection отдаст primary
+        mark_replica_down(e, timer)
+        return route_request(event, timer)
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': str(e)}, ensure_ascii=False),
-            'isBase64Encoded': False
-        }
+        timer.fail(e)
+        return json_response(500, {'error': str(e)})
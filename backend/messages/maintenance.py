@@ -0,0 +1,102 @@
+"""
+Обслуживание помесячных секций messages, запускается по расписанию отдельно от HTTP-функции:
+    python maintenance.py [--ahead 2] [--retention 12] [--dry-run]
+Создаёт секции на --ahead месяцев вперёд, отсоединяет секции старше текущего месяца
+и --retention предыдущих, выгружает их в archive/messages/<YYYY-MM>.ndjson.gz и только
+после успешной выгрузки удаляет таблицу. Архив пишется в бакет S3_BUCKET_NAME (нужен boto3,
+как в upload-to-s3) или в каталог OBJECT_STORE_DIR при локальном запуске.
+"""
+import argparse
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from typing import Any, BinaryIO, Dict
+
+from index import (
+    MESSAGES_PARTITIONS_AHEAD, MESSAGES_RETENTION_MONTHS, db_connection, detach_message_partition,
+    detached_message_partitions, ensure_message_partitions, expired_message_partitions
+)
+
+ARCHIVE_PREFIX = 'archive/messages/'
+ARCHIVE_ITERSIZE = 5000
+SPOOL_MAX_MEMORY = 16 * 1024 * 1024
+
+def upload_archive(key: str, spool: BinaryIO) -> str:
+    """Кладёт готовый архив в каталог OBJECT_STORE_DIR или в бакет; возвращает, куда"""
+    spool.seek(0)
+    root = os.environ.get('OBJECT_STORE_DIR')
+    if root:
+        path = os.path.join(root, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            shutil.copyfileobj(spool, f)
+        return path
+    import boto3
+    bucket_name = os.environ.get('S3_BUCKET_NAME', 'pedagogical-forum-files')
+    s3_client = boto3.client(
+        's3',
+        endpoint_url=os.environ.get('S3_ENDPOINT_URL', 'https://storage.yandexcloud.net'),
+        aws_access_key_id=os.environ.get('AWS_ACCESS_KEY_ID'),
+        aws_secret_access_key=os.environ.get('AWS_SECRET_ACCESS_KEY'),
+        region_name=os.environ.get('AWS_REGION', 'ru-central1')
+    )
+    s3_client.upload_fileobj(spool, bucket_name, key, ExtraArgs={
+        'ContentType': 'application/x-ndjson',
+        'ContentEncoding': 'gzip'
+    })
+    return f's3://{bucket_name}/{key}'
+
+def archive_partition(conn: Any, partition_name: str) -> Dict[str, Any]:
+    """Выгружает отсоединённую секцию в сжатый NDJSON серверным курсором и удаляет её таблицу"""
+    month = f'{partition_name[-6:-2]}-{partition_name[-2:]}'
+    rows = 0
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY) as spool:
+        with gzip.GzipFile(fileobj=spool, mode='wb') as archive:
+            with conn.cursor(name=f'archive_{partition_name}') as cursor:
+                cursor.itersize = ARCHIVE_ITERSIZE
+                cursor.execute(f'SELECT id, author, text, created_at FROM {partition_name} ORDER BY id')
+                for row_id, author, text, created_at in cursor:
+                    line = json.dumps({'id': row_id, 'author': author, 'text': text, 'created_at': created_at.isoformat()}, ensure_ascii=False)
+                    archive.write(line.encode('utf-8') + b'\n')
+                    rows += 1
+        archived_bytes = spool.tell()
+        location = upload_archive(f'{ARCHIVE_PREFIX}{month}.ndjson.gz', spool)
+    with conn.cursor() as cursor:
+        cursor.execute(f'DROP TABLE {partition_name}')
+    conn.commit()
+    return {'partition': partition_name, 'rows': rows, 'bytes': archived_bytes, 'location': location}
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Секции и архивация сообщений чата')
+    parser.add_argument('--ahead', type=int, default=MESSAGES_PARTITIONS_AHEAD, help='на сколько месяцев вперёд создавать секции')
+    parser.add_argument('--retention', type=int, default=MESSAGES_RETENTION_MONTHS, help='сколько прошлых месяцев держать в базе')
+    parser.add_argument('--dry-run', action='store_true', help='только показать, что будет отсоединено')
+    args = parser.parse_args()
+
+    report: Dict[str, Any] = {}
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            if args.dry_run:
+                print(json.dumps({
+                    'expired': expired_message_partitions(cursor, args.retention),
+                    'detached': detached_message_partitions(cursor)
+                }, ensure_ascii=False))
+                return
+            # Сначала секции: строки старых месяцев из секции по умолчанию получают свою
+            # и попадают под срок хранения в этом же запуске
+            report['created'] = ensure_message_partitions(cursor, args.ahead)
+            conn.commit()
+            expired = expired_message_partitions(cursor, args.retention)
+            for partition_name in expired:
+                detach_message_partition(cursor, partition_name)
+                conn.commit()
+            report['detached'] = expired
+            pending = detached_message_partitions(cursor)
+        # Секции, отсоединённые прошлым прерванным запуском, архивируются здесь же
+        report['archived'] = [archive_partition(conn, partition_name) for partition_name in pending]
+    print(json.dumps(report, ensure_ascii=False))
+
+if __name__ == '__main__':
+    main()
@@ -1,48 +1,396 @@
 import json
 import os
 import base64
+import gzip
+import hashlib
 import mimetypes
-from typing import Dict, Any, List
-import PyPDF2
-import docx
+import re
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+from typing import Dict, Any, BinaryIO, Iterator, List, Mapping, Optional, Tuple, Union
+from urllib.parse import quote
 import io
-from docx.oxml.table import CT_Tbl
-from docx.oxml.text.paragraph import CT_P
-from docx.table import _Cell, Table
-from docx.text.paragraph import Paragraph
+import tempfile
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
+import psycopg2
+import psycopg2.pool
 
-def extract_content_from_pdf(file_content: bytes) -> Dict[str, Any]:
-    """Extract text and images from PDF file"""
+# PyPDF2, python-docx, boto3 и пул процессов импортируются при первом файле своего формата,
+# чтобы холодный старт на .txt не платил за разборщики, которые ему не нужны
+
+S3_ENDPOINT = os.environ.get('S3_ENDPOINT_URL', 'https://storage.yandexcloud.net')
+SPOOL_MAX_MEMORY = 16 * 1024 * 1024
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '5'))
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '0') == '1'
+REQUEST_LOG = os.environ.get('REQUEST_LOG', '0') == '1'
+FileSource = Union[bytes, BinaryIO]
+ALLOWED_METHODS = ('GET', 'POST', 'OPTIONS')
+
+# Шаблоны заголовков собираются один раз на экземпляр; ответы получают свою копию
+JSON_HEADERS = MappingProxyType({
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*'
+})
+PREFLIGHT_HEADERS = MappingProxyType({
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': ', '.join(ALLOWED_METHODS),
+    'Access-Control-Allow-Headers': 'Content-Type',
+    'Access-Control-Max-Age': '86400'
+})
+
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', '4'))
+DB_POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', '30'))
+
+_pool: Optional[psycopg2.pool.ThreadedConnectionPool] = None
+_last_used: Dict[int, float] = {}
+
+def get_pool() -> psycopg2.pool.ThreadedConnectionPool:
+    """Пул соединений, переживающий тёплые вызовы функции"""
+    global _pool
+    if _pool is None or _pool.closed:
+        _pool = psycopg2.pool.ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, os.environ.get('DATABASE_URL'))
+    return _pool
+
+def is_connection_healthy(conn: Any) -> bool:
+    """Проверяет соединение перед повторным использованием; пингует только долго простаивавшие"""
+    if conn.closed:
+        return False
+    idle = time.monotonic() - _last_used.get(id(conn), 0.0)
+    if idle < DB_POOL_PING_AFTER:
+        return True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+@contextmanager
+def db_connection() -> Iterator[Any]:
+    """Выдаёт соединение из пула и возвращает его обратно на любом пути выхода"""
+    pool = get_pool()
+    conn = pool.getconn()
+    if not is_connection_healthy(conn):
+        _last_used.pop(id(conn), None)
+        pool.putconn(conn, close=True)
+        conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        discard = bool(conn.closed)
+        if not discard:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        if discard:
+            _last_used.pop(id(conn), None)
+        else:
+            _last_used[id(conn)] = time.monotonic()
+        pool.putconn(conn, close=discard)
+
+def as_stream(source: FileSource) -> BinaryIO:
+    """Файл из тела запроса (bytes) или поток из хранилища приводится к seekable-потоку"""
+    if isinstance(source, bytes):
+        return io.BytesIO(source)
+    source.seek(0)
+    return source
+
+def as_bytes(source: FileSource) -> bytes:
+    return source if isinstance(source, bytes) else as_stream(source).read()
+
+PDF_WORKERS = int(os.environ.get('PDF_WORKERS', str(min(4, len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1))))
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get('PDF_PARALLEL_MIN_PAGES', '40'))
+
+class PageSpecError(ValueError):
+    """Некорректные pages/maxPages в запросе"""
+
+def parse_page_spec(spec: Any, total_pages: int) -> List[int]:
+    """Разбирает номера страниц вида "1-5,8" (с единицы) в отсортированные индексы с нуля"""
+    if spec is None or spec == '':
+        return list(range(total_pages))
+    parts = spec if isinstance(spec, list) else str(spec).split(',')
+    indexes = set()
+    for part in parts:
+        part = str(part).strip()
+        try:
+            if '-' in part:
+                start, end = (int(bound) for bound in part.split('-', 1))
+            else:
+                start = end = int(part)
+        except ValueError:
+            raise PageSpecError(f'Некорректный диапазон страниц: {part}')
+        if start < 1 or end < start:
+            raise PageSpecError(f'Некорректный диапазон страниц: {part}')
+        indexes.update(range(start - 1, min(end, total_pages)))
+    return sorted(indexes)
+
+def pdf_page_to_html(page: Any) -> str:
+    """HTML-фрагмент одной страницы: по абзацу на непустую строку"""
+    lines = (line.strip() for line in (page.extract_text() or '').split('\n'))
+    return '\n'.join(f'<p>{line}</p>' for line in lines if line)
+
+def iter_pdf_pages_html(pdf_reader: Any, page_indexes: List[int]) -> Iterator[str]:
+    """Отдаёт HTML постранично, не накапливая текст всего документа"""
+    for index in page_indexes:
+        chunk = pdf_page_to_html(pdf_reader.pages[index])
+        if chunk:
+            yield chunk
+
+def extract_pdf_page_range(file_content: bytes, page_indexes: List[int]) -> List[str]:
+    """Задача для процесса-воркера: извлекает свой диапазон страниц"""
+    import PyPDF2
     pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_content))
-    content = {
-        'html': '',
-        'images': []
+    return list(iter_pdf_pages_html(pdf_reader, page_indexes))
+
+def split_page_ranges(page_indexes: List[int], workers: int) -> List[List[int]]:
+    """Делит страницы на непрерывные диапазоны примерно равного размера"""
+    size = -(-len(page_indexes) // workers)
+    return [page_indexes[i:i + size] for i in range(0, len(page_indexes), size)]
+
+def extract_content_from_pdf(file_content: FileSource, pages: Any = None, max_pages: Optional[int] = None) -> Dict[str, Any]:
+    """Extract text from PDF file page by page, in parallel for large documents"""
+    import PyPDF2
+    from concurrent.futures import ProcessPoolExecutor
+    from concurrent.futures.process import BrokenProcessPool
+    pdf_reader = PyPDF2.PdfReader(as_stream(file_content))
+    page_indexes = parse_page_spec(pages, len(pdf_reader.pages))
+    if max_pages is not None:
+        if max_pages < 1:
+            raise PageSpecError('maxPages должен быть положительным')
+        page_indexes = page_indexes[:max_pages]
+    
+    html_parts: List[str] = []
+    if PDF_WORKERS > 1 and len(page_indexes) >= PDF_PARALLEL_MIN_PAGES:
+        try:
+            with ProcessPoolExecutor(max_workers=PDF_WORKERS) as executor:
+                ranges = split_page_ranges(page_indexes, PDF_WORKERS)
+                pdf_bytes = as_bytes(file_content)
+                for chunks in executor.map(extract_pdf_page_range, [pdf_bytes] * len(ranges), ranges):
+                    html_parts.extend(chunks)
+        except (OSError, NotImplementedError, BrokenProcessPool):
+            # В окружении без поддержки процессов (нет /dev/shm) разбираем последовательно
+            html_parts = list(iter_pdf_pages_html(pdf_reader, page_indexes))
+    else:
+        html_parts = list(iter_pdf_pages_html(pdf_reader, page_indexes))
+    
+    return {
+        'html': '\n'.join(html_parts),
+        'images': [],
+        'pages': len(page_indexes),
+        'totalPages': len(pdf_reader.pages)
     }
+
+class LocalObjectStore:
+    """Каталог на диске вместо бакета: для локального запуска и тестов"""
     
-    text = ""
-    for page in pdf_reader.pages:
-        text += page.extract_text() + "\n\n"
+    def __init__(self, root: str, base_url: str):
+        self.root = root
+        self.base_url = base_url.rstrip('/')
     
-    # Convert text to HTML paragraphs
-    paragraphs = text.split('\n')
-    html_parts = []
-    for para in paragraphs:
-        para = para.strip()
-        if para:
-            html_parts.append(f'<p>{para}</p>')
+    def put_if_absent(self, key: str, data: bytes, content_type: str, file_name: Optional[str] = None) -> Tuple[str, bool]:
+        path = os.path.join(self.root, key)
+        existed = os.path.exists(path)
+        if not existed:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.tmp{os.getpid()}.{threading.get_ident()}'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return self.url(key), existed
     
-    content['html'] = '\n'.join(html_parts)
-    return content
+    def url(self, key: str) -> str:
+        return f'{self.base_url}/{key}'
+    
+    def open_stream(self, key: str) -> BinaryIO:
+        path = os.path.realpath(os.path.join(self.root, key))
+        if os.path.commonpath([path, os.path.realpath(self.root)]) != os.path.realpath(self.root):
+            raise ValueError(f'Ключ вне хранилища: {key}')
+        return open(path, 'rb')
+
+class S3ObjectStore:
+    """Бакет Object Storage; повторная загрузка одинакового содержимого пропускается"""
+    
+    def __init__(self, bucket_name: str):
+        import boto3
+        self.bucket_name = bucket_name
+        self.client = boto3.client(
+            's3',
+            endpoint_url=S3_ENDPOINT,
+            aws_access_key_id=os.environ.get('AWS_ACCESS_KEY_ID'),
+            aws_secret_access_key=os.environ.get('AWS_SECRET_ACCESS_KEY'),
+            region_name=os.environ.get('AWS_REGION', 'ru-central1')
+        )
+    
+    def put_if_absent(self, key: str, data: bytes, content_type: str, file_name: Optional[str] = None) -> Tuple[str, bool]:
+        from botocore.exceptions import ClientError
+        url = self.url(key)
+        try:
+            self.client.head_object(Bucket=self.bucket_name, Key=key)
+            return url, True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') not in ('404', 'NoSuchKey', 'NotFound'):
+                raise
+        extra = {'ContentDisposition': f"inline; filename*=UTF-8''{quote(file_name)}"} if file_name else {}
+        self.client.put_object(
+            Bucket=self.bucket_name,
+            Key=key,
+            Body=data,
+            ContentType=content_type,
+            CacheControl='public, max-age=31536000, immutable',
+            **extra
+        )
+        return url, False
+    
+    def url(self, key: str) -> str:
+        return f'{S3_ENDPOINT}/{self.bucket_name}/{key}'
+    
+    def open_stream(self, key: str) -> BinaryIO:
+        """Читает объект частями во временный файл: в памяти не больше SPOOL_MAX_MEMORY"""
+        body = self.client.get_object(Bucket=self.bucket_name, Key=key)['Body']
+        spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+        for chunk in body.iter_chunks(1024 * 1024):
+            spool.write(chunk)
+        spool.seek(0)
+        return spool
+
+_object_store: Optional[Any] = None
+
+def get_object_store() -> Any:
+    """Хранилище исходных файлов и изображений: OBJECT_STORE_DIR для локального каталога, иначе S3"""
+    global _object_store
+    if _object_store is None:
+        local_dir = os.environ.get('OBJECT_STORE_DIR')
+        if local_dir:
+            _object_store = LocalObjectStore(local_dir, os.environ.get('OBJECT_STORE_URL', f'file://{local_dir}'))
+        else:
+            _object_store = S3ObjectStore(os.environ.get('S3_BUCKET_NAME', 'pedagogical-forum-files'))
+    return _object_store
+
+def store_image(data: bytes, content_type: str) -> str:
+    """
+    Кладёт изображение под ключом по SHA-256 содержимого и возвращает его URL.
+    С DATABASE_URL изображение регистрируется в stored_objects без ссылок: ссылку берёт
+    статья, в которую его встроили, а невостребованные удаляет sweeper.py upload-to-s3.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    ext = (mimetypes.guess_extension(content_type) or '.bin').lstrip('.')
+    key = f'images/{digest[:2]}/{digest}.{ext}'
+    store = get_object_store()
+    if not os.environ.get('DATABASE_URL'):
+        url, _ = store.put_if_absent(key, data, content_type)
+        return url
+    
+    with db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute('DELETE FROM object_deletions WHERE key = %s', (key,))
+        cursor.execute('''
+            INSERT INTO stored_objects (key, sha256, size, content_type, refcount)
+            VALUES (%s, %s, %s, %s, 0)
+            ON CONFLICT (key) DO NOTHING
+            RETURNING key
+        ''', (key, digest, len(data), content_type))
+        if cursor.fetchone():
+            url, _ = store.put_if_absent(key, data, content_type)
+        else:
+            touch_images(cursor, [key])
+            url = store.url(key)
+        conn.commit()
+    return url
+
+def touch_images(cursor: Any, keys: List[str]) -> int:
+    """Продлевает жизнь изображениям без ссылок: sweeper отсчитывает срок от created_at.
+    Возвращает, сколько ключей ещё есть в индексе"""
+    cursor.execute('DELETE FROM object_deletions WHERE key = ANY(%s)', (keys,))
+    cursor.execute('UPDATE stored_objects SET created_at = CURRENT_TIMESTAMP WHERE key = ANY(%s)', (keys,))
+    return cursor.rowcount
+
+def images_available(result: Dict[str, Any]) -> bool:
+    """Изображения закешированного разбора могли быть удалены как невостребованные;
+    тогда результат считается промахом и документ разбирается заново"""
+    keys = list({match.group(0) for match in (IMAGE_KEY_PATTERN.search(image.get('url', '')) for image in result.get('images', [])) if match})
+    if not keys or not os.environ.get('DATABASE_URL'):
+        return True
+    with db_connection() as conn, conn.cursor() as cursor:
+        available = touch_images(cursor, keys) == len(keys)
+        conn.commit()
+    return available
+
+def store_original(file_content: bytes, file_name: str, file_ext: str, digest: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Сохраняет исходный файл под тем же ключом по SHA-256, что и upload-to-s3, и так же
+    ведёт счётчик ссылок в stored_objects при заданном DATABASE_URL; без неё — только head_object.
+    """
+    digest = digest or hashlib.sha256(file_content).hexdigest()
+    key = f'files/{digest[:2]}/{digest}.{file_ext}'
+    content_type = mimetypes.guess_type(file_name)[0] or 'application/octet-stream'
+    store = get_object_store()
+    if not os.environ.get('DATABASE_URL'):
+        url, existed = store.put_if_absent(key, file_content, content_type, file_name)
+        return {'url': url, 'key': key, 'sha256': digest, 'deduplicated': existed}
+    
+    with db_connection() as conn, conn.cursor() as cursor:
+        # Как в store_deduplicated upload-to-s3: строку очереди удаления держит sweeper,
+        # поэтому загрузка дождётся удаления объекта и запишет его заново
+        cursor.execute('DELETE FROM object_deletions WHERE key = %s', (key,))
+        cursor.execute('''
+            INSERT INTO stored_objects (key, sha256, size, content_type)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (key) DO UPDATE SET refcount = stored_objects.refcount + 1
+            RETURNING refcount
+        ''', (key, digest, len(file_content), content_type))
+        refcount = cursor.fetchone()[0]
+        if refcount == 1:
+            url, _ = store.put_if_absent(key, file_content, content_type, file_name)
+        else:
+            url = store.url(key)
+        conn.commit()
+    return {'url': url, 'key': key, 'sha256': digest, 'deduplicated': refcount > 1}
 
-def extract_content_from_docx(file_content: bytes) -> Dict[str, Any]:
-    """Extract text, tables and images from DOCX file"""
-    doc = docx.Document(io.BytesIO(file_content))
+def extract_content_from_docx(file_content: FileSource) -> Dict[str, Any]:
+    """Extract text, tables and images from DOCX file; images go to object storage"""
+    import docx
+    from docx.oxml.table import CT_Tbl
+    from docx.oxml.text.paragraph import CT_P
+    from docx.table import Table
+    from docx.text.paragraph import Paragraph
+    doc = docx.Document(as_stream(file_content))
     content = {
         'html': '',
         'images': []
     }
     
     html_parts = []
+    image_urls: Dict[str, Optional[str]] = {}
+    
+    def image_url(rel_id: str) -> Optional[str]:
+        # Каждое изображение выгружается один раз, даже если вставлено в документ несколько раз
+        if rel_id not in image_urls:
+            image_urls[rel_id] = None
+            try:
+                part = doc.part.related_parts[rel_id]
+                url = store_image(part.blob, part.content_type)
+                image_urls[rel_id] = url
+                if all(image['url'] != url for image in content['images']):
+                    content['images'].append({'url': url, 'type': part.content_type})
+            except:
+                pass
+        return image_urls[rel_id]
     
     # Process document body elements in order
     for element in doc.element.body:
@@ -61,6 +409,12 @@ def extract_content_from_docx(file_content: bytes) -> Dict[str, Any]:
                         html_parts.append(f'<p><strong>{text}</strong></p>')
                 else:
                     html_parts.append(f'<p>{text}</p>')
+            
+            # Images inline with the paragraph, at their position in the document
+            for rel_id in element.xpath('.//a:blip/@r:embed'):
+                url = image_url(rel_id)
+                if url:
+                    html_parts.append(f'<p><img src="{url}" alt="" loading="lazy" style="max-width: 100%;"></p>')
         
         elif isinstance(element, CT_Tbl):
             # Table
@@ -80,19 +434,10 @@ def extract_content_from_docx(file_content: bytes) -> Dict[str, Any]:
             
             html_parts.append('</table>')
     
-    # Extract images
-    for rel in doc.part.rels.values():
-        if "image" in rel.target_ref:
-            try:
-                image_data = rel.target_part.blob
-                image_base64 = base64.b64encode(image_data).decode('utf-8')
-                content_type = rel.target_part.content_type
-                content['images'].append({
-                    'data': f'data:{content_type};base64,{image_base64}',
-                    'type': content_type
-                })
-            except:
-                pass
+    # Images outside body paragraphs (tables, headers) are still listed
+    for rel_id, rel in doc.part.rels.items():
+        if "image" in rel.reltype:
+            image_url(rel_id)
     
     content['html'] = '\n'.join(html_parts)
     return content
@@ -104,106 +449,525 @@ def extract_text_from_txt(file_content: bytes) -> str:
     except:
         return file_content.decode('cp1251')
 
+SUPPORTED_EXTENSIONS = ('pdf', 'docx', 'doc', 'txt', 'rtf', 'odt')
+# Кешируется только дорогой разбор PyPDF2/python-docx; текст дешевле разобрать заново, чем сходить в кеш
+CACHED_EXTENSIONS = ('pdf', 'docx', 'doc')
+
+def extract_content(file_content: FileSource, file_ext: str, pages: Any = None, max_pages: Optional[int] = None) -> Dict[str, Any]:
+    """Выбирает извлекатель по расширению файла"""
+    if file_ext == 'pdf':
+        return extract_content_from_pdf(file_content, pages, max_pages)
+    if file_ext in ['docx', 'doc']:
+        return extract_content_from_docx(file_content)
+    text = extract_text_from_txt(as_bytes(file_content))
+    paragraphs = text.split('\n')
+    html_parts = [f'<p>{p.strip()}</p>' for p in paragraphs if p.strip()]
+    return {
+        'html': '\n'.join(html_parts),
+        'images': []
+    }
+
+# Версия извлекателей входит в ключ кеша: после изменения разбора её нужно поднять,
+# и старые записи перестанут находиться
+EXTRACTOR_VERSION = '2026.10.1'
+EXTRACTION_CACHE_SIZE = int(os.environ.get('EXTRACTION_CACHE_SIZE', '64'))
+CONTENT_KEY_PATTERN = re.compile(r'^files/[0-9a-f]{2}/([0-9a-f]{64})\.[a-z0-9]+$')
+IMAGE_KEY_PATTERN = re.compile(r'images/[0-9a-f]{2}/[0-9a-f]{64}\.[a-z0-9]+')
+
+CacheKey = Tuple[str, str, str]
+
+class MemoryExtractionCache:
+    """LRU-кеш результатов в памяти экземпляра, если база не настроена"""
+    
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[CacheKey, Tuple[Dict[str, Any], int]]' = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: CacheKey) -> Optional[Tuple[Dict[str, Any], int]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+    
+    def put(self, key: CacheKey, result: Dict[str, Any], extract_ms: int) -> None:
+        with self._lock:
+            self._entries[key] = (result, extract_ms)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+class PostgresExtractionCache:
+    """Кеш в таблице extraction_cache, общий для всех экземпляров функции"""
+    
+    def get(self, key: CacheKey) -> Optional[Tuple[Dict[str, Any], int]]:
+        with db_connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                'UPDATE extraction_cache SET hits = hits + 1 '
+                'WHERE sha256 = %s AND extractor_version = %s AND variant = %s '
+                'RETURNING result, extract_ms',
+                key
+            )
+            row = cursor.fetchone()
+            conn.commit()
+        return (row[0], row[1]) if row else None
+    
+    def put(self, key: CacheKey, result: Dict[str, Any], extract_ms: int) -> None:
+        with db_connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO extraction_cache (sha256, extractor_version, variant, result, extract_ms) '
+                'VALUES (%s, %s, %s, %s, %s) ON CONFLICT DO NOTHING',
+                (*key, json.dumps(result, ensure_ascii=False), extract_ms)
+            )
+            conn.commit()
+
+_extraction_cache: Optional[Any] = None
+cache_stats = {'hits': 0, 'misses': 0, 'errors': 0, 'time_saved_ms': 0}
+_cache_stats_lock = threading.Lock()
+
+def get_extraction_cache() -> Any:
+    """Postgres при заданном DATABASE_URL, иначе кеш в памяти экземпляра"""
+    global _extraction_cache
+    if _extraction_cache is None:
+        if os.environ.get('DATABASE_URL'):
+            _extraction_cache = PostgresExtractionCache()
+        else:
+            _extraction_cache = MemoryExtractionCache(EXTRACTION_CACHE_SIZE)
+    return _extraction_cache
+
+def count_cache(field: str, amount: int = 1) -> None:
+    with _cache_stats_lock:
+        cache_stats[field] += amount
+
+def format_page_spec(pages: Any) -> str:
+    return ','.join(str(part) for part in pages) if isinstance(pages, list) else str(pages or '')
+
+def extraction_cache_key(digest: str, file_ext: str, pages: Any, max_pages: Optional[int]) -> CacheKey:
+    """Вариант разбора (формат, страницы, лимит) — часть ключа наравне с хешем содержимого"""
+    return (digest, EXTRACTOR_VERSION, f'{file_ext}|{format_page_spec(pages)}|{max_pages or ""}')
+
+def cached_extraction(key: CacheKey) -> Optional[Dict[str, Any]]:
+    """Ищет готовый результат; сбой кеша не должен ломать загрузку, поэтому считается промахом"""
+    try:
+        entry = get_extraction_cache().get(key)
+    except psycopg2.Error:
+        count_cache('errors')
+        entry = None
+    if entry is not None:
+        try:
+            if not images_available(entry[0]):
+                entry = None
+        except psycopg2.Error:
+            count_cache('errors')
+            entry = None
+    if entry is None:
+        count_cache('misses')
+        return None
+    result, extract_ms = entry
+    count_cache('hits')
+    count_cache('time_saved_ms', extract_ms)
+    return result
+
+def extract_and_cache(key: Optional[CacheKey], file_content: FileSource, file_ext: str, pages: Any, max_pages: Optional[int]) -> Dict[str, Any]:
+    started = time.perf_counter()
+    result = extract_content(file_content, file_ext, pages, max_pages)
+    extract_ms = int((time.perf_counter() - started) * 1000)
+    if key is None:
+        return result
+    try:
+        get_extraction_cache().put(key, result, extract_ms)
+    except psycopg2.Error:
+        count_cache('errors')
+    return result
+
+def get_cache_stats() -> Dict[str, Any]:
+    with _cache_stats_lock:
+        stats = dict(cache_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+    stats['extractor_version'] = EXTRACTOR_VERSION
+    stats['backend'] = type(get_extraction_cache()).__name__
+    return stats
+
+EXTRACTION_JOB_ATTEMPTS = int(os.environ.get('EXTRACTION_JOB_ATTEMPTS', '3'))
+EXTRACTION_JOB_LEASE = int(os.environ.get('EXTRACTION_JOB_LEASE', '600'))
+EXTRACTION_JOB_RETRY_DELAY = int(os.environ.get('EXTRACTION_JOB_RETRY_DELAY', '30'))
+JOB_FIELDS = ('id', 'object_key', 'file_name', 'pages', 'max_pages', 'attempts', 'max_attempts')
+
+def enqueue_extraction_job(object_key: str, file_name: str, pages: Any, max_pages: Optional[int]) -> int:
+    """Ставит файл из хранилища в очередь на разбор и сразу возвращает id задания"""
+    with db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO extraction_jobs (object_key, file_name, pages, max_pages, max_attempts) '
+            'VALUES (%s, %s, %s, %s, %s) RETURNING id',
+            (object_key, file_name, format_page_spec(pages) or None, max_pages, EXTRACTION_JOB_ATTEMPTS)
+        )
+        job_id = cursor.fetchone()[0]
+        conn.commit()
+    return job_id
+
+def get_extraction_job(job_id: int) -> Optional[Dict[str, Any]]:
+    with db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            'SELECT id, status, file_name, attempts, max_attempts, result, error FROM extraction_jobs WHERE id = %s',
+            (job_id,)
+        )
+        row = cursor.fetchone()
+    if not row:
+        return None
+    return dict(zip(('id', 'status', 'file_name', 'attempts', 'max_attempts', 'result', 'error'), row))
+
+def claim_extraction_job() -> Optional[Dict[str, Any]]:
+    """Забирает следующее задание; SKIP LOCKED позволяет исполнителям не ждать друг друга.
+    Задание упавшего исполнителя снова становится доступным, когда истекает его аренда."""
+    with db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            "UPDATE extraction_jobs SET status = 'failed', error = COALESCE(error, 'Время обработки истекло'), "
+            "locked_until = NULL, updated_at = NOW() "
+            "WHERE status = 'running' AND locked_until < NOW() AND attempts >= max_attempts"
+        )
+        cursor.execute(
+            "UPDATE extraction_jobs SET status = 'running', attempts = attempts + 1, "
+            "locked_until = NOW() + %s * INTERVAL '1 second', updated_at = NOW() "
+            "WHERE id = ("
+            "    SELECT id FROM extraction_jobs "
+            "    WHERE status IN ('pending', 'running') AND attempts < max_attempts "
+            "      AND (locked_until IS NULL OR locked_until < NOW()) "
+            "    ORDER BY id LIMIT 1 FOR UPDATE SKIP LOCKED"
+            f") RETURNING {', '.join(JOB_FIELDS)}",
+            (EXTRACTION_JOB_LEASE,)
+        )
+        row = cursor.fetchone()
+        conn.commit()
+    return dict(zip(JOB_FIELDS, row)) if row else None
+
+def finish_extraction_job(job: Dict[str, Any], result: Optional[Dict[str, Any]] = None, error: Optional[str] = None, retry: bool = False) -> None:
+    """Сохраняет итог; при повторе задание возвращается в очередь с задержкой.
+    Условие на attempts не даёт опоздавшему исполнителю перезаписать чужую попытку."""
+    status = 'done' if error is None else ('pending' if retry else 'failed')
+    with db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            "UPDATE extraction_jobs SET status = %s, result = %s, error = %s, "
+            "locked_until = CASE WHEN %s THEN NOW() + %s * INTERVAL '1 second' END, updated_at = NOW() "
+            "WHERE id = %s AND attempts = %s",
+            (
+                status,
+                json.dumps(result, ensure_ascii=False) if result is not None else None,
+                error,
+                status == 'pending',
+                EXTRACTION_JOB_RETRY_DELAY * job['attempts'],
+                job['id'],
+                job['attempts']
+            )
+        )
+        conn.commit()
+
+def run_extraction_job(job: Dict[str, Any]) -> None:
+    """Разбирает файл задания через тот же кеш, что и синхронная загрузка"""
+    file_ext = job['file_name'].lower().split('.')[-1]
+    try:
+        key_match = CONTENT_KEY_PATTERN.match(job['object_key'])
+        cache_key = extraction_cache_key(key_match.group(1), file_ext, job['pages'], job['max_pages']) if key_match and file_ext in CACHED_EXTENSIONS else None
+        result = cached_extraction(cache_key) if cache_key else None
+        if result is None:
+            file_content = get_object_store().open_stream(job['object_key'])
+            try:
+                result = extract_and_cache(cache_key, file_content, file_ext, job['pages'], job['max_pages'])
+            finally:
+                file_content.close()
+    except PageSpecError as e:
+        finish_extraction_job(job, error=f'Некорректные параметры страниц: {str(e)}')
+    except Exception as e:
+        finish_extraction_job(job, error=f'Ошибка обработки файла: {str(e)}', retry=job['attempts'] < job['max_attempts'])
+    else:
+        finish_extraction_job(job, result=result)
+
+def work_extraction_jobs(max_jobs: Optional[int] = None) -> int:
+    """Выполняет задания, пока очередь не опустеет; возвращает число обработанных"""
+    processed = 0
+    while max_jobs is None or processed < max_jobs:
+        job = claim_extraction_job()
+        if job is None:
+            break
+        run_extraction_job(job)
+        processed += 1
+    return processed
+
+class RequestTimer:
+    """
+    Разбивка времени запроса по фазам: отрезок от предыдущей отметки lap() записывается
+    под именем фазы. Выключенный таймер ничего не замеряет, ошибки запоминаются всегда.
+    """
+    
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self.route = ''
+        self.fields: Dict[str, Any] = {}
+        self.phases: Dict[str, float] = {}
+        self.error: Optional[str] = None
+        self._started = self._last = time.perf_counter() if enabled else 0.0
+    
+    def lap(self, phase: str) -> None:
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + (now - self._last) * 1000
+        self._last = now
+    
+    def fail(self, error: Exception) -> None:
+        """Вызывается из except: в ответ уходит только текст ошибки, трассировка попадает в лог"""
+        self.error = f'{type(error).__name__}: {error}'
+        self.fields['traceback'] = traceback.format_exc()
+    
+    def finish(self, context: Any, response: Dict[str, Any]) -> Dict[str, Any]:
+        """Добавляет Server-Timing и пишет в stdout одну JSON-строку о запросе"""
+        if not self.enabled and self.error is None:
+            return response
+        self.lap('respond')
+        total = (self._last - self._started) * 1000
+        if SERVER_TIMING:
+            timing = ', '.join(f'{name};dur={ms:.1f}' for name, ms in self.phases.items())
+            response = {**response, 'headers': {
+                **response['headers'],
+                'Server-Timing': f'{timing}, total;dur={total:.1f}' if timing else f'total;dur={total:.1f}',
+                'Timing-Allow-Origin': '*'
+            }}
+        if REQUEST_LOG or self.error is not None:
+            body = response.get('body') or ''
+            print(json.dumps({
+                'request_id': getattr(context, 'request_id', None),
+                'route': self.route,
+                'status': response['statusCode'],
+                'bytes_out': len(body) if response.get('isBase64Encoded') else len(body.encode('utf-8')),
+                **({'duration_ms': round(total, 2), 'phases': {name: round(ms, 2) for name, ms in self.phases.items()}} if self.enabled else {}),
+                **({'error': self.error} if self.error is not None else {}),
+                **self.fields
+            }, ensure_ascii=False), flush=True)
+        return response
+
+def get_header(event: Dict[str, Any], name: str) -> Optional[str]:
+    """Регистронезависимое чтение заголовка запроса"""
+    lowered = name.lower()
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == lowered:
+            return value
+    return None
+
+def dumps(payload: Any) -> str:
+    """Тело JSON-ответа: orjson, если установлен, иначе стандартный json; кириллица в обоих случаях не экранируется"""
+    if orjson is not None:
+        return orjson.dumps(payload).decode('utf-8')
+    return json.dumps(payload, ensure_ascii=False)
+
+def json_response(status: int, payload: Any, headers: Mapping[str, str] = JSON_HEADERS) -> Dict[str, Any]:
+    return {
+        'statusCode': status,
+        'headers': dict(headers),
+        'body': dumps(payload),
+        'isBase64Encoded': False
+    }
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Выбирает br или gzip из Accept-Encoding; кодировки с q=0 запрещены клиентом"""
+    accepted: Dict[str, float] = {}
+    for item in (accept_encoding or '').split(','):
+        name, _, params = item.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in ('br', 'gzip'):
+        if encoding == 'br' and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get('*', 0.0)) > 0:
+            return encoding
+    return None
+
+def compress_body(body: str, encoding: str) -> str:
+    data = body.encode('utf-8')
+    if encoding == 'br':
+        compressed = brotli.compress(data, quality=BROTLI_QUALITY, mode=brotli.MODE_TEXT)
+    else:
+        compressed = gzip.compress(data, compresslevel=GZIP_LEVEL)
+    return base64.b64encode(compressed).decode('ascii')
+
+def encode_response(event: Dict[str, Any], response: Dict[str, Any], variants: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """
+    Сжимает JSON-ответ от COMPRESS_MIN_BYTES, если клиент принимает br или gzip; тело
+    уходит в base64 с Content-Encoding. variants хранит уже сжатые варианты закешированного
+    ответа, чтобы попадания в кеш не сжимали одно и то же заново.
+    """
+    body = response['body']
+    if response.get('isBase64Encoded') or len(body) < COMPRESS_MIN_BYTES:
+        return response
+    headers = {**response['headers'], 'Vary': 'Accept-Encoding'}
+    encoding = negotiate_encoding(get_header(event, 'Accept-Encoding'))
+    if not encoding:
+        return {**response, 'headers': headers}
+    encoded = variants.get(encoding) if variants is not None else None
+    if encoded is None:
+        encoded = compress_body(body, encoding)
+        if variants is not None:
+            variants[encoding] = encoded
+    headers['Content-Encoding'] = encoding
+    return {**response, 'headers': headers, 'body': encoded, 'isBase64Encoded': True}
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: API для загрузки и обработки файлов статей
-    Args: event с httpMethod, body с base64 файлом, fileName и fileType
-    Returns: HTTP response с извлечённым текстом
+    Args: event с httpMethod, body с base64 файлом, fileName и fileType; для PDF опционально pages ("1-5,8") и maxPages;
+          store=true дополнительно сохраняет исходный файл в хранилище; вместо file можно передать key
+          файла, уже загруженного в хранилище по подписанной ссылке upload-to-s3;
+          async=true ставит разбор в очередь и сразу отвечает 202 с jobId;
+          GET ?job=<jobId> возвращает состояние задания, GET без параметров — статистику кеша извлечения
+    Returns: HTTP response с извлечённым текстом (и url файла при store=true), cached=true при попадании в кеш;
+             большие ответы сжимаются по Accept-Encoding;
+             SERVER_TIMING=1 добавляет заголовок Server-Timing, REQUEST_LOG=1 пишет строку лога на запрос
     '''
+    timer = RequestTimer(SERVER_TIMING or REQUEST_LOG)
+    return timer.finish(context, route_request(event, timer))
+
+def route_request(event: Dict[str, Any], timer: RequestTimer) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'POST')
+    timer.route = method
     
     if method == 'OPTIONS':
         return {
             'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Access-Control-Max-Age': '86400'
-            },
+            'headers': dict(PREFLIGHT_HEADERS),
             'body': '',
             'isBase64Encoded': False
         }
     
+    if method == 'GET':
+        job_param = (event.get('queryStringParameters') or {}).get('job')
+        if job_param:
+            timer.route = 'GET job'
+            job = get_extraction_job(int(job_param)) if job_param.isdigit() else None
+            timer.lap('query')
+            if not job:
+                return json_response(404, {'error': 'Задание не найдено'})
+            result = job['result'] or {}
+            file_ext = job['file_name'].lower().split('.')[-1]
+            return encode_response(event, json_response(200, {
+                'jobId': job['id'],
+                'status': job['status'],
+                'attempts': job['attempts'],
+                'maxAttempts': job['max_attempts'],
+                **({'error': job['error']} if job['error'] and job['status'] != 'done' else {}),
+                **({
+                    'html': result.get('html', ''),
+                    'images': result.get('images', []),
+                    'fileName': job['file_name'],
+                    'fileType': file_ext,
+                    **({'pages': result['pages'], 'totalPages': result['totalPages']} if 'totalPages' in result else {})
+                } if job['status'] == 'done' else {})
+            }))
+        
+        # ?stats=cache: попадания в кеш извлечения и сэкономленное время на этом экземпляре
+        return json_response(200, {'cache': get_cache_stats()})
+    
     if method != 'POST':
-        return {
-            'statusCode': 405,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'Метод не поддерживается'}, ensure_ascii=False),
-            'isBase64Encoded': False
-        }
+        return json_response(405, {'error': 'Метод не поддерживается'})
     
     try:
         body_data = json.loads(event.get('body', '{}'))
         file_base64 = body_data.get('file', '')
+        object_key = body_data.get('key', '')
         file_name = body_data.get('fileName', '')
         file_type = body_data.get('fileType', '')
         
-        if not file_base64 or not file_name:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'error': 'Файл и имя файла обязательны'}, ensure_ascii=False),
-                'isBase64Encoded': False
-            }
+        # Принимается только ключ содержимого files/<xx>/<sha256>.<ext>: любой другой путь
+        # позволил бы читать чужие объекты или выйти за каталог локального хранилища
+        key_match = CONTENT_KEY_PATTERN.match(object_key) if isinstance(object_key, str) else None
+        if object_key and not key_match:
+            return json_response(400, {'error': 'Некорректный ключ файла'})
         
-        file_content = base64.b64decode(file_base64)
+        if not (file_base64 or key_match) or not file_name:
+            return json_response(400, {'error': 'Файл и имя файла обязательны'})
         
-        extracted_text = ""
         file_ext = file_name.lower().split('.')[-1]
+        timer.fields['file_type'] = file_ext
+        if file_ext not in SUPPORTED_EXTENSIONS:
+            return json_response(400, {'error': f'Неподдерживаемый формат: {file_ext}'})
         
-        result = {}
-        if file_ext == 'pdf':
-            result = extract_content_from_pdf(file_content)
-        elif file_ext in ['docx', 'doc']:
-            result = extract_content_from_docx(file_content)
-        elif file_ext in ['txt', 'rtf', 'odt']:
-            text = extract_text_from_txt(file_content)
-            paragraphs = text.split('\n')
-            html_parts = [f'<p>{p.strip()}</p>' for p in paragraphs if p.strip()]
-            result = {
-                'html': '\n'.join(html_parts),
-                'images': []
-            }
+        # Файл либо пришёл в теле запроса, либо уже загружен в хранилище напрямую из браузера;
+        # во втором случае хеш берётся из ключа, и при попадании в кеш файл даже не скачивается
+        file_content: Optional[FileSource] = None
+        if key_match:
+            digest = key_match.group(1)
         else:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'error': f'Неподдерживаемый формат: {file_ext}'}, ensure_ascii=False),
-                'isBase64Encoded': False
-            }
+            file_content = base64.b64decode(file_base64)
+            timer.lap('decode')
+            timer.fields['bytes_in'] = len(file_content)
+            digest = hashlib.sha256(file_content).hexdigest()
+            timer.lap('hash')
+        pages = body_data.get('pages')
         
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'html': result.get('html', ''),
-                'images': result.get('images', []),
-                'fileName': file_name,
-                'fileType': file_ext
-            }, ensure_ascii=False),
-            'isBase64Encoded': False
-        }
+        try:
+            try:
+                max_pages = int(body_data['maxPages']) if body_data.get('maxPages') else None
+            except (TypeError, ValueError):
+                raise PageSpecError('maxPages должен быть числом')
+            cache_key = extraction_cache_key(digest, file_ext, pages, max_pages) if digest and file_ext in CACHED_EXTENSIONS else None
+            result = cached_extraction(cache_key) if cache_key else None
+            from_cache = result is not None
+            timer.lap('cache')
+            timer.fields['cached'] = from_cache
+            
+            if body_data.get('async') and not from_cache:
+                # Долгий разбор уходит в очередь extraction_jobs: файл сохраняется в хранилище,
+                # а клиент опрашивает GET ?job=<jobId>, не упираясь в таймаут функции
+                timer.route = 'POST async'
+                if not object_key:
+                    object_key = store_original(file_content, file_name, file_ext, digest)['key']
+                    timer.lap('store')
+                job_id = enqueue_extraction_job(object_key, file_name, pages, max_pages)
+                timer.lap('enqueue')
+                return json_response(202, {'jobId': job_id, 'status': 'pending', 'key': object_key})
+            
+            timer.route = 'POST extract'
+            if file_content is None and not from_cache:
+                file_content = get_object_store().open_stream(object_key)
+                timer.lap('download')
+            
+            if body_data.get('store') and not object_key:
+                # Файл декодирован один раз: выгрузка в хранилище идёт параллельно с разбором
+                with ThreadPoolExecutor(max_workers=1) as executor:
+                    stored_future = executor.submit(store_original, file_content, file_name, file_ext, digest)
+                    if not from_cache:
+                        result = extract_and_cache(cache_key, file_content, file_ext, pages, max_pages)
+                        timer.lap('extract')
+                    stored = stored_future.result()
+                    timer.lap('store')
+            else:
+                if not from_cache:
+                    result = extract_and_cache(cache_key, file_content, file_ext, pages, max_pages)
+                    timer.lap('extract')
+                stored = {}
+        except PageSpecError as e:
+            return json_response(400, {'error': f'Некорректные параметры страниц: {str(e)}'})
+        finally:
+            if file_content is not None and not isinstance(file_content, bytes):
+                file_content.close()
+        
+        response = json_response(200, {
+            'html': result.get('html', ''),
+            'images': result.get('images', []),
+            'fileName': file_name,
+            'fileType': file_ext,
+            **({'pages': result['pages'], 'totalPages': result['totalPages']} if 'totalPages' in result else {}),
+            **({'cached': True} if from_cache else {}),
+            **stored
+        })
+        timer.lap('serialize')
+        
+        return encode_response(event, response)
     
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': f'Ошибка обработки файла: {str(e)}'}, ensure_ascii=False),
-            'isBase64Encoded': False
-        }
\ No newline at end of file
+        timer.fail(e)
+        return json_response(500, {'error': f'Ошибка обработки файла: {str(e)}'})
\ No newline at end of file
@@ -0,0 +1,48 @@
+"""
+Исполнитель очереди extraction_jobs, запускается отдельно от HTTP-функции:
+    python worker.py --concurrency 4
+Каждый процесс забирает задания через FOR UPDATE SKIP LOCKED, поэтому их можно
+запускать сколько угодно и на разных машинах.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+import psycopg2
+
+from index import work_extraction_jobs
+
+def work_loop(poll_interval: float, once: bool) -> None:
+    while True:
+        try:
+            processed = work_extraction_jobs()
+        except psycopg2.Error as e:
+            print(f'extraction worker {os.getpid()}: ошибка базы: {e}', file=sys.stderr, flush=True)
+            processed = 0
+        if once:
+            return
+        if not processed:
+            time.sleep(poll_interval)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Фоновый разбор загруженных файлов')
+    parser.add_argument('--concurrency', type=int, default=int(os.environ.get('EXTRACTION_WORKERS', '2')))
+    parser.add_argument('--poll-interval', type=float, default=2.0, help='пауза при пустой очереди, секунды')
+    parser.add_argument('--once', action='store_true', help='разобрать очередь и выйти')
+    args = parser.parse_args()
+    
+    # Разбор упирается в CPU, поэтому исполнители — процессы, а не потоки;
+    # не daemon, чтобы внутри по-прежнему работал пул процессов для больших PDF
+    workers = [
+        multiprocessing.Process(target=work_loop, args=(args.poll_interval, args.once))
+        for _ in range(max(1, args.concurrency))
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+if __name__ == '__main__':
+    main()
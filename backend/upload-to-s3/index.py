@@ -1,110 +1,542 @@
 import json
 import os
 import base64
-import boto3
-from typing import Dict, Any
+import hashlib
+import hmac
+import re
+import threading
+import time
 import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from types import MappingProxyType
+from typing import Dict, Any, Callable, Iterator, List, Mapping, Optional, Tuple
+from urllib.parse import quote
+
+import boto3
+from botocore.config import Config
+try:
+    import orjson
+except ImportError:
+    orjson = None
+import psycopg2
+import psycopg2.pool
+from botocore.exceptions import ClientError
+
+S3_ENDPOINT = os.environ.get('S3_ENDPOINT_URL', 'https://storage.yandexcloud.net')
+PRESIGN_EXPIRES = int(os.environ.get('PRESIGN_EXPIRES', '900'))
+MULTIPART_THRESHOLD = 64 * 1024 * 1024
+MULTIPART_PART_SIZE = 16 * 1024 * 1024
+MAX_UPLOAD_SIZE = 5 * 1024 * 1024 * 1024
+DELETE_OBJECTS_MAX = 1000
+STAGING_KEY_PATTERN = re.compile(r'^uploads/([0-9a-f]{32})-([0-9a-f]{32})/([\w.\-]{1,100})$')
+SWEEP_GRACE_SECONDS = int(os.environ.get('SWEEP_GRACE_SECONDS', '86400'))
+# Выгрузки функции export живут в том же бакете; ссылка на них действует час, файл хранится сутки
+EXPORT_RETENTION_SECONDS = int(os.environ.get('EXPORT_RETENTION_SECONDS', '86400'))
+CONTENT_KEY_REGEX = r'files/[0-9a-f]{2}/[0-9a-f]{64}\.\w+$'
+IMAGE_KEY_REGEX = r'images/[0-9a-f]{2}/[0-9a-f]{64}\.[a-z0-9]+'
+ALLOWED_METHODS = ('GET', 'POST', 'DELETE', 'OPTIONS')
+
+# Шаблоны заголовков собираются один раз на экземпляр; ответы получают свою копию
+JSON_HEADERS = MappingProxyType({
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*'
+})
+PREFLIGHT_HEADERS = MappingProxyType({
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': ', '.join(ALLOWED_METHODS),
+    'Access-Control-Allow-Headers': 'Content-Type',
+    'Access-Control-Max-Age': '86400'
+})
+DB_POOL_MIN = int(os.environ.get('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', '4'))
+DB_POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', '30'))
+
+_pool: Optional[psycopg2.pool.ThreadedConnectionPool] = None
+_last_used: Dict[int, float] = {}
+_stats_lock = threading.Lock()
+dedup_stats = {'uploads': 0, 'hits': 0, 'bytes_skipped': 0}
+
+def get_pool() -> psycopg2.pool.ThreadedConnectionPool:
+    """Пул соединений, переживающий тёплые вызовы функции"""
+    global _pool
+    if _pool is None or _pool.closed:
+        _pool = psycopg2.pool.ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, os.environ.get('DATABASE_URL'))
+    return _pool
+
+def is_connection_healthy(conn: Any) -> bool:
+    """Проверяет соединение перед повторным использованием; пингует только долго простаивавшие"""
+    if conn.closed:
+        return False
+    idle = time.monotonic() - _last_used.get(id(conn), 0.0)
+    if idle < DB_POOL_PING_AFTER:
+        return True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+@contextmanager
+def db_connection() -> Iterator[Any]:
+    """Выдаёт соединение из пула и возвращает его обратно на любом пути выхода"""
+    pool = get_pool()
+    conn = pool.getconn()
+    if not is_connection_healthy(conn):
+        _last_used.pop(id(conn), None)
+        pool.putconn(conn, close=True)
+        conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        discard = bool(conn.closed)
+        if not discard:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                discard = True
+        if discard:
+            _last_used.pop(id(conn), None)
+        else:
+            _last_used[id(conn)] = time.monotonic()
+        pool.putconn(conn, close=discard)
+
+def content_key(digest: str, file_ext: str) -> str:
+    """Ключ объекта по SHA-256 содержимого: одинаковые файлы хранятся один раз"""
+    return f'files/{digest[:2]}/{digest}.{file_ext.lower()}'
+
+def object_exists(s3_client: Any, bucket_name: str, key: str) -> bool:
+    try:
+        s3_client.head_object(Bucket=bucket_name, Key=key)
+        return True
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return False
+        raise
+
+def content_disposition(file_name: str) -> str:
+    return f"inline; filename*=UTF-8''{quote(file_name)}"
+
+def put_content(s3_client: Any, bucket_name: str, key: str, file_content: bytes, file_name: str, file_ext: str) -> None:
+    s3_client.put_object(
+        Bucket=bucket_name,
+        Key=key,
+        Body=file_content,
+        ContentType=get_content_type(file_ext),
+        ContentDisposition=content_disposition(file_name)
+    )
+
+def store_deduplicated(s3_client: Any, bucket_name: str, key: str, digest: str,
+                       size: int, file_ext: str, write: Callable[[], None]) -> bool:
+    """
+    Сохраняет объект через write(), если его ещё нет, и увеличивает счётчик ссылок.
+    С DATABASE_URL наличие проверяется по таблице stored_objects (строка блокирует
+    параллельную загрузку того же содержимого), без неё - через head_object.
+    Возвращает True, если загрузка была пропущена.
+    """
+    if not os.environ.get('DATABASE_URL'):
+        if object_exists(s3_client, bucket_name, key):
+            return True
+        write()
+        return False
+    
+    with db_connection() as conn, conn.cursor() as cursor:
+        # Ключ мог стоять в очереди на удаление. Пока sweeper разбирает очередь, её строка
+        # заблокирована, поэтому повторная загрузка дождётся удаления и запишет объект заново
+        cursor.execute('DELETE FROM object_deletions WHERE key = %s', (key,))
+        cursor.execute('''
+            INSERT INTO stored_objects (key, sha256, size, content_type)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (key) DO UPDATE SET refcount = stored_objects.refcount + 1
+            RETURNING refcount
+        ''', (key, digest, size, get_content_type(file_ext)))
+        refcount = cursor.fetchone()[0]
+        if refcount == 1:
+            write()
+        conn.commit()
+        return refcount > 1
+
+def record_upload(deduplicated: bool, size: int) -> None:
+    with _stats_lock:
+        dedup_stats['uploads'] += 1
+        if deduplicated:
+            dedup_stats['hits'] += 1
+            dedup_stats['bytes_skipped'] += size
+
+def staging_signature(nonce: str, safe_name: str) -> str:
+    """Подпись временного ключа: ключ UPLOAD_SIGNING_KEY, по умолчанию секрет доступа к бакету"""
+    secret = os.environ.get('UPLOAD_SIGNING_KEY') or os.environ.get('AWS_SECRET_ACCESS_KEY')
+    if not secret:
+        raise RuntimeError('Не задан UPLOAD_SIGNING_KEY для подписи временных ключей')
+    return hmac.new(secret.encode(), f'{nonce}/{safe_name}'.encode(), hashlib.sha256).hexdigest()[:32]
+
+def staging_key(file_name: str) -> str:
+    """Временный ключ для прямой загрузки из браузера до проверки содержимого"""
+    safe_name = re.sub(r'[^\w.\-]+', '_', file_name)[-100:]
+    nonce = uuid.uuid4().hex
+    return f'uploads/{nonce}-{staging_signature(nonce, safe_name)}/{safe_name}'
+
+def is_issued_staging_key(key: Any) -> bool:
+    """Завершать можно только загрузку по ключу, который выдал presign_upload"""
+    match = STAGING_KEY_PATTERN.match(key) if isinstance(key, str) else None
+    return bool(match) and hmac.compare_digest(match.group(2), staging_signature(match.group(1), match.group(3)))
+
+def presign_upload(s3_client: Any, bucket_name: str, file_name: str, size: int) -> Dict[str, Any]:
+    """
+    Выдаёт ссылки для загрузки файла напрямую в бакет, минуя функцию.
+    Дедупликация происходит в complete_upload, после того как сервер сам посчитает
+    sha256: по одному заявленному клиентом хешу ссылка на чужой файл не выдаётся.
+    Файлы больше MULTIPART_THRESHOLD загружаются частями по MULTIPART_PART_SIZE.
+    """
+    file_ext = file_name.split('.')[-1] if '.' in file_name else 'bin'
+    key = staging_key(file_name)
+    content_type = get_content_type(file_ext)
+    if size <= MULTIPART_THRESHOLD:
+        upload_url = s3_client.generate_presigned_url(
+            'put_object',
+            Params={'Bucket': bucket_name, 'Key': key, 'ContentType': content_type},
+            ExpiresIn=PRESIGN_EXPIRES
+        )
+        return {'exists': False, 'key': key, 'uploadUrl': upload_url, 'headers': {'Content-Type': content_type}}
+    
+    upload_id = s3_client.create_multipart_upload(Bucket=bucket_name, Key=key, ContentType=content_type)['UploadId']
+    part_count = -(-size // MULTIPART_PART_SIZE)
+    parts = [
+        {
+            'partNumber': number,
+            'url': s3_client.generate_presigned_url(
+                'upload_part',
+                Params={'Bucket': bucket_name, 'Key': key, 'UploadId': upload_id, 'PartNumber': number},
+                ExpiresIn=PRESIGN_EXPIRES
+            )
+        }
+        for number in range(1, part_count + 1)
+    ]
+    return {'exists': False, 'key': key, 'uploadId': upload_id, 'partSize': MULTIPART_PART_SIZE, 'parts': parts}
+
+def complete_upload(s3_client: Any, bucket_name: str, key: str, file_name: str, expected_digest: Optional[str],
+                    upload_id: Optional[str], parts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Завершает прямую загрузку: хеширует временный объект потоком, переносит его
+    под ключ по содержимому (copy_object внутри хранилища) и удаляет временный.
+    Если клиент прислал sha256, а содержимое с ним не совпало, файл не сохраняется.
+    """
+    if upload_id:
+        s3_client.complete_multipart_upload(
+            Bucket=bucket_name,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={'Parts': [{'PartNumber': int(part['partNumber']), 'ETag': part['etag']} for part in parts]}
+        )
+    
+    hasher = hashlib.sha256()
+    size = 0
+    body = s3_client.get_object(Bucket=bucket_name, Key=key)['Body']
+    for chunk in body.iter_chunks(1024 * 1024):
+        hasher.update(chunk)
+        size += len(chunk)
+    digest = hasher.hexdigest()
+    if expected_digest and expected_digest != digest:
+        s3_client.delete_object(Bucket=bucket_name, Key=key)
+        raise ValueError('Содержимое файла не совпадает с sha256')
+    file_ext = file_name.split('.')[-1] if '.' in file_name else 'bin'
+    final_key = content_key(digest, file_ext)
+    
+    def copy_from_staging() -> None:
+        s3_client.copy_object(
+            Bucket=bucket_name,
+            Key=final_key,
+            CopySource={'Bucket': bucket_name, 'Key': key},
+            ContentType=get_content_type(file_ext),
+            ContentDisposition=content_disposition(file_name),
+            MetadataDirective='REPLACE'
+        )
+    
+    deduplicated = store_deduplicated(s3_client, bucket_name, final_key, digest, size, file_ext, copy_from_staging)
+    s3_client.delete_object(Bucket=bucket_name, Key=key)
+    record_upload(deduplicated, size)
+    return {
+        'url': f'{S3_ENDPOINT}/{bucket_name}/{final_key}',
+        'fileName': file_name,
+        'key': final_key,
+        'sha256': digest,
+        'size': size,
+        'deduplicated': deduplicated
+    }
+
+def release_object(key: str) -> Tuple[bool, int]:
+    """Снимает одну ссылку. Объект без ссылок ставится в очередь object_deletions, как при
+    удалении статей и материалов: из бакета его удаляет drain_deletions уже после коммита"""
+    with db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute('''
+            UPDATE stored_objects SET refcount = refcount - 1
+            WHERE key = %s
+            RETURNING refcount
+        ''', (key,))
+        row = cursor.fetchone()
+        if row is None:
+            return False, 0
+        if row[0] <= 0:
+            cursor.execute('DELETE FROM stored_objects WHERE key = %s', (key,))
+            cursor.execute('INSERT INTO object_deletions (key) VALUES (%s) ON CONFLICT DO NOTHING', (key,))
+        conn.commit()
+        return True, max(row[0], 0)
+
+def delete_keys(s3_client: Any, bucket_name: str, keys: List[str]) -> List[str]:
+    """Удаляет ключи вызовами delete_objects по DELETE_OBJECTS_MAX штук; возвращает неудалённые"""
+    failed: List[str] = []
+    for start in range(0, len(keys), DELETE_OBJECTS_MAX):
+        response = s3_client.delete_objects(
+            Bucket=bucket_name,
+            Delete={'Objects': [{'Key': key} for key in keys[start:start + DELETE_OBJECTS_MAX]], 'Quiet': True}
+        )
+        failed.extend(error['Key'] for error in response.get('Errors', []))
+    return failed
+
+def referenced_keys(cursor: Any, keys: List[str], grace_seconds: int = SWEEP_GRACE_SECONDS) -> set:
+    """
+    Ключи, на которые ещё ссылается индекс stored_objects или file_url статей и материалов.
+    Изображения upload-file регистрирует без ссылок: такие живут grace_seconds с последней
+    регистрации, а изображения, попавшие в статьи до учёта ссылок, находятся по тексту статей.
+    """
+    images = [key for key in keys if key.startswith('images/')]
+    cursor.execute('''
+        SELECT key FROM stored_objects
+        WHERE key = ANY(%s) AND (refcount > 0 OR created_at >= LOCALTIMESTAMP - make_interval(secs => %s))
+        UNION
+        SELECT substring(file_url FROM %s) FROM articles WHERE substring(file_url FROM %s) = ANY(%s)
+        UNION
+        SELECT substring(file_url FROM %s) FROM materials WHERE substring(file_url FROM %s) = ANY(%s)
+    ''', (keys, grace_seconds, CONTENT_KEY_REGEX, CONTENT_KEY_REGEX, keys, CONTENT_KEY_REGEX, CONTENT_KEY_REGEX, keys))
+    referenced = {row[0] for row in cursor.fetchall()}
+    if images:
+        cursor.execute('''
+            SELECT DISTINCT found.match[1]
+            FROM articles, regexp_matches(content, %s, 'g') AS found(match)
+            WHERE found.match[1] = ANY(%s)
+        ''', ('(' + IMAGE_KEY_REGEX + ')', images))
+        referenced.update(row[0] for row in cursor.fetchall())
+    return referenced
+
+def drain_deletions(s3_client: Any, bucket_name: str) -> Dict[str, int]:
+    """
+    Разбирает очередь object_deletions пачками по DELETE_OBJECTS_MAX. Строки пачки
+    заблокированы до конца удаления (SKIP LOCKED пропускает чужие), а ключи, на которые
+    снова появились ссылки, остаются в бакете. Неудалённые ключи остаются в очереди.
+    """
+    stats = {'deleted': 0, 'kept': 0, 'failed': 0}
+    while True:
+        with db_connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                'SELECT key FROM object_deletions ORDER BY queued_at LIMIT %s FOR UPDATE SKIP LOCKED',
+                (DELETE_OBJECTS_MAX,)
+            )
+            keys = [row[0] for row in cursor.fetchall()]
+            if not keys:
+                return stats
+            referenced = referenced_keys(cursor, keys)
+            orphaned = [key for key in keys if key not in referenced]
+            failed = set(delete_keys(s3_client, bucket_name, orphaned)) if orphaned else set()
+            # Невостребованные изображения остаются в индексе с нулём ссылок до удаления объекта
+            cursor.execute('DELETE FROM stored_objects WHERE key = ANY(%s) AND refcount <= 0',
+                           ([key for key in orphaned if key not in failed],))
+            cursor.execute('DELETE FROM object_deletions WHERE key = ANY(%s)', ([key for key in keys if key not in failed],))
+            conn.commit()
+        stats['deleted'] += len(orphaned) - len(failed)
+        stats['kept'] += len(referenced)
+        stats['failed'] += len(failed)
+        if failed or len(keys) < DELETE_OBJECTS_MAX:
+            return stats
+
+def reconcile_bucket(s3_client: Any, bucket_name: str, grace_seconds: int = SWEEP_GRACE_SECONDS, dry_run: bool = False) -> Dict[str, int]:
+    """
+    Сверяет бакет с базой. Файлы files/ и изображения images/ без ссылок ставятся в очередь object_deletions
+    (удаляет их drain_deletions с той же защитой от повторной загрузки), брошенные
+    временные uploads/ и незавершённые multipart-загрузки удаляются сразу. Объекты моложе
+    grace_seconds не трогаются: их загрузка может быть ещё не завершена. Выгрузки exports/
+    удаляются старше EXPORT_RETENTION_SECONDS.
+    """
+    now = datetime.now(timezone.utc)
+    cutoff = now - timedelta(seconds=grace_seconds)
+    stats = {'scanned': 0, 'orphaned': 0, 'stale_uploads': 0, 'expired_exports': 0, 'aborted_multipart': 0}
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for prefix in ('files/', 'images/', 'uploads/', 'exports/'):
+        prefix_cutoff = now - timedelta(seconds=EXPORT_RETENTION_SECONDS) if prefix == 'exports/' else cutoff
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix, PaginationConfig={'PageSize': DELETE_OBJECTS_MAX}):
+            contents = page.get('Contents', [])
+            stats['scanned'] += len(contents)
+            keys = [item['Key'] for item in contents if item['LastModified'] < prefix_cutoff]
+            if not keys:
+                continue
+            if prefix in ('uploads/', 'exports/'):
+                stats['stale_uploads' if prefix == 'uploads/' else 'expired_exports'] += len(keys)
+                if not dry_run:
+                    delete_keys(s3_client, bucket_name, keys)
+                continue
+            with db_connection() as conn, conn.cursor() as cursor:
+                referenced = referenced_keys(cursor, keys, grace_seconds)
+                orphaned = [key for key in keys if key not in referenced]
+                if orphaned and not dry_run:
+                    cursor.execute(
+                        'INSERT INTO object_deletions (key) SELECT unnest(%s::text[]) ON CONFLICT DO NOTHING',
+                        (orphaned,)
+                    )
+                    conn.commit()
+            stats['orphaned'] += len(orphaned)
+    
+    for page in s3_client.get_paginator('list_multipart_uploads').paginate(Bucket=bucket_name, Prefix='uploads/'):
+        for upload in page.get('Uploads', []):
+            if upload['Initiated'] < cutoff:
+                stats['aborted_multipart'] += 1
+                if not dry_run:
+                    s3_client.abort_multipart_upload(Bucket=bucket_name, Key=upload['Key'], UploadId=upload['UploadId'])
+    return stats
+
+def get_dedup_stats() -> Dict[str, Any]:
+    """Доля загрузок, обошедшихся без put_object: в этом экземпляре и по всему индексу"""
+    with _stats_lock:
+        stats: Dict[str, Any] = dict(dedup_stats)
+    stats['hit_ratio'] = round(stats['hits'] / stats['uploads'], 4) if stats['uploads'] else 0.0
+    if os.environ.get('DATABASE_URL'):
+        try:
+            with db_connection() as conn, conn.cursor() as cursor:
+                cursor.execute('SELECT count(*), coalesce(sum(refcount), 0), coalesce(sum(size), 0) FROM stored_objects')
+                objects, references, stored_bytes = cursor.fetchone()
+        except psycopg2.Error as e:
+            stats['index_error'] = str(e)
+            return stats
+        stats['objects'] = objects
+        stats['references'] = int(references)
+        stats['stored_bytes'] = int(stored_bytes)
+        stats['global_hit_ratio'] = round(1 - objects / references, 4) if references else 0.0
+    return stats
+
+_s3_client: Optional[Any] = None
+_s3_client_lock = threading.Lock()
+
+def get_s3_client() -> Any:
+    """Клиент S3 создаётся один раз на экземпляр: это самая дорогая часть холодного старта"""
+    global _s3_client
+    if _s3_client is None:
+        with _s3_client_lock:
+            if _s3_client is None:
+                _s3_client = boto3.client(
+                    's3',
+                    endpoint_url=S3_ENDPOINT,
+                    aws_access_key_id=os.environ.get('AWS_ACCESS_KEY_ID'),
+                    aws_secret_access_key=os.environ.get('AWS_SECRET_ACCESS_KEY'),
+                    region_name=os.environ.get('AWS_REGION', 'ru-central1'),
+                    config=Config(signature_version='s3v4')
+                )
+    return _s3_client
+
+def dumps(payload: Any) -> str:
+    """Тело JSON-ответа: orjson, если установлен, иначе стандартный json; кириллица в обоих случаях не экранируется"""
+    if orjson is not None:
+        return orjson.dumps(payload).decode('utf-8')
+    return json.dumps(payload, ensure_ascii=False)
+
+def json_response(status: int, payload: Any, headers: Mapping[str, str] = JSON_HEADERS) -> Dict[str, Any]:
+    return {
+        'statusCode': status,
+        'headers': dict(headers),
+        'body': dumps(payload),
+        'isBase64Encoded': False
+    }
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: API для загрузки файлов в S3 хранилище
-    Args: event с httpMethod, body с base64 файлом, fileName
-    Returns: HTTP response с URL загруженного файла
+    Args: event с httpMethod; POST с base64 файлом и fileName либо action=presign/complete для прямой
+          загрузки браузером по подписанным ссылкам; queryStringParameters key для DELETE
+    Returns: HTTP response с URL загруженного файла (одинаковое содержимое хранится один раз)
     '''
     method: str = event.get('httpMethod', 'POST')
     
     if method == 'OPTIONS':
         return {
             'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Access-Control-Max-Age': '86400'
-            },
+            'headers': dict(PREFLIGHT_HEADERS),
             'body': '',
             'isBase64Encoded': False
         }
     
-    if method != 'POST':
-        return {
-            'statusCode': 405,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': 'Метод не поддерживается'}, ensure_ascii=False),
-            'isBase64Encoded': False
-        }
+    if method not in ALLOWED_METHODS:
+        return json_response(405, {'error': 'Метод не поддерживается'})
+    
+    bucket_name = os.environ.get('S3_BUCKET_NAME', 'pedagogical-forum-files')
+    
+    if method == 'GET':
+        return json_response(200, {'dedup': get_dedup_stats()})
+    
+    if method == 'DELETE':
+        params = event.get('queryStringParameters') or {}
+        key = params.get('key', '')
+        if not key.startswith('files/') or not os.environ.get('DATABASE_URL'):
+            return json_response(400, {'error': 'Удалять можно только файлы из индекса хранилища'})
+        try:
+            found, refcount = release_object(key)
+        except Exception as e:
+            return json_response(500, {'error': f'Ошибка удаления файла: {str(e)}'})
+        return json_response(200 if found else 404, {'key': key, 'refcount': refcount, 'queued': found and refcount == 0} if found else {'error': 'Файл не найден'})
     
     try:
         body_data = json.loads(event.get('body', '{}'))
-        file_base64 = body_data.get('file', '')
+        action = body_data.get('action')
         file_name = body_data.get('fileName', '')
         
-        if not file_base64 or not file_name:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'error': 'Файл и имя файла обязательны'}, ensure_ascii=False),
-                'isBase64Encoded': False
-            }
+        if action in ('presign', 'complete'):
+            digest = (body_data.get('sha256') or '').lower() or None
+            try:
+                size = int(body_data.get('size') or 0)
+            except (TypeError, ValueError):
+                size = -1
+            if not file_name or (action == 'presign' and not 0 < size <= MAX_UPLOAD_SIZE) \
+                    or (digest and not re.fullmatch(r'[0-9a-f]{64}', digest)) \
+                    or (action == 'complete' and not is_issued_staging_key(body_data.get('key'))):
+                return json_response(400, {'error': 'Некорректные параметры прямой загрузки'})
+            s3_client = get_s3_client()
+            if action == 'presign':
+                result = presign_upload(s3_client, bucket_name, file_name, size)
+            else:
+                try:
+                    result = complete_upload(s3_client, bucket_name, body_data['key'], file_name, digest,
+                                             body_data.get('uploadId'), body_data.get('parts') or [])
+                except ValueError as e:
+                    return json_response(400, {'error': str(e)})
+            return json_response(200, result)
         
-        aws_access_key = os.environ.get('AWS_ACCESS_KEY_ID')
-        aws_secret_key = os.environ.get('AWS_SECRET_ACCESS_KEY')
-        bucket_name = os.environ.get('S3_BUCKET_NAME', 'pedagogical-forum-files')
-        region = os.environ.get('AWS_REGION', 'ru-central1')
+        file_base64 = body_data.get('file', '')
+        if not file_base64 or not file_name:
+            return json_response(400, {'error': 'Файл и имя файла обязательны'})
         
         file_content = base64.b64decode(file_base64)
         
-        unique_id = str(uuid.uuid4())[:8]
-        file_ext = file_name.split('.')[-1]
-        s3_key = f'articles/{unique_id}_{file_name}'
+        digest = hashlib.sha256(file_content).hexdigest()
+        file_ext = file_name.split('.')[-1] if '.' in file_name else 'bin'
+        s3_key = content_key(digest, file_ext)
         
-        s3_client = boto3.client(
-            's3',
-            endpoint_url='https://storage.yandexcloud.net',
-            aws_access_key_id=aws_access_key,
-            aws_secret_access_key=aws_secret_key,
-            region_name=region
+        s3_client = get_s3_client()
+        deduplicated = store_deduplicated(
+            s3_client, bucket_name, s3_key, digest, len(file_content), file_ext,
+            lambda: put_content(s3_client, bucket_name, s3_key, file_content, file_name, file_ext)
         )
+        record_upload(deduplicated, len(file_content))
         
-        s3_client.put_object(
-            Bucket=bucket_name,
-            Key=s3_key,
-            Body=file_content,
-            ContentType=get_content_type(file_ext)
-        )
+        file_url = f'{S3_ENDPOINT}/{bucket_name}/{s3_key}'
         
-        file_url = f'https://storage.yandexcloud.net/{bucket_name}/{s3_key}'
-        
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'url': file_url,
-                'fileName': file_name,
-                'key': s3_key
-            }, ensure_ascii=False),
-            'isBase64Encoded': False
-        }
+        return json_response(200, {
+            'url': file_url,
+            'fileName': file_name,
+            'key': s3_key,
+            'sha256': digest,
+            'deduplicated': deduplicated
+        })
     
     except Exception as e:
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({'error': f'Ошибка загрузки файла: {str(e)}'}, ensure_ascii=False),
-            'isBase64Encoded': False
-        }
+        return json_response(500, {'error': f'Ошибка загрузки файла: {str(e)}'})
 
 def get_content_type(file_ext: str) -> str:
     """Определяет Content-Type по расширению файла"""
@@ -0,0 +1,32 @@
+"""
+Уборка бакета, запускается по расписанию отдельно от HTTP-функции:
+    python sweeper.py [--reconcile] [--grace 86400] [--dry-run]
+Без флагов удаляет объекты из очереди object_deletions, которую пополняют пакетные
+DELETE в articles и materials. --reconcile дополнительно сверяет содержимое бакета
+со ссылками в базе, ставит в очередь файлы, на которые никто не ссылается, и удаляет
+выгрузки exports/ функции export старше EXPORT_RETENTION_SECONDS.
+"""
+import argparse
+import json
+import os
+
+from index import SWEEP_GRACE_SECONDS, drain_deletions, get_s3_client, reconcile_bucket
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Удаление осиротевших объектов хранилища')
+    parser.add_argument('--reconcile', action='store_true', help='сверить бакет со ссылками в базе')
+    parser.add_argument('--grace', type=int, default=SWEEP_GRACE_SECONDS, help='не трогать объекты моложе, секунды')
+    parser.add_argument('--dry-run', action='store_true', help='только посчитать, ничего не удалять')
+    args = parser.parse_args()
+    
+    s3_client = get_s3_client()
+    bucket_name = os.environ.get('S3_BUCKET_NAME', 'pedagogical-forum-files')
+    report = {}
+    if args.reconcile:
+        report['reconcile'] = reconcile_bucket(s3_client, bucket_name, args.grace, args.dry_run)
+    if not args.dry_run:
+        report['drain'] = drain_deletions(s3_client, bucket_name)
+    print(json.dumps(report, ensure_ascii=False))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark: cold-start cost of every backend function.
+
+Each run starts a fresh interpreter, imports backend/<function>/index.py and
+calls its handler twice with a scenario from the function's tests.json: the
+first call is the cold request (lazy imports, pools and clients are created
+here), the second one is warm. Medians over --runs are reported. Functions that
+need a database or storage should be run with DATABASE_URL / OBJECT_STORE_DIR set,
+otherwise their requests fail fast and only the import column is meaningful.
+Run from the repository root:
+
+    python benchmarks/cold_start.py [--functions upload-file,upload-to-s3] [--runs 5] [--top 5]
+"""
+import argparse
+import json
+import re
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+CHILD = r'''
+import importlib.util, json, sys, time
+from urllib.parse import parse_qsl, urlsplit
+function_name, scenario_index = sys.argv[1], int(sys.argv[2])
+directory = f'{ROOT}/backend/{function_name}'
+scenario = json.load(open(f'{directory}/tests.json', encoding='utf-8'))['tests'][scenario_index]
+path = urlsplit(scenario.get('path', '/'))
+event = {
+    'httpMethod': scenario.get('method', 'GET'),
+    'queryStringParameters': dict(parse_qsl(path.query)),
+    'headers': scenario.get('headers', {}),
+    'body': json.dumps(scenario['body'], ensure_ascii=False) if 'body' in scenario else None,
+}
+print('-- handler module', file=sys.stderr, flush=True)
+started = time.perf_counter()
+sys.path.insert(0, directory)
+spec = importlib.util.spec_from_file_location('index', f'{directory}/index.py')
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+imported = time.perf_counter()
+first = module.handler(dict(event), None)
+first_done = time.perf_counter()
+module.handler(dict(event), None)
+second_done = time.perf_counter()
+print(json.dumps({
+    'scenario': scenario['name'],
+    'status': first['statusCode'],
+    'import_ms': (imported - started) * 1000,
+    'first_ms': (first_done - imported) * 1000,
+    'warm_ms': (second_done - first_done) * 1000,
+}))
+'''.replace('{ROOT}', str(ROOT))
+
+def run_child(function_name: str, scenario_index: int, importtime: bool = False) -> tuple:
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', CHILD, function_name, str(scenario_index)]
+    completed = subprocess.run(command, capture_output=True, text=True, cwd=ROOT)
+    if completed.returncode != 0:
+        raise RuntimeError(f'{function_name}: {completed.stderr.strip().splitlines()[-1]}')
+    return json.loads(completed.stdout.strip().splitlines()[-1]), completed.stderr
+
+def heaviest_imports(importtime_log: str, top: int) -> list:
+    """Верхнеуровневые пакеты модуля функции с наибольшим накопленным временем импорта;
+    всё, что импортировал сам интерпретатор до модуля, пропускается"""
+    totals = {}
+    for line in importtime_log.split('-- handler module', 1)[-1].splitlines():
+        match = re.match(r'import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)', line)
+        if match and len(match.group(2)) == 1:
+            totals[match.group(3)] = int(match.group(1))
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--functions', default=','.join(sorted(p.parent.name for p in (ROOT / 'backend').glob('*/index.py'))))
+    parser.add_argument('--scenario', type=int, default=0, help='index of the tests.json scenario to replay')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=0, help='also list the N heaviest top-level imports')
+    args = parser.parse_args()
+
+    print(f'{"function":>14} {"import, ms":>11} {"first, ms":>10} {"warm, ms":>9} {"status":>7}  scenario')
+    for function_name in args.functions.split(','):
+        runs = [run_child(function_name, args.scenario)[0] for _ in range(args.runs)]
+        median = {field: statistics.median(run[field] for run in runs) for field in ('import_ms', 'first_ms', 'warm_ms')}
+        print(
+            f'{function_name:>14} {median["import_ms"]:>11.1f} {median["first_ms"]:>10.1f} '
+            f'{median["warm_ms"]:>9.1f} {runs[0]["status"]:>7}  {runs[0]["scenario"]}'
+        )
+        if args.top:
+            _, log = run_child(function_name, args.scenario, importtime=True)
+            for module_name, micros in heaviest_imports(log, args.top):
+                print(f'{"":>14}   {module_name:<28} {micros / 1000:>8.1f} ms')
+    sys.stdout.flush()
+
+if __name__ == '__main__':
+    main()
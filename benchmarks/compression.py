@@ -0,0 +1,119 @@
+"""
+Benchmark: CPU cost versus bytes saved for gzip and brotli on article responses.
+
+Encodes the article detail JSON the way the articles function does and reports
+compressed size, the base64 body actually handed to the gateway, and compress /
+decompress time per level. Article content comes from the largest article in
+DATABASE_URL (--from-db), from an HTML or text file (--file), or, by default,
+from a generated Russian lesson plan of --size KiB. Run from the repository root:
+
+    python benchmarks/compression.py [--from-db | --file article.html] [--size 64] [--repeat 20]
+"""
+import argparse
+import base64
+import gzip
+import json
+import os
+import random
+import sys
+import time
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+SENTENCES = (
+    'Метод ассоциаций помогает ученикам связывать новые понятия с уже знакомыми образами.',
+    'На уроке истории даты запоминаются через яркие сюжеты и персонажей.',
+    'Учитель предлагает классу составить цепочку ассоциаций для химических элементов.',
+    'После упражнения дети пересказывают материал своими словами и проверяют друг друга.',
+    'Карточки с изображениями используются для повторения в начале каждого занятия.',
+    'Мнемотехники особенно полезны при подготовке к экзаменам и контрольным работам.',
+    'Важно, чтобы ассоциации придумывали сами ученики, а не получали их готовыми.',
+    'Рефлексия в конце урока показывает, какие образы сработали лучше всего.',
+)
+
+WORDS = sorted({word.strip('.,:') for sentence in SENTENCES for word in sentence.split()})
+
+def random_sentence(rng: random.Random) -> str:
+    """Фраза из случайных слов словаря: без неё текст повторялся бы и сжимался нереалистично хорошо"""
+    words = rng.choices(WORDS, k=rng.randint(6, 16))
+    return ' '.join(words).capitalize() + '.'
+
+def generated_article(size_kib: int) -> str:
+    """HTML урока с заголовками, абзацами и таблицами, как после разбора DOCX"""
+    rng = random.Random(42)
+    parts = []
+    while sum(len(part) for part in parts) < size_kib * 1024:
+        if rng.random() < 0.1:
+            parts.append(f'<h2>Этап {len(parts)}: {rng.choice(SENTENCES)[:40]}</h2>')
+        elif rng.random() < 0.05:
+            rows = ''.join(
+                f'<tr><td style="padding: 8px; border: 1px solid #ddd;">{rng.choice(SENTENCES)[:30]}</td>'
+                f'<td style="padding: 8px; border: 1px solid #ddd;">{rng.randint(1, 45)} мин</td></tr>'
+                for _ in range(4)
+            )
+            parts.append(f'<table border="1" style="border-collapse: collapse; width: 100%; margin: 16px 0;">{rows}</table>')
+        else:
+            parts.append('<p>' + ' '.join([rng.choice(SENTENCES)] + [random_sentence(rng) for _ in range(3)]) + '</p>')
+    return '\n'.join(parts)
+
+def article_from_db() -> str:
+    import psycopg2
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT content FROM articles ORDER BY length(content) DESC NULLS LAST LIMIT 1')
+        row = cursor.fetchone()
+    conn.close()
+    return row[0] if row and row[0] else ''
+
+def timed(func, repeat: int):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return result, (time.perf_counter() - started) / repeat * 1000
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--from-db', action='store_true')
+    source.add_argument('--file')
+    parser.add_argument('--size', type=int, default=64, help='KiB of generated content')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    if args.from_db:
+        content = article_from_db()
+    elif args.file:
+        with open(args.file, encoding='utf-8') as f:
+            content = f.read()
+    else:
+        content = generated_article(args.size)
+    body = json.dumps({'article': {
+        'id': 1, 'title': 'Ассоциативный метод на уроке', 'excerpt': content[:200], 'content': content,
+        'author': 'Елена Волкова', 'category': 'Практика', 'date': '18 October 2026'
+    }}, ensure_ascii=False).encode('utf-8')
+
+    codecs = [(f'gzip {level}', lambda level=level: gzip.compress(body, compresslevel=level), gzip.decompress) for level in (1, 6, 9)]
+    if brotli is not None:
+        codecs += [
+            (f'br {quality}', lambda quality=quality: brotli.compress(body, quality=quality, mode=brotli.MODE_TEXT), brotli.decompress)
+            for quality in (1, 5, 9, 11)
+        ]
+    else:
+        print('brotli is not installed, only gzip is measured', file=sys.stderr)
+
+    print(f'body: {len(body) / 1024:.1f} KiB, base64 identity would be {len(base64.b64encode(body)) / 1024:.1f} KiB')
+    print(f'{"codec":>8} {"KiB":>8} {"ratio":>6} {"base64 KiB":>11} {"compress ms":>12} {"decompress ms":>14}')
+    for name, compress, decompress in codecs:
+        compressed, compress_ms = timed(compress, args.repeat)
+        _, decompress_ms = timed(lambda: decompress(compressed), args.repeat)
+        print(
+            f'{name:>8} {len(compressed) / 1024:>8.1f} {len(body) / len(compressed):>6.1f} '
+            f'{len(base64.b64encode(compressed)) / 1024:>11.1f} {compress_ms:>12.2f} {decompress_ms:>14.2f}'
+        )
+    sys.stdout.flush()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark: concurrent downloads of a single material.
+
+Compares a direct `UPDATE materials SET downloads = downloads + 1` per hit, where
+every hit queues on the same row lock, with the append-only material_downloads
+path of the materials function followed by one rollup. Every client thread holds
+its own connection, as separate function instances would. Needs a migrated
+database in DATABASE_URL; the benchmark creates and removes its own material.
+Run from the repository root:
+
+    python benchmarks/download_counters.py [--hits 5000] [--clients 50]
+"""
+import argparse
+import importlib.util
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+import psycopg2
+
+ROOT = Path(__file__).resolve().parent.parent
+
+def load_handler_module(function_name: str):
+    """Импортирует backend/<function>/index.py как модуль (в имени каталога есть дефис)"""
+    path = ROOT / 'backend' / function_name / 'index.py'
+    spec = importlib.util.spec_from_file_location(f'{function_name.replace("-", "_")}_index', path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+def naive_hit(cursor, material_id: int) -> None:
+    cursor.execute('UPDATE materials SET downloads = downloads + 1 WHERE id = %s', (material_id,))
+
+def run_clients(hit, material_id: int, hits: int, clients: int) -> float:
+    """Раздаёт hits поровну между clients потоками; каждое скачивание — отдельная транзакция"""
+    barrier = threading.Barrier(clients + 1)
+    errors = []
+
+    def client(count: int) -> None:
+        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        try:
+            with conn.cursor() as cursor:
+                barrier.wait()
+                for _ in range(count):
+                    hit(cursor, material_id)
+                    conn.commit()
+        except Exception as e:
+            errors.append(e)
+        finally:
+            conn.close()
+
+    threads = [
+        threading.Thread(target=client, args=(hits // clients + (1 if i < hits % clients else 0),))
+        for i in range(clients)
+    ]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return time.perf_counter() - started
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--hits', type=int, default=5000)
+    parser.add_argument('--clients', type=int, default=50)
+    args = parser.parse_args()
+
+    materials = load_handler_module('materials')
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO materials (title, author, file_type, downloads) VALUES ('benchmark', 'benchmark', 'PDF', 0) RETURNING id"
+        )
+        material_id = cursor.fetchone()[0]
+    conn.commit()
+    try:
+        print(f'{"mode":>14} {"hits":>7} {"clients":>8} {"time, s":>8} {"hits/s":>9} {"downloads":>10}')
+        for mode, hit in (('row update', naive_hit), ('append+rollup', materials.record_download)):
+            with conn.cursor() as cursor:
+                cursor.execute('UPDATE materials SET downloads = 0 WHERE id = %s', (material_id,))
+            conn.commit()
+            elapsed = run_clients(hit, material_id, args.hits, args.clients)
+            if hit is materials.record_download:
+                rollup_started = time.perf_counter()
+                with conn.cursor() as cursor:
+                    materials.rollup_downloads(cursor)
+                conn.commit()
+                elapsed_rollup = time.perf_counter() - rollup_started
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT downloads FROM materials WHERE id = %s', (material_id,))
+                downloads = cursor.fetchone()[0]
+            conn.commit()
+            print(f'{mode:>14} {args.hits:>7} {args.clients:>8} {elapsed:>8.2f} {args.hits / elapsed:>9.0f} {downloads:>10}')
+        print(f'rollup of {args.hits} hits: {elapsed_rollup * 1000:.1f} ms')
+    finally:
+        with conn.cursor() as cursor:
+            cursor.execute('DELETE FROM materials WHERE id = %s', (material_id,))
+        conn.commit()
+        conn.close()
+    sys.stdout.flush()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark: peak memory of exporting a large table.
+
+Compares the current list endpoints' approach (fetchall, a dict per row, one
+json.dumps of everything) with the streaming export function (named cursor,
+NDJSON/CSV chunks written as they are produced). Each mode runs in a fresh
+subprocess and reports its peak RSS. --seed first tops the messages table up to
+--rows rows with generated chat lines; use a scratch database in DATABASE_URL.
+Run from the repository root:
+
+    python benchmarks/export_memory.py --seed [--rows 1000000] [--table messages]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import psycopg2
+
+ROOT = Path(__file__).resolve().parent.parent
+
+CHILD = r'''
+import json, os, resource, sys, time
+sys.path.insert(0, '{ROOT}/backend/export')
+import index
+mode, table, export_format = sys.argv[1:4]
+baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+started = time.perf_counter()
+if mode == 'fetchall':
+    columns = index.EXPORT_TABLES[table]
+    with index.db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(f'SELECT {", ".join(columns)} FROM {table} ORDER BY id')
+        rows = cursor.fetchall()
+        body = json.dumps([dict(zip(columns, (index.format_value(v) for v in row))) for row in rows], ensure_ascii=False)
+    stats = {'rows': len(rows), 'bytes': len(body.encode('utf-8'))}
+else:
+    with open(os.devnull, 'wb') as out:
+        stats = index.export_table(table, export_format, out.write)
+elapsed = time.perf_counter() - started
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({'elapsed': elapsed, 'peak_kib': peak, 'baseline_kib': baseline, **stats}))
+'''.replace('{ROOT}', str(ROOT))
+
+def seed_messages(rows: int) -> None:
+    """Дополняет messages сгенерированными сообщениями до rows строк"""
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT COUNT(*) FROM messages')
+        missing = rows - cursor.fetchone()[0]
+        if missing > 0:
+            cursor.execute('''
+                INSERT INTO messages (author, text, created_at)
+                SELECT 'Участник ' || (n %% 500),
+                       'Сообщение ' || n || ': делимся приёмами ассоциативного запоминания на уроках',
+                       CURRENT_TIMESTAMP - n * INTERVAL '1 second'
+                FROM generate_series(1, %s) AS n
+            ''', (missing,))
+    conn.commit()
+    conn.close()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--table', default='messages')
+    parser.add_argument('--seed', action='store_true', help='top up the messages table to --rows first')
+    args = parser.parse_args()
+
+    if args.seed:
+        seed_messages(args.rows)
+    print(f'{"mode":>14} {"rows":>9} {"MiB out":>8} {"time, s":>8} {"peak RSS MiB":>13} {"growth MiB":>11}')
+    for mode, export_format in (('fetchall', 'json'), ('stream', 'ndjson'), ('stream', 'csv')):
+        completed = subprocess.run(
+            [sys.executable, '-c', CHILD, mode, args.table, export_format], capture_output=True, text=True, check=True
+        )
+        result = json.loads(completed.stdout)
+        print(
+            f'{mode + " " + export_format:>14} {result["rows"]:>9} {result["bytes"] / 2**20:>8.1f} {result["elapsed"]:>8.2f} '
+            f'{result["peak_kib"] / 1024:>13.1f} {(result["peak_kib"] - result["baseline_kib"]) / 1024:>11.1f}'
+        )
+    sys.stdout.flush()
+
+if __name__ == '__main__':
+    main()
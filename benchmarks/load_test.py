@@ -0,0 +1,290 @@
+"""
+Benchmark: latency and throughput of the backend handlers under concurrent load.
+
+Every scenario from backend/<function>/tests.json, and every synthetic mix from
+MIXES below, runs in a fresh subprocess. The subprocess imports the handlers and
+calls them from --concurrency threads. For each concurrency level it reports the
+p50/p95/p99 latency, the throughput, the share of responses that did not match
+expectedStatus, and the peak RSS of the process.
+
+A tests.json scenario may carry an optional budget, for example
+"budget": {"p95_ms": 50, "rps_min": 200, "rss_mib": 150, "concurrency": [1, 8]}.
+It is checked at the listed concurrency levels, or at every level if none are
+listed. Any violation makes the run exit with status 1.
+
+--seed first tops articles, materials and messages up to --rows generated rows.
+Use a scratch database in DATABASE_URL. Functions that need storage also need
+OBJECT_STORE_DIR or S3 settings, just as in cold_start.py.
+Run from the repository root:
+
+    python benchmarks/load_test.py --seed --rows 100000 [--functions articles,messages] \\
+        [--concurrency 1,8,32] [--requests 400] [--mix read-heavy] [--warm-cache]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import psycopg2
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Синтетические смеси: функция, метод, путь, тело, вес. {article_id} и {message_id}
+# подставляются случайными id из засеянного диапазона, {word} — словом из WORDS
+MIXES = {
+    'read-heavy': [
+        ('articles', 'GET', '/?limit=20', None, 30),
+        ('articles', 'GET', '/?id={article_id}', None, 20),
+        ('articles', 'GET', '/?q={word}&limit=20', None, 10),
+        ('materials', 'GET', '/?q={word}&limit=20', None, 10),
+        ('messages', 'GET', '/?since_id={message_id}', None, 25),
+        ('messages', 'POST', '/', {'author': 'Нагрузка', 'text': 'Сообщение под нагрузкой'}, 5),
+    ],
+    'chat': [
+        ('messages', 'GET', '/?since_id={message_id}', None, 80),
+        ('messages', 'GET', '/', None, 5),
+        ('messages', 'POST', '/', {'author': 'Нагрузка', 'text': 'Сообщение под нагрузкой'}, 15),
+    ],
+}
+
+WORDS = ('ассоциации', 'урок', 'память', 'карточки', 'рефлексия', 'мнемотехника')
+
+CHILD = r'''
+import importlib.util, json, os, random, resource, sys, threading, time
+from urllib.parse import parse_qsl, urlsplit
+spec = json.loads(sys.argv[1])
+handlers = {}
+for function_name in sorted({item['function'] for item in spec['scenarios']}):
+    directory = f'{ROOT}/backend/{function_name}'
+    sys.path.insert(0, directory)
+    module_spec = importlib.util.spec_from_file_location(f'{function_name.replace("-", "_")}_index', f'{directory}/index.py')
+    module = importlib.util.module_from_spec(module_spec)
+    module_spec.loader.exec_module(module)
+    sys.path.remove(directory)
+    handlers[function_name] = module.handler
+
+def make_event(item, rng):
+    path = item['path'].format(article_id=rng.randint(*spec['ids']['articles']),
+                               message_id=rng.randint(*spec['ids']['messages']),
+                               word=rng.choice(spec['words']))
+    url = urlsplit(path)
+    return {
+        'httpMethod': item['method'],
+        'queryStringParameters': dict(parse_qsl(url.query)),
+        'headers': item.get('headers', {}),
+        'body': json.dumps(item['body'], ensure_ascii=False) if item.get('body') is not None else None,
+    }
+
+weights = [item.get('weight', 1) for item in spec['scenarios']]
+results = []
+for concurrency in spec['concurrency']:
+    latencies = {index: [] for index in range(len(spec['scenarios']))}
+    mismatches = {index: 0 for index in range(len(spec['scenarios']))}
+    per_thread = [spec['requests'] // concurrency + (1 if i < spec['requests'] % concurrency else 0) for i in range(concurrency)]
+    barrier = threading.Barrier(concurrency + 1)
+    lock = threading.Lock()
+
+    def client(count, seed):
+        rng = random.Random(seed)
+        barrier.wait()
+        for _ in range(count):
+            index = rng.choices(range(len(spec['scenarios'])), weights)[0]
+            item = spec['scenarios'][index]
+            event = make_event(item, rng)
+            started = time.perf_counter()
+            try:
+                status = handlers[item['function']](event, None)['statusCode']
+            except Exception:
+                status = None
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                latencies[index].append(elapsed)
+                if status != item.get('expectedStatus', status):
+                    mismatches[index] += 1
+
+    threads = [threading.Thread(target=client, args=(count, i)) for i, count in enumerate(per_thread)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    results.append({
+        'concurrency': concurrency,
+        'wall_s': wall,
+        'latencies': latencies,
+        'mismatches': mismatches,
+        'peak_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    })
+print(json.dumps(results))
+'''.replace('{ROOT}', str(ROOT))
+
+def seed_tables(rows: int) -> None:
+    """Дополняет articles, materials и messages сгенерированными строками до rows в каждой"""
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    statements = {
+        'articles': '''
+            INSERT INTO articles (title, excerpt, content, author, category, created_at)
+            SELECT 'Статья ' || n || ': ' || (ARRAY['ассоциации', 'урок', 'память', 'карточки', 'рефлексия', 'мнемотехника'])[1 + n %% 6],
+                   'Как использовать ' || (ARRAY['ассоциации', 'карточки', 'мнемотехника'])[1 + n %% 3] || ' на уроке',
+                   '<p>Учитель предлагает классу составить цепочку ассоциаций. Урок ' || n || ' закрепляет память через образы и рефлексию.</p>',
+                   'Автор ' || (n %% 200),
+                   (ARRAY['Теория', 'Практика', 'Общее'])[1 + n %% 3],
+                   CURRENT_TIMESTAMP - n * INTERVAL '1 minute'
+            FROM generate_series(1, %s) AS n
+        ''',
+        'materials': '''
+            INSERT INTO materials (title, description, author, file_type, category, downloads, created_at)
+            SELECT 'Материал ' || n,
+                   'Карточки и упражнения: ' || (ARRAY['ассоциации', 'урок', 'память', 'рефлексия', 'мнемотехника'])[1 + n %% 5],
+                   'Автор ' || (n %% 200),
+                   (ARRAY['PDF', 'DOCX', 'PPTX'])[1 + n %% 3],
+                   'Методика',
+                   n %% 50,
+                   CURRENT_TIMESTAMP - n * INTERVAL '1 minute'
+            FROM generate_series(1, %s) AS n
+        ''',
+        'messages': '''
+            INSERT INTO messages (author, text, created_at)
+            SELECT 'Участник ' || (n %% 500),
+                   'Сообщение ' || n || ': делимся приёмами ассоциативного запоминания на уроках',
+                   CURRENT_TIMESTAMP - n * INTERVAL '1 second'
+            FROM generate_series(1, %s) AS n
+        ''',
+    }
+    with conn.cursor() as cursor:
+        for table, statement in statements.items():
+            cursor.execute(f'SELECT COUNT(*) FROM {table}')
+            missing = rows - cursor.fetchone()[0]
+            if missing > 0:
+                cursor.execute(statement, (missing,))
+                conn.commit()
+                print(f'seeded {missing} rows into {table}', file=sys.stderr)
+        cursor.execute('ANALYZE articles, materials, messages')
+    conn.commit()
+    conn.close()
+
+def id_ranges() -> dict:
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    ranges = {}
+    with conn.cursor() as cursor:
+        for table in ('articles', 'messages'):
+            cursor.execute(f'SELECT COALESCE(MIN(id), 1), COALESCE(MAX(id), 1) FROM {table}')
+            ranges[table] = list(cursor.fetchone())
+    conn.close()
+    return ranges
+
+def percentile(sorted_values: list, share: float) -> float:
+    """Перцентиль по ближайшему рангу"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(share * len(sorted_values) + 0.5))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+def run_child(scenarios: list, args, ids: dict) -> list:
+    spec = {
+        'scenarios': scenarios,
+        'concurrency': args.concurrency,
+        'requests': args.requests,
+        'ids': ids,
+        'words': WORDS,
+    }
+    env = dict(os.environ, DB_POOL_MAX=str(max(args.concurrency)))
+    if not args.warm_cache:
+        env['ARTICLES_CACHE_TTL'] = '0'
+    completed = subprocess.run([sys.executable, '-c', CHILD, json.dumps(spec)], capture_output=True, text=True, cwd=ROOT, env=env)
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def budget_violations(budget: dict, row: dict) -> list:
+    levels = budget.get('concurrency')
+    if levels is not None and row['concurrency'] not in (levels if isinstance(levels, list) else [levels]):
+        return []
+    violations = []
+    for field, limit in budget.items():
+        if field.endswith('_ms') and row[field[:-3]] > limit:
+            violations.append(f'{field} {row[field[:-3]]:.1f} > {limit}')
+    if 'rps_min' in budget and row['rps'] < budget['rps_min']:
+        violations.append(f'rps {row["rps"]:.0f} < {budget["rps_min"]}')
+    if 'rss_mib' in budget and row['rss_mib'] > budget['rss_mib']:
+        violations.append(f'rss {row["rss_mib"]:.0f} MiB > {budget["rss_mib"]}')
+    return violations
+
+def report(label: str, scenarios: list, results: list) -> list:
+    """Печатает строки по эндпоинтам и возвращает нарушения бюджетов"""
+    violations = []
+    for result in results:
+        total = sum(len(values) for values in result['latencies'].values())
+        for index, item in enumerate(scenarios):
+            values = sorted(result['latencies'][str(index)])
+            if not values:
+                continue
+            row = {
+                'concurrency': result['concurrency'],
+                'p50': percentile(values, 0.50),
+                'p95': percentile(values, 0.95),
+                'p99': percentile(values, 0.99),
+                'rps': total / result['wall_s'] * len(values) / total,
+                'rss_mib': result['peak_kib'] / 1024,
+            }
+            failed = budget_violations(item.get('budget') or {}, row)
+            violations += [f'{label} / {item["name"]} @ {row["concurrency"]}: {text}' for text in failed]
+            print(
+                f'{label[:14]:>14} {item["name"][:34]:<34} {row["concurrency"]:>4} {len(values):>6} '
+                f'{result["mismatches"][str(index)]:>5} {row["p50"]:>8.1f} {row["p95"]:>8.1f} {row["p99"]:>8.1f} '
+                f'{row["rps"]:>8.0f} {row["rss_mib"]:>7.0f}  {"FAIL" if failed else ("ok" if item.get("budget") else "")}'
+            )
+    return violations
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--functions', default='articles,materials,messages')
+    parser.add_argument('--concurrency', default='1,8,32', type=lambda value: [int(item) for item in value.split(',')])
+    parser.add_argument('--requests', type=int, default=400, help='requests per scenario and concurrency level')
+    parser.add_argument('--mix', action='append', choices=sorted(MIXES), help='synthetic mix to run (repeatable)')
+    parser.add_argument('--no-scenarios', action='store_true', help='run only the synthetic mixes')
+    parser.add_argument('--seed', action='store_true', help='top up the tables to --rows first')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--warm-cache', action='store_true', help='keep the articles response cache enabled')
+    args = parser.parse_args()
+
+    if args.seed:
+        seed_tables(args.rows)
+    ids = id_ranges()
+
+    print(f'{"function":>14} {"scenario":<34} {"conc":>4} {"reqs":>6} {"bad":>5} {"p50 ms":>8} {"p95 ms":>8} '
+          f'{"p99 ms":>8} {"req/s":>8} {"RSS MiB":>7}  budget')
+    violations = []
+    if not args.no_scenarios:
+        for function_name in args.functions.split(','):
+            tests = json.loads((ROOT / 'backend' / function_name / 'tests.json').read_text(encoding='utf-8'))['tests']
+            for test in tests:
+                scenario = {**test, 'function': function_name, 'path': test.get('path', '/').replace('{', '{{').replace('}', '}}')}
+                try:
+                    results = run_child([scenario], args, ids)
+                except RuntimeError as e:
+                    print(f'{function_name:>14} {test["name"][:34]:<34} error: {e}')
+                    violations.append(f'{function_name} / {test["name"]}: {e}')
+                    continue
+                violations += report(function_name, [scenario], results)
+    for mix_name in args.mix or []:
+        scenarios = [
+            {'name': f'{function_name} {method} {path}', 'function': function_name, 'method': method,
+             'path': path, 'body': body, 'weight': weight}
+            for function_name, method, path, body, weight in MIXES[mix_name]
+        ]
+        violations += report(f'mix {mix_name}', scenarios, run_child(scenarios, args, ids))
+    sys.stdout.flush()
+
+    if violations:
+        print('\nbudget violations:', file=sys.stderr)
+        for violation in violations:
+            print(f'  {violation}', file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
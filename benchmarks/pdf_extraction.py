@@ -0,0 +1,107 @@
+"""
+Benchmark: PDF extraction in upload-file on generated documents of 10, 100 and 500 pages.
+
+Compares the previous whole-document implementation (baseline), the sequential
+page-streaming path and the process-pool path. Wall time is measured untraced;
+--memory adds a second, tracemalloc-instrumented run for peak allocations of the
+calling process. Run from the repository root:
+
+    python benchmarks/pdf_extraction.py [--pages 10,100,500] [--workers 4] [--memory]
+"""
+import argparse
+import importlib.util
+import io
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+from PyPDF2 import PageObject, PdfWriter
+from PyPDF2.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+ROOT = Path(__file__).resolve().parent.parent
+
+def load_handler_module(function_name: str):
+    """Импортирует backend/<function>/index.py как модуль (в имени каталога есть дефис)"""
+    path = ROOT / 'backend' / function_name / 'index.py'
+    spec = importlib.util.spec_from_file_location(f'{function_name.replace("-", "_")}_index', path)
+    module = importlib.util.module_from_spec(spec)
+    # Регистрация нужна, чтобы воркеры пула могли распаковать функции модуля
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+def make_sample_pdf(page_count: int, lines_per_page: int = 40) -> bytes:
+    """Генерирует PDF с текстовым слоем на каждой странице"""
+    writer = PdfWriter()
+    font = DictionaryObject({
+        NameObject('/Type'): NameObject('/Font'),
+        NameObject('/Subtype'): NameObject('/Type1'),
+        NameObject('/BaseFont'): NameObject('/Helvetica'),
+    })
+    font_ref = writer._add_object(font)
+    for page_number in range(page_count):
+        page = PageObject.create_blank_page(width=612, height=792)
+        lines = [
+            f'({page_number + 1}.{line} Associative method lesson plan: memorise dates through vivid images.) Tj 0 -16 Td'
+            for line in range(lines_per_page)
+        ]
+        stream = DecodedStreamObject()
+        stream.set_data(('BT /F1 10 Tf 40 760 Td ' + ' '.join(lines) + ' ET').encode('latin-1'))
+        page[NameObject('/Contents')] = writer._add_object(stream)
+        page[NameObject('/Resources')] = DictionaryObject({
+            NameObject('/Font'): DictionaryObject({NameObject('/F1'): font_ref})
+        })
+        writer.add_page(page)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+def baseline_extract(file_content: bytes) -> dict:
+    """Прежняя реализация: весь текст документа в одной строке, затем split/join"""
+    import PyPDF2
+    pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_content))
+    text = ""
+    for page in pdf_reader.pages:
+        text += page.extract_text() + "\n\n"
+    html_parts = [f'<p>{para.strip()}</p>' for para in text.split('\n') if para.strip()]
+    return {'html': '\n'.join(html_parts), 'images': []}
+
+def measure(func, *args, trace_memory: bool = False):
+    started = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - started
+    peak = None
+    if trace_memory:
+        tracemalloc.start()
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', default='10,100,500')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--memory', action='store_true', help='also report peak traced memory')
+    args = parser.parse_args()
+    
+    upload_file = load_handler_module('upload-file')
+    print(f'{"pages":>6} {"mode":>10} {"time, s":>9} {"peak MiB":>9} {"html KiB":>9}')
+    for page_count in (int(value) for value in args.pages.split(',')):
+        pdf_bytes = make_sample_pdf(page_count)
+        modes = (
+            ('baseline', baseline_extract, 1),
+            ('sequential', upload_file.extract_content_from_pdf, 1),
+            ('parallel', upload_file.extract_content_from_pdf, args.workers),
+        )
+        for mode, extract, workers in modes:
+            upload_file.PDF_WORKERS = workers
+            upload_file.PDF_PARALLEL_MIN_PAGES = 1
+            result, elapsed, peak = measure(extract, pdf_bytes, trace_memory=args.memory)
+            peak_text = f'{peak / 2**20:>9.1f}' if peak is not None else f'{"-":>9}'
+            print(f'{page_count:>6} {mode:>10} {elapsed:>9.3f} {peak_text} {len(result["html"]) / 1024:>9.0f}')
+    sys.stdout.flush()
+
+if __name__ == '__main__':
+    main()
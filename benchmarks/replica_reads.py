@@ -0,0 +1,132 @@
+"""
+Benchmark: read-your-writes through a read replica.
+
+Each round POSTs a row through the articles, materials or messages handler and
+immediately GETs it back, once without a token and once with the X-Write-LSN
+of the write sent back as X-Min-LSN. It reports how many reads missed the
+fresh row, how many were served by the replica rather than the primary, and
+the read latency. Without a token the replica may lag; with one no read
+should be stale.
+
+DATABASE_URL is the primary, DATABASE_READ_URL a streaming standby of it. A
+local standby of a scratch primary listening on /tmp/pgdata:
+
+    pg_basebackup -h /tmp/pgdata -U postgres -D /tmp/pgreplica -R -X stream
+    pg_ctl -D /tmp/pgreplica -o "-p 5433 -k /tmp/pgreplica" start
+    export DATABASE_READ_URL='postgresql://postgres@/forum?host=/tmp/pgreplica&port=5433'
+
+To make the lag visible, delay replay on the standby:
+    ALTER SYSTEM SET recovery_min_apply_delay = '50ms'; SELECT pg_reload_conf();
+Rows are inserted and articles/materials are deleted again; use a scratch database.
+Run from the repository root:
+
+    python benchmarks/replica_reads.py [--rounds 50] [--functions articles,materials,messages]
+"""
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Функция: тело POST, как достать id из ответа записи, запрос чтения и как найти в нём запись
+CASES: Dict[str, Tuple[Dict[str, Any], Callable[[Dict[str, Any]], int], Callable[[int], Dict[str, str]], Callable[[Dict[str, Any], int], bool]]] = {
+    'articles': (
+        {'title': 'Реплика', 'excerpt': 'Проверка чтения своей записи', 'content': 'Текст', 'author': 'Бенчмарк', 'category': 'Практика'},
+        lambda body: body['article']['id'],
+        lambda row_id: {'id': str(row_id)},
+        lambda body, row_id: body.get('article', {}).get('id') == row_id
+    ),
+    'materials': (
+        {'title': 'Реплика', 'description': 'Проверка чтения своей записи', 'author': 'Бенчмарк'},
+        lambda body: body['material']['id'],
+        lambda row_id: {},
+        lambda body, row_id: any(item['id'] == row_id for item in body.get('materials', []))
+    ),
+    'messages': (
+        {'author': 'Бенчмарк', 'text': 'Проверка чтения своей записи'},
+        lambda body: body['message']['id'],
+        lambda row_id: {'since_id': str(row_id - 1)},
+        lambda body, row_id: any(item['id'] == row_id for item in body.get('messages', []))
+    )
+}
+
+def load_handler_module(function_name: str):
+    path = ROOT / 'backend' / function_name / 'index.py'
+    spec = importlib.util.spec_from_file_location(f'{function_name.replace("-", "_")}_index', path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+def call(module: Any, method: str, params: Dict[str, str], body: Optional[Dict[str, Any]] = None,
+         headers: Optional[Dict[str, str]] = None) -> Tuple[Dict[str, Any], Optional[str]]:
+    """Вызывает обработчик и возвращает ответ вместе с тем, куда ушло чтение (поле db строки лога)"""
+    event = {'httpMethod': method, 'queryStringParameters': params, 'headers': headers or {}}
+    if body is not None:
+        event['body'] = json.dumps(body, ensure_ascii=False)
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        response = module.handler(event, None)
+    lines = log.getvalue().strip().splitlines()
+    return response, json.loads(lines[-1]).get('db') if lines else None
+
+def run_function(name: str, rounds: int) -> Dict[str, Dict[str, Any]]:
+    module = load_handler_module(name)
+    post_body, written_id, read_params, contains = CASES[name]
+    results = {mode: {'stale': 0, 'replica': 0, 'latency_ms': []} for mode in ('no token', 'token')}
+    created: List[int] = []
+    for _ in range(rounds):
+        response, _ = call(module, 'POST', {}, post_body)
+        if response['statusCode'] != 201:
+            raise SystemExit(f'{name}: POST вернул {response["statusCode"]}: {response["body"]}')
+        row_id = written_id(json.loads(response['body']))
+        created.append(row_id)
+        lsn = response['headers'].get('X-Write-LSN')
+        if lsn is None:
+            raise SystemExit(f'{name}: нет X-Write-LSN — задан ли DATABASE_READ_URL?')
+        for mode, headers in (('no token', {}), ('token', {'X-Min-LSN': lsn})):
+            started = time.perf_counter()
+            response, db = call(module, 'GET', read_params(row_id), headers=headers)
+            results[mode]['latency_ms'].append((time.perf_counter() - started) * 1000)
+            if response['statusCode'] != 200 or not contains(json.loads(response['body']), row_id):
+                results[mode]['stale'] += 1
+            if db == 'replica':
+                results[mode]['replica'] += 1
+    if name != 'messages':
+        call(module, 'DELETE', {'ids': ','.join(map(str, created))})
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=50)
+    parser.add_argument('--functions', default='articles,materials,messages')
+    args = parser.parse_args()
+    if not os.environ.get('DATABASE_READ_URL'):
+        raise SystemExit('DATABASE_READ_URL не задан: нужна реплика DATABASE_URL')
+    os.environ['REQUEST_LOG'] = '1'
+
+    print(f'{"function":>10} {"mode":>9} {"stale":>6} {"replica":>8} {"p50 ms":>7} {"p95 ms":>7}')
+    violations = 0
+    for name in args.functions.split(','):
+        for mode, stats in run_function(name, args.rounds).items():
+            timings = sorted(stats['latency_ms'])
+            print(
+                f'{name:>10} {mode:>9} {stats["stale"]:>6} {stats["replica"]:>8} '
+                f'{statistics.median(timings):>7.2f} {timings[max(int(len(timings) * 0.95) - 1, 0)]:>7.2f}'
+            )
+            if mode == 'token':
+                violations += stats['stale']
+    sys.stdout.flush()
+    if violations:
+        raise SystemExit(f'{violations} чтений с токеном не увидели свою запись')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Benchmark: building and serializing a page of articles.
+
+Compares the previous handler code (a dict literal per row indexed by tuple
+position, json.dumps with ensure_ascii=False, header dicts written out for every
+response) with the current helpers of the articles function: rows_to_dicts over
+cursor.description, dumps (orjson when installed, otherwise the stdlib encoder)
+and the prebuilt header templates. Rows are generated, no database is needed.
+Run from the repository root:
+
+    python benchmarks/serialize.py [--rows 1000] [--repeat 200]
+"""
+import argparse
+import importlib.util
+import json
+import random
+import statistics
+import sys
+import time
+from collections import namedtuple
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+Column = namedtuple('Column', 'name')
+
+class FakeCursor:
+    """Только description: его rows_to_dicts берёт у курсора psycopg2"""
+    description = [Column(name) for name in ('id', 'title', 'excerpt', 'author', 'category', 'date')]
+
+def load_handler_module(function_name: str):
+    path = ROOT / 'backend' / function_name / 'index.py'
+    spec = importlib.util.spec_from_file_location(f'{function_name.replace("-", "_")}_index', path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+def generated_rows(count: int) -> list:
+    rng = random.Random(42)
+    words = 'ассоциации урок память образ ученик карточки история химия рефлексия мнемотехника'.split()
+    return [
+        (
+            1000 + i,
+            ' '.join(rng.choices(words, k=4)).capitalize(),
+            ' '.join(rng.choices(words, k=rng.randint(15, 40))),
+            rng.choice(('Елена Волкова', 'Иван Петров', 'Анна Смирнова')),
+            rng.choice(('Практика', 'Теория', 'Общее')),
+            f'{rng.randint(1, 28):02d} October   2026',
+        )
+        for i in range(count)
+    ]
+
+def previous_response(rows: list) -> dict:
+    articles = [
+        {
+            'id': row[0],
+            'title': row[1],
+            'excerpt': row[2],
+            'author': row[3],
+            'category': row[4],
+            'date': row[5]
+        }
+        for row in rows
+    ]
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': json.dumps({'articles': articles, 'next_cursor': None}, ensure_ascii=False),
+        'isBase64Encoded': False
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    articles = load_handler_module('articles')
+    rows = generated_rows(args.rows)
+    cursor = FakeCursor()
+    orjson = articles.orjson
+
+    def current_response(encoder) -> dict:
+        articles.orjson = encoder
+        return articles.json_response(200, {'articles': articles.rows_to_dicts(cursor, rows), 'next_cursor': None})
+
+    modes = [('previous', lambda: previous_response(rows)), ('helpers+stdlib', lambda: current_response(None))]
+    if orjson is not None:
+        modes.append(('helpers+orjson', lambda: current_response(orjson)))
+    else:
+        print('orjson is not installed, only the stdlib fallback is measured', file=sys.stderr)
+
+    reference = json.loads(previous_response(rows)['body'])
+    print(f'{"mode":>15} {"median ms":>10} {"p95 ms":>8} {"rows/s":>10} {"body KiB":>9}')
+    baseline = None
+    for name, build in modes:
+        response = build()
+        assert json.loads(response['body']) == reference, name
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            build()
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        median = statistics.median(timings)
+        baseline = baseline or median
+        print(
+            f'{name:>15} {median:>10.3f} {timings[int(len(timings) * 0.95) - 1]:>8.3f} '
+            f'{args.rows / median * 1000:>10.0f} {len(response["body"].encode("utf-8")) / 1024:>9.1f}  x{baseline / median:.2f}'
+        )
+    articles.orjson = orjson
+    sys.stdout.flush()
+
+if __name__ == '__main__':
+    main()
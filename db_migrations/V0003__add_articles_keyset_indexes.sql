@@ -0,0 +1,11 @@
+-- Keyset pagination for articles: every page is an index range scan on (created_at, id)
+UPDATE t_p90702635_pedagogical_forum_pr.articles SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL;
+
+ALTER TABLE t_p90702635_pedagogical_forum_pr.articles
+ALTER COLUMN created_at SET NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_articles_created_at_id
+ON t_p90702635_pedagogical_forum_pr.articles (created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_articles_category_created_at_id
+ON t_p90702635_pedagogical_forum_pr.articles (category, created_at DESC, id DESC);
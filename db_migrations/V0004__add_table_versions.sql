@@ -0,0 +1,33 @@
+-- Per-table change counters for ETag / If-None-Match on list endpoints
+CREATE TABLE IF NOT EXISTS t_p90702635_pedagogical_forum_pr.table_versions (
+    table_name VARCHAR(63) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO t_p90702635_pedagogical_forum_pr.table_versions (table_name) VALUES
+    ('articles'),
+    ('materials'),
+    ('messages')
+ON CONFLICT (table_name) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION t_p90702635_pedagogical_forum_pr.bump_table_version()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE t_p90702635_pedagogical_forum_pr.table_versions
+    SET version = version + 1
+    WHERE table_name = TG_TABLE_NAME;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER articles_bump_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON t_p90702635_pedagogical_forum_pr.articles
+FOR EACH STATEMENT EXECUTE FUNCTION t_p90702635_pedagogical_forum_pr.bump_table_version();
+
+CREATE TRIGGER materials_bump_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON t_p90702635_pedagogical_forum_pr.materials
+FOR EACH STATEMENT EXECUTE FUNCTION t_p90702635_pedagogical_forum_pr.bump_table_version();
+
+CREATE TRIGGER messages_bump_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON t_p90702635_pedagogical_forum_pr.messages
+FOR EACH STATEMENT EXECUTE FUNCTION t_p90702635_pedagogical_forum_pr.bump_table_version();
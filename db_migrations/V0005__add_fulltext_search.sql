@@ -0,0 +1,45 @@
+-- Russian full-text search over articles (title/excerpt/content) and materials (title/description)
+ALTER TABLE t_p90702635_pedagogical_forum_pr.articles
+ADD COLUMN IF NOT EXISTS search_vector tsvector;
+
+ALTER TABLE t_p90702635_pedagogical_forum_pr.materials
+ADD COLUMN IF NOT EXISTS search_vector tsvector;
+
+-- Content is HTML: tags are stripped and the text is capped to stay under the tsvector size limit
+CREATE OR REPLACE FUNCTION t_p90702635_pedagogical_forum_pr.articles_search_vector_update()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('russian', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('russian', coalesce(NEW.excerpt, '')), 'B') ||
+        setweight(to_tsvector('russian', left(regexp_replace(coalesce(NEW.content, ''), '<[^>]*>', ' ', 'g'), 200000)), 'C');
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION t_p90702635_pedagogical_forum_pr.materials_search_vector_update()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('russian', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('russian', coalesce(NEW.description, '')), 'B');
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER articles_search_vector
+BEFORE INSERT OR UPDATE OF title, excerpt, content ON t_p90702635_pedagogical_forum_pr.articles
+FOR EACH ROW EXECUTE FUNCTION t_p90702635_pedagogical_forum_pr.articles_search_vector_update();
+
+CREATE TRIGGER materials_search_vector
+BEFORE INSERT OR UPDATE OF title, description ON t_p90702635_pedagogical_forum_pr.materials
+FOR EACH ROW EXECUTE FUNCTION t_p90702635_pedagogical_forum_pr.materials_search_vector_update();
+
+UPDATE t_p90702635_pedagogical_forum_pr.articles SET title = title;
+UPDATE t_p90702635_pedagogical_forum_pr.materials SET title = title;
+
+CREATE INDEX IF NOT EXISTS idx_articles_search_vector
+ON t_p90702635_pedagogical_forum_pr.articles USING GIN (search_vector);
+
+CREATE INDEX IF NOT EXISTS idx_materials_search_vector
+ON t_p90702635_pedagogical_forum_pr.materials USING GIN (search_vector);
@@ -0,0 +1,9 @@
+-- Index of content-addressed objects in the bucket with reference counts
+CREATE TABLE IF NOT EXISTS t_p90702635_pedagogical_forum_pr.stored_objects (
+    key VARCHAR(255) PRIMARY KEY,
+    sha256 CHAR(64) NOT NULL,
+    size BIGINT NOT NULL,
+    content_type VARCHAR(255) NOT NULL,
+    refcount INT NOT NULL DEFAULT 1,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,11 @@
+-- Cached upload-file extraction results keyed by content hash and extractor version
+CREATE TABLE IF NOT EXISTS t_p90702635_pedagogical_forum_pr.extraction_cache (
+    sha256 CHAR(64) NOT NULL,
+    extractor_version VARCHAR(32) NOT NULL,
+    variant VARCHAR(255) NOT NULL DEFAULT '',
+    result JSONB NOT NULL,
+    extract_ms INT NOT NULL DEFAULT 0,
+    hits INT NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (sha256, extractor_version, variant)
+);
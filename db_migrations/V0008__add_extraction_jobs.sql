@@ -0,0 +1,21 @@
+-- Background extraction jobs for upload-file; workers claim rows with FOR UPDATE SKIP LOCKED
+CREATE TABLE IF NOT EXISTS t_p90702635_pedagogical_forum_pr.extraction_jobs (
+    id SERIAL PRIMARY KEY,
+    status VARCHAR(16) NOT NULL DEFAULT 'pending',
+    object_key VARCHAR(512) NOT NULL,
+    file_name VARCHAR(255) NOT NULL,
+    pages VARCHAR(255),
+    max_pages INT,
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 3,
+    result JSONB,
+    error TEXT,
+    locked_until TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Only claimable rows are indexed, so the queue scan stays small as finished jobs pile up
+CREATE INDEX IF NOT EXISTS idx_extraction_jobs_claimable
+    ON t_p90702635_pedagogical_forum_pr.extraction_jobs (id)
+    WHERE status IN ('pending', 'running');
@@ -0,0 +1,7 @@
+-- Append-only download hits; materials.downloads is updated from them in periodic rollups,
+-- so concurrent downloads of one material never queue on its row lock
+CREATE TABLE IF NOT EXISTS t_p90702635_pedagogical_forum_pr.material_downloads (
+    id BIGSERIAL PRIMARY KEY,
+    material_id INT NOT NULL REFERENCES t_p90702635_pedagogical_forum_pr.materials(id) ON DELETE CASCADE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,5 @@
+-- Bucket keys whose last reference was deleted; drained in batches by the storage sweeper
+CREATE TABLE IF NOT EXISTS t_p90702635_pedagogical_forum_pr.object_deletions (
+    key VARCHAR(255) PRIMARY KEY,
+    queued_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
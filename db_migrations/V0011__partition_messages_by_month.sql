@@ -0,0 +1,75 @@
+-- Chat messages move to monthly range partitions: the handler reads only recent months,
+-- and backend/messages/maintenance.py pre-creates future months and archives old ones
+ALTER TABLE t_p90702635_pedagogical_forum_pr.messages RENAME TO messages_unpartitioned;
+ALTER TABLE t_p90702635_pedagogical_forum_pr.messages_unpartitioned RENAME CONSTRAINT messages_pkey TO messages_unpartitioned_pkey;
+DROP TRIGGER messages_bump_version ON t_p90702635_pedagogical_forum_pr.messages_unpartitioned;
+
+-- The partition key has to be part of the primary key; ids still come from the old sequence
+CREATE TABLE t_p90702635_pedagogical_forum_pr.messages (
+    id INT NOT NULL DEFAULT nextval('t_p90702635_pedagogical_forum_pr.messages_id_seq'),
+    author VARCHAR(255) NOT NULL,
+    text TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+ALTER SEQUENCE t_p90702635_pedagogical_forum_pr.messages_id_seq OWNED BY t_p90702635_pedagogical_forum_pr.messages.id;
+
+-- Catches rows outside every monthly partition (imports with old dates, clock skew)
+CREATE TABLE t_p90702635_pedagogical_forum_pr.messages_default
+    PARTITION OF t_p90702635_pedagogical_forum_pr.messages DEFAULT;
+
+-- Creates messages_pYYYYMM for the month if it is missing. Rows of that month already sitting
+-- in the default partition are moved into the new table before it is attached, otherwise
+-- ATTACH would fail on them. Returns false if the partition already existed.
+CREATE OR REPLACE FUNCTION t_p90702635_pedagogical_forum_pr.ensure_messages_partition(month_start DATE)
+RETURNS BOOLEAN AS $$
+DECLARE
+    range_start DATE := date_trunc('month', month_start)::date;
+    range_end DATE := (date_trunc('month', month_start) + INTERVAL '1 month')::date;
+    partition_name TEXT := 'messages_p' || to_char(month_start, 'YYYYMM');
+BEGIN
+    IF to_regclass(format('t_p90702635_pedagogical_forum_pr.%I', partition_name)) IS NOT NULL THEN
+        RETURN FALSE;
+    END IF;
+    EXECUTE format(
+        'CREATE TABLE t_p90702635_pedagogical_forum_pr.%I (LIKE t_p90702635_pedagogical_forum_pr.messages INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+        partition_name
+    );
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM t_p90702635_pedagogical_forum_pr.messages_default WHERE created_at >= %L AND created_at < %L RETURNING *) '
+        'INSERT INTO t_p90702635_pedagogical_forum_pr.%I SELECT * FROM moved',
+        range_start, range_end, partition_name
+    );
+    EXECUTE format(
+        'ALTER TABLE t_p90702635_pedagogical_forum_pr.messages ATTACH PARTITION t_p90702635_pedagogical_forum_pr.%I FOR VALUES FROM (%L) TO (%L)',
+        partition_name, range_start, range_end
+    );
+    RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Every month that has messages, up to two months ahead
+DO $$
+BEGIN
+    PERFORM t_p90702635_pedagogical_forum_pr.ensure_messages_partition(month::date)
+    FROM generate_series(
+        date_trunc('month', LEAST(
+            (SELECT MIN(created_at) FROM t_p90702635_pedagogical_forum_pr.messages_unpartitioned),
+            LOCALTIMESTAMP
+        )),
+        date_trunc('month', LOCALTIMESTAMP) + INTERVAL '2 months',
+        INTERVAL '1 month'
+    ) AS month;
+END;
+$$;
+
+INSERT INTO t_p90702635_pedagogical_forum_pr.messages (id, author, text, created_at)
+SELECT id, author, text, COALESCE(created_at, CURRENT_TIMESTAMP)
+FROM t_p90702635_pedagogical_forum_pr.messages_unpartitioned;
+
+DROP TABLE t_p90702635_pedagogical_forum_pr.messages_unpartitioned;
+
+CREATE TRIGGER messages_bump_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON t_p90702635_pedagogical_forum_pr.messages
+FOR EACH STATEMENT EXECUTE FUNCTION t_p90702635_pedagogical_forum_pr.bump_table_version();
@@ -13,12 +13,26 @@ const API_MATERIALS = 'https://functions.poehali.dev/bd58dfc4-9022-40ad-94a2-4a3
 const API_ARTICLES = 'https://functions.poehali.dev/f3b57684-2e77-461c-b758-e052ad2bee51';
 const API_UPLOAD = 'https://functions.poehali.dev/933abfe9-deb8-495b-85ca-536ad38d4199';
 const API_UPLOAD_S3 = 'https://functions.poehali.dev/92d247cf-0040-4dac-b2de-ac96de389848';
+const MESSAGES_STREAM_URL = import.meta.env.VITE_MESSAGES_STREAM_URL;
+
+// Токен последней записи (X-Write-LSN): с ним GET, который бэкенд читает с реплики,
+// дождётся, пока реплика увидит эту запись
+let lastWriteLsn: string | null = null;
+
+const rememberWriteLsn = (response: Response) => {
+  const lsn = response.headers.get('X-Write-LSN');
+  if (lsn) lastWriteLsn = lsn;
+};
+
+const readHeaders = (): HeadersInit => (lastWriteLsn ? { 'X-Min-LSN': lastWriteLsn } : {});
 
 const Index = () => {
   const [activeSection, setActiveSection] = useState('home');
   const [messages, setMessages] = useState([]);
   const [newMessage, setNewMessage] = useState('');
   const [articles, setArticles] = useState([]);
+  const [articlesCursor, setArticlesCursor] = useState<string | null>(null);
+  const [loadingMoreArticles, setLoadingMoreArticles] = useState(false);
   const [materials, setMaterials] = useState([]);
   const [loading, setLoading] = useState(false);
   const [mobileMenuOpen, setMobileMenuOpen] = useState(false);
@@ -26,39 +40,82 @@ const Index = () => {
   const [selectedFile, setSelectedFile] = useState<File | null>(null);
   const [extractedText, setExtractedText] = useState('');
   const [extractedHtml, setExtractedHtml] = useState('');
-  const [extractedImages, setExtractedImages] = useState<string[]>([]);
   const [selectedArticle, setSelectedArticle] = useState<any>(null);
   const [uploadedFileUrl, setUploadedFileUrl] = useState('');
 
   useEffect(() => {
-    loadMessages();
+    let stream: EventSource | null = null;
+    let closed = false;
+    loadMessages().then((lastId) => {
+      if (!MESSAGES_STREAM_URL || closed) return;
+      // Новые сообщения приходят из backend/messages/gateway.py; при переподключении
+      // браузер сам шлёт Last-Event-ID, и шлюз досылает пропущенное
+      const query = lastId === null ? '' : `?last_event_id=${lastId}`;
+      stream = new EventSource(`${MESSAGES_STREAM_URL}/events${query}`);
+      stream.onmessage = (event) => appendMessages([JSON.parse(event.data)]);
+    });
     loadArticles();
     loadMaterials();
+    return () => {
+      closed = true;
+      stream?.close();
+    };
   }, []);
 
-  const loadMessages = async () => {
+  const appendMessages = (incoming: any[]) => {
+    setMessages((current: any[]) => {
+      const known = new Set(current.map((message) => message.id));
+      const fresh = incoming.filter((message) => !known.has(message.id));
+      return fresh.length ? [...current, ...fresh] : current;
+    });
+  };
+
+  const loadMessages = async (): Promise<number | null> => {
     try {
-      const response = await fetch(API_MESSAGES);
+      const response = await fetch(API_MESSAGES, { headers: readHeaders() });
       const data = await response.json();
-      setMessages(data.messages || []);
+      const loaded = data.messages || [];
+      setMessages(loaded);
+      return loaded.length ? loaded[loaded.length - 1].id : 0;
     } catch (error) {
       console.error('Ошибка загрузки сообщений:', error);
+      return null;
     }
   };
 
   const loadArticles = async () => {
     try {
-      const response = await fetch(API_ARTICLES);
+      const response = await fetch(API_ARTICLES, { headers: readHeaders() });
       const data = await response.json();
       setArticles(data.articles || []);
+      setArticlesCursor(data.next_cursor || null);
     } catch (error) {
       console.error('Ошибка загрузки статей:', error);
     }
   };
 
+  // Список статей отдаётся страницами; следующая запрашивается по next_cursor прошлой
+  const loadMoreArticles = async () => {
+    if (!articlesCursor) return;
+    setLoadingMoreArticles(true);
+    try {
+      const response = await fetch(`${API_ARTICLES}?cursor=${encodeURIComponent(articlesCursor)}`, { headers: readHeaders() });
+      const data = await response.json();
+      setArticles((current: any[]) => {
+        const known = new Set(current.map((article) => article.id));
+        return [...current, ...(data.articles || []).filter((article: any) => !known.has(article.id))];
+      });
+      setArticlesCursor(data.next_cursor || null);
+    } catch (error) {
+      console.error('Ошибка загрузки статей:', error);
+    } finally {
+      setLoadingMoreArticles(false);
+    }
+  };
+
   const loadMaterials = async () => {
     try {
-      const response = await fetch(API_MATERIALS);
+      const response = await fetch(API_MATERIALS, { headers: readHeaders() });
       const data = await response.json();
       setMaterials(data.materials || []);
     } catch (error) {
@@ -80,9 +137,10 @@ const Index = () => {
             text: newMessage
           })
         });
+        rememberWriteLsn(response);
         const data = await response.json();
         if (data.message) {
-          setMessages([...messages, data.message]);
+          appendMessages([data.message]);
           setNewMessage('');
         }
       } catch (error) {
@@ -117,6 +175,7 @@ const Index = () => {
           category
         })
       });
+      rememberWriteLsn(response);
       const data = await response.json();
       if (data.material) {
         setMaterials([data.material, ...materials]);
@@ -137,6 +196,7 @@ const Index = () => {
       const response = await fetch(`${API_ARTICLES}?id=${articleId}`, {
         method: 'DELETE'
       });
+      rememberWriteLsn(response);
       const data = await response.json();
       if (data.success) {
         setArticles(articles.filter(a => a.id !== articleId));
@@ -159,6 +219,7 @@ const Index = () => {
       const response = await fetch(`${API_MATERIALS}?id=${materialId}`, {
         method: 'DELETE'
       });
+      rememberWriteLsn(response);
       const data = await response.json();
       if (data.success) {
         setMaterials(materials.filter(m => m.id !== materialId));
@@ -170,6 +231,75 @@ const Index = () => {
     }
   };
 
+  const handleDownloadMaterial = async (materialId: number) => {
+    try {
+      const response = await fetch(API_MATERIALS, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({ action: 'download', id: materialId })
+      });
+      const data = await response.json();
+      if (data.success) {
+        // Сервер сворачивает счётчик периодически, поэтому увеличиваем его сразу на клиенте
+        setMaterials(materials.map(m => m.id === materialId ? { ...m, downloads: (m.downloads || 0) + 1 } : m));
+        if (data.file_url) {
+          window.open(data.file_url, '_blank');
+        }
+      }
+    } catch (error) {
+      console.error('Ошибка скачивания материала:', error);
+    }
+  };
+
+  const sha256Hex = async (buffer: ArrayBuffer) => {
+    const digest = await crypto.subtle.digest('SHA-256', buffer);
+    return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+  };
+
+  const postUploadS3 = async (body: object) => {
+    const response = await fetch(API_UPLOAD_S3, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify(body)
+    });
+    if (!response.ok) throw new Error(`upload-to-s3: ${response.status}`);
+    return response.json();
+  };
+
+  const uploadDirect = async (file: File) => {
+    const sha256 = await sha256Hex(await file.arrayBuffer());
+    const presign = await postUploadS3({ action: 'presign', fileName: file.name, size: file.size });
+
+    if (presign.uploadId) {
+      const parts: { partNumber: number; etag: string | null }[] = [];
+      for (const part of presign.parts) {
+        const start = (part.partNumber - 1) * presign.partSize;
+        const response = await fetch(part.url, { method: 'PUT', body: file.slice(start, start + presign.partSize) });
+        if (!response.ok) throw new Error(`upload part ${part.partNumber}: ${response.status}`);
+        parts.push({ partNumber: part.partNumber, etag: response.headers.get('ETag') });
+      }
+      return postUploadS3({ action: 'complete', fileName: file.name, key: presign.key, sha256, uploadId: presign.uploadId, parts });
+    }
+
+    const response = await fetch(presign.uploadUrl, { method: 'PUT', headers: presign.headers, body: file });
+    if (!response.ok) throw new Error(`upload: ${response.status}`);
+    return postUploadS3({ action: 'complete', fileName: file.name, key: presign.key, sha256 });
+  };
+
+  const applyExtraction = (textData: any) => {
+    if (textData.html) {
+      setExtractedHtml(textData.html);
+      setExtractedText(textData.html.replace(/<[^>]*>/g, ''));
+    }
+    if (textData.url) {
+      setUploadedFileUrl(textData.url);
+    }
+  };
+
   const handleFileUpload = async (e: React.ChangeEvent<HTMLInputElement>) => {
     const file = e.target.files?.[0];
     if (!file) return;
@@ -185,6 +315,27 @@ const Index = () => {
     setSelectedFile(file);
     setLoading(true);
 
+    try {
+      // Файл уходит прямо в хранилище, функция разбора читает его оттуда по ключу
+      const stored = await uploadDirect(file);
+      const textResponse = await fetch(API_UPLOAD, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({
+          key: stored.key,
+          fileName: file.name,
+          fileType: fileExt.slice(1)
+        })
+      });
+      applyExtraction({ ...(await textResponse.json()), url: stored.url });
+      setLoading(false);
+      return;
+    } catch (error) {
+      console.error('Прямая загрузка недоступна, отправляем файл через функцию:', error);
+    }
+
     try {
       const reader = new FileReader();
       reader.onload = async (event) => {
@@ -199,35 +350,12 @@ const Index = () => {
           body: JSON.stringify({
             file: base64Content,
             fileName: file.name,
-            fileType: fileExt.slice(1)
+            fileType: fileExt.slice(1),
+            store: true
           })
         });
 
-        const textData = await textResponse.json();
-        if (textData.html) {
-          setExtractedHtml(textData.html);
-          setExtractedText(textData.html.replace(/<[^>]*>/g, ''));
-        }
-        if (textData.images && textData.images.length > 0) {
-          setExtractedImages(textData.images.map((img: any) => img.data));
-        }
-
-        const s3Response = await fetch(API_UPLOAD_S3, {
-          method: 'POST',
-          headers: {
-            'Content-Type': 'application/json',
-          },
-          body: JSON.stringify({
-            file: base64Content,
-            fileName: file.name
-          })
-        });
-
-        const s3Data = await s3Response.json();
-        if (s3Data.url) {
-          setUploadedFileUrl(s3Data.url);
-        }
-        
+        applyExtraction(await textResponse.json());
         setLoading(false);
       };
       reader.readAsDataURL(file);
@@ -272,6 +400,7 @@ const Index = () => {
           file_type: selectedFile?.name.split('.').pop()
         })
       });
+      rememberWriteLsn(response);
       const data = await response.json();
       if (data.article) {
         setArticles([data.article, ...articles]);
@@ -280,7 +409,6 @@ const Index = () => {
         setSelectedFile(null);
         setExtractedText('');
         setExtractedHtml('');
-        setExtractedImages([]);
         setUploadedFileUrl('');
       }
     } catch (error) {
@@ -292,7 +420,7 @@ const Index = () => {
 
   const loadArticleDetails = async (articleId: number) => {
     try {
-      const response = await fetch(`${API_ARTICLES}?id=${articleId}`);
+      const response = await fetch(`${API_ARTICLES}?id=${articleId}`, { headers: readHeaders() });
       const data = await response.json();
       if (data.article) {
         setSelectedArticle(data.article);
@@ -646,26 +774,6 @@ const Index = () => {
                               <Icon name="FileCheck" size={16} />
                               <span>Загружен: {selectedFile.name}</span>
                             </div>
-                            {extractedImages.length > 0 && (
-                              <div className="mt-4">
-                                <p className="text-sm font-medium mb-2">Найдено изображений: {extractedImages.length}</p>
-                                <div className="grid grid-cols-2 gap-2">
-                                  {extractedImages.slice(0, 4).map((img, idx) => (
-                                    <img 
-                                      key={idx} 
-                                      src={img} 
-                                      alt={`Изображение ${idx + 1}`}
-                                      className="w-full h-32 object-cover rounded border"
-                                    />
-                                  ))}
-                                </div>
-                                {extractedImages.length > 4 && (
-                                  <p className="text-xs text-muted-foreground mt-2">
-                                    И ещё {extractedImages.length - 4} изображений...
-                                  </p>
-                                )}
-                              </div>
-                            )}
                           </div>
                         )}
                       </div>
@@ -726,7 +834,7 @@ const Index = () => {
 
               <TabsContent value="all" className="space-y-6">
                 {articles.map((article, idx) => (
-                  <Card key={article.id} className="border-2 hover:shadow-xl transition-all duration-300 hover:-translate-y-1 animate-fade-in" style={{ animationDelay: `${idx * 0.1}s` }}>
+                  <Card key={article.id} className="border-2 hover:shadow-xl transition-all duration-300 hover:-translate-y-1 animate-fade-in" style={{ animationDelay: `${Math.min(idx, 10) * 0.1}s` }}>
                     <CardHeader>
                       <div className="flex items-start justify-between mb-2">
                         <Badge className="bg-secondary text-white">{article.category}</Badge>
@@ -767,6 +875,13 @@ const Index = () => {
                     </CardHeader>
                   </Card>
                 ))}
+                {articlesCursor && (
+                  <div className="flex justify-center">
+                    <Button variant="outline" onClick={loadMoreArticles} disabled={loadingMoreArticles}>
+                      {loadingMoreArticles ? 'Загрузка...' : 'Показать ещё'}
+                    </Button>
+                  </div>
+                )}
               </TabsContent>
             </Tabs>
           </div>
@@ -809,7 +924,11 @@ const Index = () => {
                             </div>
                           </div>
                           <div className="flex flex-col gap-2">
-                            <Button size="sm" className="bg-gradient-to-r from-primary to-secondary flex-shrink-0">
+                            <Button 
+                              size="sm" 
+                              className="bg-gradient-to-r from-primary to-secondary flex-shrink-0"
+                              onClick={() => handleDownloadMaterial(material.id)}
+                            >
                               <Icon name="Download" size={16} />
                             </Button>
                             <Button 